@@ -0,0 +1,125 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from utils.logger import get_logger
+
+DEFAULT_BATCH_SETTINGS = {
+    'enabled': False,
+    'max_batch_size': 4,
+    'max_wait': 0.5,
+    'max_in_flight': 2
+}
+
+class AnalysisBatcher:
+    """Collects frames from several analysis threads into batched requests
+
+    submit() blocks its caller until the frame's result is back. A collector
+    thread groups frames arriving within max_wait seconds of the first one,
+    up to max_batch_size, and hands each group to call_batch(prepared_list),
+    which returns one analysis per frame in order. At most max_in_flight
+    batches are outstanding at once.
+    """
+
+    def __init__(self, call_batch, settings=None):
+        self.call_batch = call_batch
+        self.logger = get_logger(__name__)
+        self.settings = dict(DEFAULT_BATCH_SETTINGS)
+        self.settings.update(settings or {})
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._executor = None
+        self.batches = 0
+        self.frames = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(1, int(self.settings['max_in_flight'])),
+                thread_name_prefix="analysis-batch"
+            )
+            self._thread = threading.Thread(
+                target=self._collect, args=(self._executor,), name="analysis-batcher", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, prepared, timeout=None):
+        """Queue an encoded frame and wait up to timeout seconds for its analysis"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((prepared, future))
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # The batch still finishes in the background; its result for this frame is dropped
+            self.logger.error(f"Batched analysis timed out after {timeout:.0f}s")
+            return {"error": "Batched analysis timed out"}
+
+    def _collect(self, executor):
+        max_size = max(1, int(self.settings['max_batch_size']))
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            deadline = time.monotonic() + float(self.settings['max_wait'])
+            stopping = False
+            while len(batch) < max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            executor.submit(self._dispatch, batch)
+            if stopping:
+                return
+
+    def _dispatch(self, batch):
+        with self._lock:
+            self.batches += 1
+            self.frames += len(batch)
+
+        try:
+            results = self.call_batch([prepared for prepared, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Expected {len(batch)} results, got {len(results)}")
+        except Exception as e:
+            self.logger.error(f"Batched analysis failed: {str(e)}")
+            results = [{"error": str(e)}] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(dict(result))
+
+    def stop(self):
+        """Flush queued frames and stop the collector"""
+        with self._lock:
+            thread, executor = self._thread, self._executor
+            self._thread = None
+            self._executor = None
+        if thread:
+            self._queue.put(None)
+            thread.join(timeout=5.0)
+        if executor:
+            executor.shutdown(wait=False)
+
+    def get_stats(self):
+        """Get batch and frame counters and the average batch size"""
+        with self._lock:
+            batches, frames = self.batches, self.frames
+        return {
+            'batches': batches,
+            'frames': frames,
+            'avg_batch_size': frames / batches if batches else 0.0,
+            'queued': self._queue.qsize()
+        }
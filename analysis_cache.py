@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from utils.logger import get_logger
+
+DEFAULT_CACHE_SETTINGS = {
+    'enabled': True,
+    'cache_dir': os.path.join("data", "cache", "analysis"),
+    'max_memory_entries': 512,
+    'max_bytes': 50 * 1024 * 1024,
+    'ttl_seconds': 24 * 60 * 60
+}
+
+def image_digest(image):
+    """Compute a content digest of a PIL image from its raw pixels"""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode('utf-8'))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+class AnalysisCache:
+    """Content-addressed cache of analysis results, in memory and on disk
+
+    Entries expire after ttl_seconds. The in-memory tier holds at most
+    max_memory_entries results and the on-disk tier at most max_bytes, both
+    evicting the least recently used entries first.
+    """
+
+    def __init__(self, settings=None):
+        self.logger = get_logger(__name__)
+        self.settings = dict(DEFAULT_CACHE_SETTINGS)
+        self.settings.update(settings or {})
+        self.cache_dir = self.settings['cache_dir']
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._load_disk_index()
+
+    @staticmethod
+    def make_key(digest, provider, model, prompt_version, variant=''):
+        """Build a cache key from an image digest and the analysis parameters"""
+        raw = f"{digest}|{provider}|{model}|{prompt_version}|{variant}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_disk_index(self):
+        """Index existing cache files, oldest access first"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            files = []
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name[:-5], stat.st_size))
+
+            for _, key, size in sorted(files):
+                self._disk[key] = size
+                self._disk_bytes += size
+        except Exception as e:
+            self.logger.error(f"Failed to load analysis cache index: {str(e)}")
+
+    def _is_expired(self, stored_at):
+        return time.time() - stored_at > self.settings['ttl_seconds']
+
+    def get(self, key):
+        """Get a cached result, or None if missing or expired"""
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                stored_at, result = item
+                if not self._is_expired(stored_at):
+                    self._memory.move_to_end(key)
+                    if key in self._disk:
+                        self._disk.move_to_end(key)
+                    self.hits += 1
+                    return dict(result)
+                self._remove(key)
+
+            if key in self._disk:
+                try:
+                    path = self._entry_path(key)
+                    with open(path, 'r') as f:
+                        data = json.load(f)
+                    if not self._is_expired(data['stored_at']):
+                        os.utime(path)
+                        self._disk.move_to_end(key)
+                        self._remember(key, data['stored_at'], data['result'])
+                        self.hits += 1
+                        return dict(data['result'])
+                except Exception as e:
+                    self.logger.warning(f"Failed to read cached analysis: {str(e)}")
+                self._remove(key)
+
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        """Store a result in both cache tiers"""
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, dict(result))
+            try:
+                data = json.dumps({'stored_at': stored_at, 'result': result})
+                with open(self._entry_path(key), 'w') as f:
+                    f.write(data)
+
+                self._disk_bytes -= self._disk.pop(key, 0)
+                self._disk[key] = len(data)
+                self._disk_bytes += len(data)
+
+                while self._disk_bytes > self.settings['max_bytes'] and len(self._disk) > 1:
+                    oldest = next(iter(self._disk))
+                    self._remove(oldest)
+            except Exception as e:
+                self.logger.error(f"Failed to write cached analysis: {str(e)}")
+
+    def _remember(self, key, stored_at, result):
+        self._memory[key] = (stored_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.settings['max_memory_entries']:
+            self._memory.popitem(last=False)
+
+    def _remove(self, key):
+        """Drop an entry from both tiers (caller holds the lock)"""
+        self._memory.pop(key, None)
+        if key in self._disk:
+            self._disk_bytes -= self._disk.pop(key)
+            try:
+                os.remove(self._entry_path(key))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                self.logger.warning(f"Failed to remove cached analysis: {str(e)}")
+
+    def clear(self):
+        """Remove every cached result"""
+        with self._lock:
+            for key in list(self._disk.keys()):
+                self._remove(key)
+            self._memory.clear()
+
+    def get_stats(self):
+        """Get cache hit/miss counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes
+            }
@@ -0,0 +1,269 @@
+import asyncio
+import threading
+import httpx
+import openai
+from utils.logger import get_logger
+from content_analyzer import RELOAD_KEYS
+from rate_limiter import estimate_tokens
+
+DEFAULT_ASYNC_SETTINGS = {
+    'enabled': False,
+    'request_timeout': 60,
+    'concurrency': {
+        'openai': 8,
+        'gemini': 4
+    }
+}
+
+class AsyncAnalysisEngine:
+    """asyncio analysis engine multiplexing vision requests on one event loop
+
+    The loop runs in a background thread. Requests go through AsyncOpenAI or
+    Gemini's generate_content_async, limited by a semaphore per provider and
+    bounded by request_timeout. Prompt building, response parsing and
+    re-asking, caching and threshold checks are shared with the wrapped
+    ContentAnalyzer. Frames are always sent one per request; batch_settings
+    only applies to the thread pool pipeline.
+    """
+
+    def __init__(self, content_analyzer, settings=None):
+        self.content_analyzer = content_analyzer
+        self.logger = get_logger(__name__)
+        self.settings = dict(DEFAULT_ASYNC_SETTINGS)
+        self.settings.update(settings or {})
+        self.settings['concurrency'] = dict(
+            DEFAULT_ASYNC_SETTINGS['concurrency'],
+            **self.settings.get('concurrency', {})
+        )
+
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._openai_client = None
+        content_analyzer.config.add_listener(self._on_config_changed)
+        if content_analyzer.batcher:
+            self.logger.warning("Request batching is not used with async analysis; frames are sent one per request")
+
+    def _on_config_changed(self, changed):
+        if changed & RELOAD_KEYS:
+            self.reset_clients()
+
+    @property
+    def running(self):
+        return self._loop is not None and self._loop.is_running()
+
+    def start(self):
+        """Start the event loop thread"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(self._loop)
+                self._loop.call_soon(ready.set)
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=run_loop, name="analysis-loop", daemon=True)
+            self._thread.start()
+            ready.wait(timeout=5.0)
+
+    def stop(self):
+        """Cancel pending requests and stop the event loop"""
+        with self._lock:
+            if not self._loop:
+                return
+            loop = self._loop
+
+            async def shutdown():
+                tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                if self._openai_client:
+                    await self._openai_client.close()
+                    self._openai_client = None
+
+            try:
+                asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=5.0)
+            except Exception as e:
+                self.logger.warning(f"Analysis loop shutdown incomplete: {str(e)}")
+
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join(timeout=5.0)
+            loop.close()
+            self._loop = None
+            self._thread = None
+            self._semaphores = {}
+
+    def submit(self, coro):
+        """Schedule a coroutine on the engine loop, returning a concurrent Future"""
+        if not self.running:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def reset_clients(self):
+        """Drop the async clients so they are rebuilt with the current keys"""
+        if not self.running:
+            self._openai_client = None
+            return
+
+        async def reset():
+            if self._openai_client:
+                await self._openai_client.close()
+            self._openai_client = None
+
+        asyncio.run_coroutine_threadsafe(reset(), self._loop)
+
+    def _semaphore(self, provider):
+        """Get the per-provider concurrency limit (created on the loop)"""
+        if provider not in self._semaphores:
+            limit = int(self.settings['concurrency'].get(provider, 4))
+            self._semaphores[provider] = asyncio.Semaphore(max(1, limit))
+        return self._semaphores[provider]
+
+    def _get_openai_client(self):
+        if self._openai_client is None:
+            api_key = self.content_analyzer.config.get_api_key('openai')
+            if not api_key:
+                raise ValueError("OpenAI client not initialized")
+
+            # One keep-alive pool for every request multiplexed on the loop
+            pool_size = max(self.content_analyzer.pool_size, int(self.settings['concurrency'].get('openai', 8)))
+            self._openai_client = openai.AsyncOpenAI(
+                api_key=api_key,
+                base_url=self.content_analyzer.api_endpoints.get('openai'),
+                timeout=self.settings['request_timeout'],
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                    timeout=self.settings['request_timeout']
+                )
+            )
+        return self._openai_client
+
+    async def analyze_image_async(self, image, device_id=None, change_score=None, options=None):
+        """Analyze image for inappropriate content without blocking a thread"""
+        analysis = await self.score_image_async(image, device_id, change_score, options)
+
+        # Check against configured thresholds
+        return self.content_analyzer.check_thresholds(analysis)
+
+    async def score_image_async(self, image, device_id=None, change_score=None, options=None):
+        """Get the raw category scores of an image, or a dict with an 'error'"""
+        analyzer = self.content_analyzer
+        loop = asyncio.get_running_loop()
+        try:
+            # Validate API configuration
+            if not analyzer.validate_api_config():
+                return {"error": "API not configured"}
+
+            settings = analyzer.preprocessor.resolve(options, change_score)
+            cache_key, analysis = await loop.run_in_executor(None, analyzer.lookup_cache, image, settings)
+
+            if analysis is None:
+                prepared = await loop.run_in_executor(None, analyzer.encode_image, image, settings, device_id)
+
+                if analyzer.router.enabled:
+                    analysis = await analyzer.router.call_async(prepared, {
+                        'openai': lambda prepared: self._provider_call('openai', prepared),
+                        'gemini': lambda prepared: self._provider_call('gemini', prepared)
+                    })
+                else:
+                    analysis = await self._provider_call(analyzer.provider, prepared)
+
+                await loop.run_in_executor(None, analyzer.store_cache, cache_key, analysis)
+
+            return analysis
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Content analysis failed: {str(e)}")
+            return {"error": str(e)}
+
+    async def _provider_call(self, provider, prepared):
+        """Call one provider within the shared rate limit"""
+        limiter = self.content_analyzer.rate_limiter
+        if not limiter.enabled:
+            return await self._limited_call(provider, prepared)
+        return await limiter.run_async(
+            provider,
+            estimate_tokens(provider, prepared),
+            [prepared.get('device_id')],
+            lambda prepared: self._limited_call(provider, prepared),
+            prepared
+        )
+
+    async def _limited_call(self, provider, prepared):
+        """Call one provider within its concurrency limit and the request timeout"""
+        try:
+            async with self._semaphore(provider):
+                if provider == 'openai':
+                    call = self._call_openai_api(prepared)
+                else:
+                    call = self._call_gemini_api(prepared)
+                return await asyncio.wait_for(call, timeout=self.settings['request_timeout'])
+        except asyncio.TimeoutError:
+            self.logger.error(f"{provider} request timed out after {self.settings['request_timeout']}s")
+            return {"error": "Request timed out"}
+
+    async def _call_openai_api(self, prepared):
+        """Call OpenAI Vision API asynchronously"""
+        try:
+            client = self._get_openai_client()
+            response = await client.chat.completions.create(
+                **self.content_analyzer.build_request('openai', prepared)
+            )
+
+            content = response.choices[0].message.content
+            self.logger.debug(f"OpenAI response: {content}")
+            return await self._parse_or_reask('openai', content)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(f"OpenAI API call failed: {str(e)}")
+            return self.content_analyzer.api_error(e)
+
+    async def _call_gemini_api(self, prepared):
+        """Call Google Gemini Vision API asynchronously"""
+        try:
+            model = self.content_analyzer.gemini_model
+            if not model:
+                raise ValueError("Gemini client not initialized")
+
+            response = await model.generate_content_async(
+                **self.content_analyzer.build_request('gemini', prepared)
+            )
+
+            return await self._parse_or_reask('gemini', response.text)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Gemini API call failed: {str(e)}")
+            return self.content_analyzer.api_error(e)
+
+    async def _parse_or_reask(self, provider, content):
+        """Parse a response, asking the model once to reformat it if it was malformed"""
+        analyzer = self.content_analyzer
+        scores, reask = analyzer.parse_response(provider, content)
+        if reask is None:
+            return scores
+
+        try:
+            if provider == 'openai':
+                response = await self._get_openai_client().chat.completions.create(**reask)
+                content = response.choices[0].message.content
+            else:
+                response = await analyzer.gemini_model.generate_content_async(**reask)
+                content = response.text
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(f"{provider} re-ask failed: {str(e)}")
+            content = None
+
+        return analyzer.finish_reask(provider, content, scores)
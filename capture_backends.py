@@ -0,0 +1,290 @@
+import threading
+import time
+import platform
+from PIL import Image, ImageGrab
+from utils.logger import get_logger
+
+class CaptureBackend:
+    """Base class for screenshot backends
+
+    Backends that hold a connection keep one per thread (each device is
+    captured from its own thread) and reopen it when a grab fails.
+    """
+
+    name = None
+    persistent = True
+
+    def __init__(self):
+        self.logger = get_logger(__name__)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def _open(self):
+        """Open a connection for the current thread"""
+        return None
+
+    def _close_connection(self, connection):
+        pass
+
+    def _grab(self, connection):
+        raise NotImplementedError
+
+    def _get_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._open()
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _drop_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            with self._connections_lock:
+                if connection in self._connections:
+                    self._connections.remove(connection)
+            try:
+                self._close_connection(connection)
+            except Exception as e:
+                self.logger.debug(f"Error closing {self.name} connection: {str(e)}")
+
+    def capture(self):
+        """Grab the screen, reconnecting once if the connection went bad"""
+        if not self.persistent:
+            return self._grab(None)
+        try:
+            return self._grab(self._get_connection())
+        except Exception as e:
+            self.logger.debug(f"{self.name} capture failed, reconnecting: {str(e)}")
+            self._drop_connection()
+            return self._grab(self._get_connection())
+
+    def close(self):
+        """Close the current thread's connection"""
+        self._drop_connection()
+
+    def close_all(self):
+        """Close every connection opened by this backend"""
+        with self._connections_lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for connection in connections:
+            try:
+                self._close_connection(connection)
+            except Exception as e:
+                self.logger.debug(f"Error closing {self.name} connection: {str(e)}")
+        self._local = threading.local()
+
+class PILCaptureBackend(CaptureBackend):
+    """PIL ImageGrab (cross-platform, no persistent connection)"""
+
+    name = 'pil'
+    persistent = False
+
+    def _grab(self, connection):
+        return ImageGrab.grab()
+
+class X11CaptureBackend(CaptureBackend):
+    """python-xlib capture over a persistent display connection per thread"""
+
+    name = 'x11'
+
+    @classmethod
+    def is_available(cls):
+        if platform.system().lower() != 'linux':
+            return False
+        try:
+            from Xlib import display, X
+            return True
+        except ImportError:
+            return False
+
+    def _open(self):
+        from Xlib import display
+        return display.Display()
+
+    def _close_connection(self, connection):
+        connection.close()
+
+    def _grab(self, connection):
+        from Xlib import X
+        root = connection.screen().root
+        geometry = root.get_geometry()
+
+        screenshot = root.get_image(0, 0, geometry.width, geometry.height,
+                                  X.ZPixmap, 0xffffffff)
+
+        return Image.frombytes("RGB", (geometry.width, geometry.height),
+                              screenshot.data, "raw", "BGRX")
+
+class MSSCaptureBackend(CaptureBackend):
+    """mss capture with one native grabber per thread
+
+    mss calls the platform capture APIs through ctypes instead of decoding
+    the image through python-xlib's pure Python protocol implementation.
+    """
+
+    name = 'mss'
+
+    @classmethod
+    def is_available(cls):
+        try:
+            import mss
+            return True
+        except ImportError:
+            return False
+
+    def _open(self):
+        import mss
+        return mss.mss()
+
+    def _close_connection(self, connection):
+        connection.close()
+
+    def _grab(self, connection):
+        # Monitor 0 is the bounding box of all monitors
+        shot = connection.grab(connection.monitors[0])
+        return Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
+
+def get_available_backends():
+    """Instantiate the capture backends usable on this platform, fastest first"""
+    backends = []
+    for backend_class in (MSSCaptureBackend, PILCaptureBackend, X11CaptureBackend):
+        if backend_class.is_available():
+            backends.append(backend_class())
+    return backends
+
+class BackendRegistry:
+    """Benchmarks capture backends once and caches the choice per device
+
+    The fastest working backend is picked for each device and kept in
+    memory. Choices saved from an earlier run can be restored with seed(),
+    and backends are only benchmarked once a device needs a choice. A
+    device is only re-probed after failure_threshold consecutive capture
+    failures on its chosen backend.
+    """
+
+    def __init__(self, backends, failure_threshold=3, rounds=2):
+        self.logger = get_logger(__name__)
+        self.backends = {backend.name: backend for backend in backends}
+        self.failure_threshold = failure_threshold
+        self.rounds = rounds
+        self._lock = threading.Lock()
+        self._timings = None
+        self._errors = {}
+        self._choices = {}
+        self._failures = {}
+
+    def benchmark(self):
+        """Time every backend and return working backend names, fastest first"""
+        timings = {}
+        errors = {}
+        for name, backend in self.backends.items():
+            try:
+                best = None
+                for _ in range(max(1, self.rounds)):
+                    started = time.perf_counter()
+                    if backend.capture() is None:
+                        raise RuntimeError("capture returned None")
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                timings[name] = best
+                self.logger.info(f"Capture backend {name}: {best * 1000:.1f} ms")
+            except Exception as e:
+                errors[name] = f"{name} screenshot failed: {str(e)}"
+                self.logger.warning(errors[name])
+            finally:
+                # Benchmark connections belong to the calling thread only
+                backend.close()
+
+        with self._lock:
+            self._timings = timings
+            self._errors = errors
+        return self.ranked()
+
+    def seed(self, choices):
+        """Restore saved {device_id: backend_name} choices, skipping unavailable backends"""
+        with self._lock:
+            for device_id, name in choices.items():
+                if name in self.backends:
+                    self._choices.setdefault(device_id, name)
+                    self._failures.setdefault(device_id, 0)
+
+    def ranked(self):
+        """Working backend names, fastest first"""
+        with self._lock:
+            timings = dict(self._timings or {})
+        return sorted(timings, key=timings.get)
+
+    def last_error(self):
+        """The most recent probe error, if any"""
+        with self._lock:
+            return next(reversed(self._errors.values()), None) if self._errors else None
+
+    def select(self, device_id=None):
+        """Get the cached backend for a device, probing only if none is chosen"""
+        with self._lock:
+            choice = self._choices.get(device_id)
+            probed = self._timings is not None
+        if choice:
+            return choice
+
+        ranked = self.ranked() if probed else self.benchmark()
+        if not ranked:
+            return None
+
+        with self._lock:
+            self._choices.setdefault(device_id, ranked[0])
+            self._failures[device_id] = 0
+            return self._choices[device_id]
+
+    def capture(self, device_id=None):
+        """Capture with the device's backend, returning (image, backend_name)"""
+        name = self.select(device_id)
+        if not name:
+            raise RuntimeError(f"No working screenshot method found. Last error: {self.last_error()}")
+
+        try:
+            image = self.backends[name].capture()
+            if image is None:
+                raise RuntimeError("Screenshot capture returned None")
+        except Exception:
+            with self._lock:
+                failures = self._failures.get(device_id, 0) + 1
+                self._failures[device_id] = failures
+                reprobe = failures >= self.failure_threshold
+                if reprobe:
+                    self._choices.pop(device_id, None)
+                    self._timings = None
+            if reprobe:
+                self.logger.warning(
+                    f"Backend {name} failed {failures} times in a row for device {device_id}, re-probing"
+                )
+            raise
+
+        with self._lock:
+            self._failures[device_id] = 0
+        return image, name
+
+    def forget(self, device_id):
+        """Drop the cached choice for a device"""
+        with self._lock:
+            self._choices.pop(device_id, None)
+            self._failures.pop(device_id, None)
+
+    def get_stats(self):
+        """Get benchmark timings, per-device choices and failure counts"""
+        with self._lock:
+            return {
+                'timings': dict(self._timings or {}),
+                'errors': dict(self._errors),
+                'choices': dict(self._choices),
+                'failures': dict(self._failures)
+            }
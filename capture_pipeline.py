@@ -0,0 +1,390 @@
+import threading
+import time
+from collections import deque
+from utils.logger import get_logger
+
+DEFAULT_PIPELINE_SETTINGS = {
+    'analysis_workers': 2,
+    'analysis_queue_size': 16,
+    'backpressure': 'coalesce',
+    'persist_queue_size': 64,
+    'max_in_flight': 32
+}
+
+class Frame:
+    """A captured screenshot travelling through the pipeline"""
+
+    def __init__(self, device_id, image, captured_at, dirty_ratio=None, content_version=None):
+        self.device_id = device_id
+        self.image = image
+        self.captured_at = captured_at
+        self.dirty_ratio = dirty_ratio
+        self.content_version = content_version
+        self.window_title = None
+        self.window_process = None
+        self.enqueued_at = time.monotonic()
+        self.frame_hash = None
+        self.change_score = None
+        self.reused = False
+        self.analysis = None
+
+    def window_context(self):
+        """Focused window details for the prefilter stages"""
+        return {'window_title': self.window_title, 'process_name': self.window_process}
+
+class StageMetrics:
+    """Rolling latency statistics for a pipeline stage"""
+
+    def __init__(self, window=200):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+        self.count = 0
+        self.last = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.last = seconds
+            self.max = max(self.max, seconds)
+
+    def snapshot(self):
+        """Get count, last, average, p95 and max latency in seconds"""
+        with self._lock:
+            samples = sorted(self._samples)
+            count, last, maximum = self.count, self.last, self.max
+
+        return {
+            'count': count,
+            'last': last,
+            'avg': sum(samples) / len(samples) if samples else 0.0,
+            'p95': samples[min(int(len(samples) * 0.95), len(samples) - 1)] if samples else 0.0,
+            'max': maximum
+        }
+
+class FrameQueue:
+    """Bounded frame queue with a backpressure policy
+
+    Policies:
+        block       - producers wait for space
+        drop_oldest - the oldest queued frame is discarded when full
+        coalesce    - a new frame replaces a queued frame from the same device,
+                      falling back to drop_oldest when full
+
+    get(claim=True) hands out at most one frame per device until release()
+    is called for it; later frames for that device wait in the queue, where
+    coalescing still replaces them.
+    """
+
+    POLICIES = ('block', 'drop_oldest', 'coalesce')
+
+    def __init__(self, maxsize, policy='drop_oldest'):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self.dropped = 0
+        self._items = deque()
+        self._claimed = set()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def put(self, frame, block=True):
+        """Queue a frame, returning the frame it displaced (if any)
+
+        With block=False a full 'block' queue accepts the frame anyway, for
+        producers that must never wait (such as event loop callbacks).
+        """
+        with self._cond:
+            if self._closed:
+                return frame
+
+            if self.policy == 'coalesce':
+                for index, queued in enumerate(self._items):
+                    if queued.device_id == frame.device_id:
+                        self._items[index] = frame
+                        self.dropped += 1
+                        return queued
+
+            displaced = None
+            if self.policy == 'block':
+                while block and len(self._items) >= self.maxsize and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return frame
+            elif len(self._items) >= self.maxsize:
+                displaced = self._items.popleft()
+                self.dropped += 1
+
+            self._items.append(frame)
+            self._cond.notify_all()
+            return displaced
+
+    def get(self, timeout=None, claim=False):
+        """Take the next frame, or None on timeout or once closed and drained
+
+        With claim=True frames from devices already claimed are skipped, and
+        the returned frame's device stays claimed until release().
+        """
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                index = self._next_index(claim)
+                if index is not None:
+                    break
+                if self._closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+            frame = self._items[index]
+            del self._items[index]
+            if claim:
+                self._claimed.add(frame.device_id)
+            self._cond.notify_all()
+            return frame
+
+    def _next_index(self, claim):
+        """Index of the first frame that may be taken (caller holds the lock)"""
+        for index, frame in enumerate(self._items):
+            if not claim or frame.device_id not in self._claimed:
+                return index
+        return None
+
+    def release(self, device_id):
+        """Let the next frame for a claimed device be taken"""
+        with self._cond:
+            self._claimed.discard(device_id)
+            self._cond.notify_all()
+
+    def discard(self, device_id):
+        """Drop queued frames for a device"""
+        with self._cond:
+            kept = [frame for frame in self._items if frame.device_id != device_id]
+            removed = len(self._items) - len(kept)
+            self._items = deque(kept)
+            self._cond.notify_all()
+            return removed
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def reopen(self):
+        with self._cond:
+            self._closed = False
+
+class CapturePipeline:
+    """Capture -> analyze -> persist pipeline connected by bounded queues
+
+    Capture threads call submit() and never wait on analysis. A pool of
+    analysis workers runs analyze_fn(frame), which returns the frame to
+    persist or None, and a single writer thread runs persist_fn(frame).
+    Each device has at most one frame in analysis, so its frames are
+    analyzed in order and newer ones coalesce while it is busy.
+
+    When an async engine is given, a single dispatcher thread instead
+    schedules analyze_async_fn(frame) on the engine's event loop, keeping at
+    most max_in_flight frames in progress.
+    """
+
+    def __init__(self, settings, analyze_fn, persist_fn, analyze_async_fn=None, engine=None):
+        self.logger = get_logger(__name__)
+        self.settings = dict(DEFAULT_PIPELINE_SETTINGS)
+        self.settings.update(settings or {})
+        self.analyze_fn = analyze_fn
+        self.persist_fn = persist_fn
+        self.analyze_async_fn = analyze_async_fn
+        self.engine = engine
+
+        self.analysis_queue = FrameQueue(
+            self.settings['analysis_queue_size'],
+            self.settings['backpressure']
+        )
+        self.persist_queue = FrameQueue(self.settings['persist_queue_size'], 'block')
+        self.metrics = {
+            stage: StageMetrics()
+            for stage in ('capture', 'queue_wait', 'analysis', 'persist', 'end_to_end')
+        }
+
+        self._lock = threading.Lock()
+        self._workers = []
+        self._writer = None
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self._in_flight_slots = threading.BoundedSemaphore(max(1, int(self.settings['max_in_flight'])))
+        self.running = False
+
+    def start(self):
+        """Start the analysis workers and the persistence writer"""
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+            self.analysis_queue.reopen()
+            self.persist_queue.reopen()
+
+            if self.engine and self.analyze_async_fn:
+                self._workers = [
+                    threading.Thread(target=self._async_dispatcher, name="analysis-dispatcher", daemon=True)
+                ]
+            else:
+                self._workers = [
+                    threading.Thread(target=self._analysis_worker, name=f"analysis-{i}", daemon=True)
+                    for i in range(max(1, int(self.settings['analysis_workers'])))
+                ]
+            self._writer = threading.Thread(target=self._persist_writer, name="persist-writer", daemon=True)
+            for thread in self._workers + [self._writer]:
+                thread.start()
+
+    def stop(self, timeout=1.0):
+        """Stop the workers, letting the writer flush analyzed frames"""
+        with self._lock:
+            if not self.running:
+                return
+            self.running = False
+            self.analysis_queue.close()
+            for thread in self._workers:
+                thread.join(timeout=timeout)
+            self._cancel_in_flight()
+            self.persist_queue.close()
+            self._writer.join(timeout=timeout)
+            self._workers = []
+            self._writer = None
+
+    def record_capture(self, seconds):
+        self.metrics['capture'].record(seconds)
+
+    def submit(self, frame):
+        """Hand a captured frame to the analysis stage"""
+        frame.enqueued_at = time.monotonic()
+        displaced = self.analysis_queue.put(frame)
+        if displaced is not None and displaced is not frame:
+            self.logger.debug(f"Analysis queue backpressure dropped a frame for device {displaced.device_id}")
+
+    def discard(self, device_id):
+        """Drop frames waiting for analysis and cancel in-flight requests for a device"""
+        self._cancel_in_flight(device_id)
+        return self.analysis_queue.discard(device_id)
+
+    def _cancel_in_flight(self, device_id=None):
+        with self._in_flight_lock:
+            if device_id is None:
+                futures = [future for pending in self._in_flight.values() for future in pending]
+            else:
+                futures = list(self._in_flight.get(device_id, ()))
+        for future in futures:
+            future.cancel()
+
+    def _analysis_worker(self):
+        while True:
+            frame = self.analysis_queue.get(claim=True)
+            if frame is None:
+                return
+
+            started = time.monotonic()
+            self.metrics['queue_wait'].record(started - frame.enqueued_at)
+            try:
+                result = self.analyze_fn(frame)
+            except Exception as e:
+                self.logger.error(f"Analysis stage error: {str(e)}")
+                result = None
+            self.metrics['analysis'].record(time.monotonic() - started)
+
+            try:
+                if result is not None:
+                    self.persist_queue.put(result)
+            finally:
+                self.analysis_queue.release(frame.device_id)
+
+    def _async_dispatcher(self):
+        while True:
+            frame = self.analysis_queue.get(claim=True)
+            if frame is None:
+                return
+
+            while not self._in_flight_slots.acquire(timeout=0.5):
+                if not self.running:
+                    self.analysis_queue.release(frame.device_id)
+                    return
+
+            started = time.monotonic()
+            self.metrics['queue_wait'].record(started - frame.enqueued_at)
+            try:
+                future = self.engine.submit(self.analyze_async_fn(frame))
+            except Exception as e:
+                self._in_flight_slots.release()
+                self.analysis_queue.release(frame.device_id)
+                self.logger.error(f"Failed to schedule analysis: {str(e)}")
+                continue
+
+            with self._in_flight_lock:
+                self._in_flight.setdefault(frame.device_id, set()).add(future)
+            future.add_done_callback(
+                lambda done, frame=frame, started=started: self._on_async_done(done, frame, started)
+            )
+
+    def _on_async_done(self, future, frame, started):
+        """Runs on the event loop thread, so it must never block"""
+        self._in_flight_slots.release()
+        with self._in_flight_lock:
+            pending = self._in_flight.get(frame.device_id)
+            if pending is not None:
+                pending.discard(future)
+                if not pending:
+                    del self._in_flight[frame.device_id]
+
+        self.metrics['analysis'].record(time.monotonic() - started)
+        try:
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.logger.error(f"Analysis stage error: {str(future.exception())}")
+                return
+
+            result = future.result()
+            if result is not None:
+                self.persist_queue.put(result, block=False)
+        finally:
+            self.analysis_queue.release(frame.device_id)
+
+    def _persist_writer(self):
+        while True:
+            frame = self.persist_queue.get()
+            if frame is None:
+                return
+
+            started = time.monotonic()
+            try:
+                self.persist_fn(frame)
+            except Exception as e:
+                self.logger.error(f"Persistence stage error: {str(e)}")
+            finished = time.monotonic()
+            self.metrics['persist'].record(finished - started)
+            self.metrics['end_to_end'].record(finished - frame.enqueued_at)
+
+    def get_stats(self):
+        """Get per-stage latency metrics, queue depths and drop counters"""
+        with self._in_flight_lock:
+            in_flight = sum(len(pending) for pending in self._in_flight.values())
+
+        return {
+            'stages': {stage: metrics.snapshot() for stage, metrics in self.metrics.items()},
+            'analysis_queue': {
+                'depth': len(self.analysis_queue),
+                'in_flight': in_flight,
+                'dropped': self.analysis_queue.dropped,
+                'policy': self.analysis_queue.policy
+            },
+            'persist_queue': {
+                'depth': len(self.persist_queue)
+            }
+        }
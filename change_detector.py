@@ -0,0 +1,227 @@
+import threading
+import numpy as np
+from utils.logger import get_logger
+from history_store import SCORE_CATEGORIES
+
+DEFAULT_CHANGE_SETTINGS = {
+    'enabled': True,
+    'block_size': 16,
+    'pixel_threshold': 24,
+    'merge_gap': 2,
+    'padding': 16,
+    'min_region': 128,
+    'max_changed_ratio': 0.35,
+    'max_regions': 4,
+    'full_frame_interval': 10
+}
+
+class ChangeDetector:
+    """Per-device diff stage that finds the changed regions of a frame
+
+    Each frame is compared with the last analyzed frame of the same device
+    in blocks of block_size pixels. Changed blocks are grouped into boxes by
+    recursive XY cuts, so changes closer than merge_gap blocks end up in one
+    box. When the boxes cover at most max_changed_ratio of the screen only
+    the cropped regions are analyzed, and their scores are merged with the
+    scores kept for the rest of the screen. A full frame is analyzed every
+    full_frame_interval frames to refresh the kept scores, and whenever the
+    kept scores reach an alert threshold, since a crop cannot tell whether
+    the flagged content is still on screen.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.logger = get_logger(__name__)
+        self._lock = threading.Lock()
+        self._state = {}
+        self._stats = {}
+
+    def _get_settings(self):
+        """Get change detection settings merged over the defaults"""
+        settings = dict(DEFAULT_CHANGE_SETTINGS)
+        settings.update(self.config.get('change_detection', {}))
+        return settings
+
+    def _alerting(self, scores):
+        """Whether kept scores reach the threshold of a monitored category"""
+        thresholds = self.config.get('content_thresholds', {})
+        for category in self.config.get('monitored_categories', SCORE_CATEGORIES):
+            try:
+                if float(scores.get(category, 0.0)) >= float(thresholds.get(category, 0.7)):
+                    return True
+            except (TypeError, ValueError):
+                continue
+        return False
+
+    def _to_array(self, image):
+        return np.asarray(image.convert('L'), dtype=np.int16)
+
+    def changed_blocks(self, previous, current, block_size, pixel_threshold):
+        """Get a boolean grid of blocks whose pixels changed by more than pixel_threshold"""
+        height = (current.shape[0] // block_size) * block_size
+        width = (current.shape[1] // block_size) * block_size
+        diff = np.abs(current[:height, :width] - previous[:height, :width])
+        blocks = diff.reshape(height // block_size, block_size, width // block_size, block_size)
+        return blocks.max(axis=(1, 3)) > pixel_threshold
+
+    def _runs(self, mask, gap):
+        """Split a 1-D mask into (start, stop) runs, bridging gaps of at most gap"""
+        indices = np.flatnonzero(mask)
+        if not len(indices):
+            return []
+        breaks = np.flatnonzero(np.diff(indices) > gap + 1)
+        starts = np.concatenate(([indices[0]], indices[breaks + 1]))
+        stops = np.concatenate((indices[breaks], [indices[-1]])) + 1
+        return list(zip(starts.tolist(), stops.tolist()))
+
+    def _xy_cut(self, grid, top, left, gap, boxes):
+        """Recursively split the changed blocks of grid into separate boxes"""
+        row_runs = self._runs(grid.any(axis=1), gap)
+        for row_start, row_stop in row_runs:
+            band = grid[row_start:row_stop]
+            col_runs = self._runs(band.any(axis=0), gap)
+            for col_start, col_stop in col_runs:
+                cell = band[:, col_start:col_stop]
+                if len(row_runs) == 1 and len(col_runs) == 1:
+                    # No further cut possible: trim to the changed rows and emit
+                    rows = np.flatnonzero(cell.any(axis=1))
+                    boxes.append((
+                        top + row_start + int(rows[0]),
+                        left + col_start,
+                        top + row_start + int(rows[-1]) + 1,
+                        left + col_stop
+                    ))
+                else:
+                    self._xy_cut(cell, top + row_start, left + col_start, gap, boxes)
+
+    def find_regions(self, previous, current, settings):
+        """Get changed regions as pixel boxes (left, top, right, bottom)"""
+        block_size = int(settings['block_size'])
+        grid = self.changed_blocks(previous, current, block_size, settings['pixel_threshold'])
+
+        cells = []
+        self._xy_cut(grid, 0, 0, int(settings['merge_gap']), cells)
+
+        height, width = current.shape
+        padding = int(settings['padding'])
+        min_region = int(settings['min_region'])
+        regions = []
+        for top, left, bottom, right in cells:
+            box = [left * block_size - padding, top * block_size - padding,
+                   right * block_size + padding, bottom * block_size + padding]
+
+            # Grow tiny regions so the model gets enough context
+            for start, stop, limit in ((0, 2, width), (1, 3, height)):
+                missing = min(min_region, limit) - (box[stop] - box[start])
+                if missing > 0:
+                    box[start] -= missing // 2
+                    box[stop] += missing - missing // 2
+                shift = max(0, -box[start]) - max(0, box[stop] - limit)
+                box[start] += shift
+                box[stop] += shift
+
+            regions.append((max(0, box[0]), max(0, box[1]), min(width, box[2]), min(height, box[3])))
+        return regions
+
+    def plan(self, device_id, image):
+        """Decide how to analyze a frame
+
+        Returns None to analyze the full frame, or a list of crop boxes. An
+        empty list means nothing changed since the last analyzed frame.
+        """
+        settings = self._get_settings()
+        if not settings.get('enabled', True):
+            return None
+
+        with self._lock:
+            state = self._state.get(device_id)
+            stats = self._stats.setdefault(device_id, {'full': 0, 'cropped': 0, 'unchanged': 0})
+            if (not state or state['since_full'] + 1 >= int(settings['full_frame_interval']) or
+                    self._alerting(state['scores'])):
+                stats['full'] += 1
+                return None
+            previous = state['frame']
+
+        current = self._to_array(image)
+        if current.shape != previous.shape:
+            with self._lock:
+                stats['full'] += 1
+            return None
+
+        regions = self.find_regions(previous, current, settings)
+        area = sum((right - left) * (bottom - top) for left, top, right, bottom in regions)
+        ratio = area / float(current.shape[0] * current.shape[1])
+
+        with self._lock:
+            if len(regions) > int(settings['max_regions']) or ratio > settings['max_changed_ratio']:
+                stats['full'] += 1
+                return None
+            stats['cropped' if regions else 'unchanged'] += 1
+        return regions
+
+    def record_full(self, device_id, image, scores):
+        """Keep a fully analyzed frame and its scores as the new baseline"""
+        # Errors and salvaged guesses are not trusted as a baseline
+        if not isinstance(scores, dict) or 'error' in scores or scores.get('partial'):
+            return scores
+        frame = self._to_array(image)
+        with self._lock:
+            self._state[device_id] = {
+                'frame': frame,
+                'scores': dict(scores),
+                'since_full': 0
+            }
+        return scores
+
+    def record_regions(self, device_id, image, regions, region_scores):
+        """Merge the scores of analyzed crops into the device's baseline
+
+        Each category keeps the highest score seen, since regions that did
+        not change still show what was scored before. plan() only crops
+        while the kept scores are below every alert threshold, so an alert
+        always comes from an analyzed crop, and program_name is taken only
+        from the crops. Returns the merged scores, or the first error or
+        partially parsed crop.
+        """
+        for scores in region_scores:
+            if not isinstance(scores, dict) or 'error' in scores or scores.get('partial'):
+                return scores
+
+        frame = self._to_array(image)
+        with self._lock:
+            state = self._state.get(device_id)
+            if not state:
+                return {'error': 'No baseline frame for region analysis'}
+
+            merged = dict(state['scores'])
+            merged.pop('program_name', None)
+            for scores in region_scores:
+                for key in SCORE_CATEGORIES:
+                    if key in scores:
+                        merged[key] = max(float(merged.get(key, 0.0)), float(scores[key]))
+                if scores.get('program_name'):
+                    merged['program_name'] = scores['program_name']
+            merged['regions'] = [list(region) for region in regions]
+
+            state['frame'] = frame
+            state['scores'] = {key: value for key, value in merged.items() if key != 'regions'}
+            state['since_full'] += 1
+            return merged
+
+    def reset(self, device_id=None):
+        """Forget the baseline for a device, or for all devices"""
+        with self._lock:
+            if device_id is None:
+                self._state.clear()
+            else:
+                self._state.pop(device_id, None)
+
+    def get_stats(self, device_id=None):
+        """Get counters of full, cropped and unchanged frames"""
+        with self._lock:
+            if device_id is not None:
+                return dict(self._stats.get(device_id, {'full': 0, 'cropped': 0, 'unchanged': 0}))
+            return {
+                key: sum(stats[key] for stats in self._stats.values())
+                for key in ('full', 'cropped', 'unchanged')
+            }
@@ -1,5 +1,7 @@
 import json
 import os
+import threading
+from contextlib import contextmanager
 from utils.logger import get_logger
 from keyrings.alt.file import PlaintextKeyring
 
@@ -8,6 +10,10 @@ class ConfigManager:
         self.logger = get_logger(__name__)
         self.config_file = "data/config.json"
         self.keyring = PlaintextKeyring()
+        self._listeners = []
+        self._batch_lock = threading.RLock()
+        self._batch_depth = 0
+        self._pending_changes = set()
         self._initialize_api_keys()
         self.config = self._load_config()
 
@@ -34,6 +40,18 @@ class ConfigManager:
             'monitoring_enabled': False,
             'screenshot_interval': 30,
             'vision_provider': 'openai',
+            'history_backend': 'sqlite',
+            'backend_failure_threshold': 3,
+            'vnc_settings': {
+                'max_sessions': 8,
+                'session_wait': 10,
+                'request_timeout': 15,
+                'update_interval': 0.1,
+                'health_check_interval': 30,
+                'idle_timeout': 300,
+                'reconnect_base_delay': 1.0,
+                'reconnect_max_delay': 60.0
+            },
             'api_keys': {},
             'model_settings': {
                 'openai': {
@@ -65,7 +83,143 @@ class ConfigManager:
                 'hate',
                 'drugs',
                 'gambling'
-            ]
+            ],
+            'dedup_settings': {
+                'enabled': True,
+                'hash_size': 8,
+                'max_distance': 4
+            },
+            'analysis_cache': {
+                'enabled': True,
+                'max_memory_entries': 512,
+                'max_bytes': 52428800,
+                'ttl_seconds': 86400
+            },
+            'journal_settings': {
+                'fsync_batch_size': 20,
+                'fsync_interval': 1.0,
+                'compact_ratio': 0.3,
+                'compact_min_records': 100,
+                'compact_check_interval': 30
+            },
+            'rollup_settings': {
+                'save_delay': 5.0,
+                'compact_records': 500
+            },
+            'report_jobs': {
+                'workers': 2,
+                'poll_interval_ms': 100,
+                'idle_poll_interval_ms': 500
+            },
+            'report_settings': {
+                'alert_rows_per_table': 100,
+                'max_alert_rows': 500,
+                'export_details': None
+            },
+            'chart_cache': {
+                'memory_entries': 32,
+                'disk_entries': 200
+            },
+            'report_schedule': {
+                'enabled': True,
+                'periods': ['last_7_days', 'last_30_days', 'today', 'yesterday'],
+                'per_device': True,
+                'check_interval': 300,
+                'idle_seconds': 120
+            },
+            'pipeline_settings': {
+                'analysis_workers': 2,
+                'analysis_queue_size': 16,
+                'backpressure': 'coalesce',
+                'persist_queue_size': 64,
+                'max_in_flight': 32
+            },
+            'rate_limits': {
+                'enabled': False,
+                'limits': {
+                    'openai': {'rpm': 500, 'tpm': 200000},
+                    'gemini': {'rpm': 60, 'tpm': 1000000}
+                },
+                'alert_priority_window': 600,
+                'max_wait': None,
+                'max_retries': 2,
+                'default_retry_after': 10
+            },
+            'router_settings': {
+                'enabled': False,
+                'providers': ['openai', 'gemini'],
+                'window': 50,
+                'min_samples': 5,
+                'max_error_rate': 0.5,
+                'cooldown': 60,
+                'hedge': False,
+                'hedge_percentile': 0.95,
+                'hedge_min_delay': 2.0
+            },
+            'batch_settings': {
+                'enabled': False,
+                'max_batch_size': 4,
+                'max_wait': 0.5,
+                'max_in_flight': 2
+            },
+            'prefilter_settings': {
+                'enabled': False,
+                'stages': ['window_title', 'skin_tone', 'ocr_keywords'],
+                'safe_titles': [
+                    'Visual Studio Code',
+                    'PyCharm',
+                    'IntelliJ IDEA',
+                    'Microsoft Excel',
+                    'LibreOffice Calc',
+                    'Microsoft Word',
+                    'LibreOffice Writer',
+                    'Terminal'
+                ],
+                'safe_processes': [
+                    'code',
+                    'pycharm64',
+                    'idea64',
+                    'excel',
+                    'winword',
+                    'soffice.bin',
+                    'gnome-terminal-server',
+                    'konsole',
+                    'windowsterminal'
+                ],
+                'skin_risky_ratio': 0.35,
+                'ocr_keywords': []
+            },
+            'change_detection': {
+                'enabled': True,
+                'block_size': 16,
+                'pixel_threshold': 24,
+                'merge_gap': 2,
+                'padding': 16,
+                'min_region': 128,
+                'max_changed_ratio': 0.35,
+                'max_regions': 4,
+                'full_frame_interval': 10
+            },
+            'response_parsing': {
+                'strict_schema': True,
+                'reask': True
+            },
+            'preprocess_settings': {
+                'max_long_edge': 1568,
+                'format': 'JPEG',
+                'quality': 80,
+                'detail': 'high',
+                'detail_change_threshold': 0.25,
+                'low_detail_long_edge': 512
+            },
+            'async_analysis': {
+                'enabled': False,
+                'request_timeout': 60,
+                'concurrency': {
+                    'openai': 8,
+                    'gemini': 4
+                }
+            }
         }
 
         try:
@@ -103,6 +257,50 @@ class ConfigManager:
             self.logger.error(f"Error saving config: {str(e)}")
             return False
 
+    def add_listener(self, callback):
+        """Call callback(changed_keys) after configuration changes"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    @contextmanager
+    def batch_changes(self):
+        """Group several changes into one save and one listener notification"""
+        with self._batch_lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._batch_lock:
+                self._batch_depth -= 1
+                flush = self._batch_depth == 0 and self._pending_changes
+                changed = set(self._pending_changes) if flush else set()
+                if flush:
+                    self._pending_changes.clear()
+            if flush:
+                if changed - {'api_keys'}:
+                    self.save()
+                self._notify(changed)
+
+    def _changed(self, key, save=True):
+        """Save and notify listeners, or defer both while batching"""
+        with self._batch_lock:
+            if self._batch_depth:
+                self._pending_changes.add(key)
+                return
+        if save:
+            self.save()
+        self._notify({key})
+
+    def _notify(self, changed):
+        for callback in list(self._listeners):
+            try:
+                callback(changed)
+            except Exception as e:
+                self.logger.error(f"Config listener failed: {str(e)}")
+
     def get(self, key, default=None):
         """Get configuration value"""
         return self.config.get(key, default)
@@ -110,7 +308,7 @@ class ConfigManager:
     def set(self, key, value):
         """Set configuration value"""
         self.config[key] = value
-        self.save()
+        self._changed(key)
 
     def get_api_key(self, provider):
         """Get API key for specified provider"""
@@ -120,7 +318,8 @@ class ConfigManager:
                 # Fallback to environment variables
                 env_key = os.environ.get(f'{provider.upper()}_API_KEY')
                 if env_key:
-                    self.set_api_key(provider, env_key)
+                    # Mirror into the keyring without notifying listeners; the key did not change
+                    self.keyring.set_password("screen_monitor", f"{provider}_api_key", env_key)
                     return env_key
             return key
         except Exception as e:
@@ -138,6 +337,7 @@ class ConfigManager:
                     self.keyring.delete_password("screen_monitor", f"{provider}_api_key")
                 except:
                     pass
+            self._changed('api_keys', save=False)
             return True
         except Exception as e:
             self.logger.error(f"Failed to set API key: {str(e)}")
@@ -161,4 +361,4 @@ class ConfigManager:
                 'selected_model': None
             }
         self.config['model_settings'][provider]['selected_model'] = model
-        self.save()
+        self._changed('model_settings')
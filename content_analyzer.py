@@ -1,33 +1,190 @@
+import threading
+import httpx
 import openai
 import google.generativeai as genai
 from utils.logger import get_logger
-from PIL import Image
-import io
 import base64
-import json
+from analysis_cache import AnalysisCache, image_digest
+from image_preprocessor import ImagePreprocessor
+from analysis_batcher import AnalysisBatcher
+from provider_router import ProviderRouter
+from rate_limiter import RateLimiter, estimate_tokens, is_rate_limited, retry_after
+from response_parser import (
+    DEFAULT_PARSER_SETTINGS, REASK_PROMPT, ResponseParseError,
+    openai_response_format, gemini_generation_config, parse_scores, parse_batch
+)
+
+# Bump whenever the analysis prompts change so cached results are invalidated
+PROMPT_VERSION = 1
+
+OPENAI_SYSTEM_PROMPT = """You're NannyAI. A bot specialised in protecting children and minors from harmful content on the internet. 
+                                    You will be provided with screenshots to analyze for potentially harmful content. For each category (violence, adult, hate, drugs, gambling), 
+                                    provide a confidence score as a float between 0.0 and 1.0, and identify the program/application visible in the screenshot. 
+                                    Return the results in a JSON format using the following format:
+                                    {
+                                        'violence': 0.0,
+                                        'adult': 0.0,
+                                        'hate': 0.0,
+                                        'drugs': 0.0,
+                                        'gambling': 0.0,
+                                        'program_name': 'name_of_program'
+                                    }
+                                    """
+
+OPENAI_EMOJI_PROMPT = "NannyAI, pay close attention to chats and emojis that might hint towards anything sexual or violent since a minor would be viewing them. They won't explicitly mention anything to trigger but the emojis and their order would implicitly mention this. For example: eggplant emoji with peach emoji, etc."
+
+GEMINI_PROMPT = """
+            You're NannyAI. A bot that specialised in protecting children and minors from harmful content on the internet. You will be provided with screenshots to analyze for potentially harmful content. For each category (violence, adult, hate, drugs, gambling), provide a confidence score as a float between 0.0 and 1.0 and identify the program/application visible in the screenshot. Return the results in a JSON format with these categories as keys. Example would be:
+            {
+                    'violence': 0.0,
+                    'adult': 0.0,
+                    'hate': 0.0,
+                    'drugs': 0.0,
+                    'gambling': 0.0,
+                    'program_name': 'name_of_program'
+            }.
+            NannyAI, pay close attention to chats and emojis that might hint towards anything sexual or violent since a minor would be viewing them. They won't explicitly mention anything to trigger but the emojis and their order would implicitly mention this. For example: eggplant emoji with peach emoji, etc.
+            NannyAI, please analyze this image for potentially harmful content.
+            """
+
+BATCH_PROMPT = """You will be given {count} numbered screenshots, possibly from different devices. Analyze each one separately.
+Return a JSON object with a single key 'results' holding one object per screenshot, in the order given, each in the format described above."""
+
+# Config keys whose change rebuilds the API clients
+RELOAD_KEYS = frozenset({'api_keys', 'model_settings', 'vision_provider', 'api_endpoints'})
+
+DEFAULT_HTTP_POOL_SETTINGS = {
+    'min_connections': 4,
+    'keepalive_expiry': 30,
+    'timeout': 60
+}
 
 class ContentAnalyzer:
+    """Shared vision analysis service
+
+    One instance is created at startup and shared by the capture pipeline
+    and the GUI. OpenAI requests go through one pooled keep-alive HTTP
+    client sized to the number of devices, and the API clients are rebuilt
+    when keys, models or the provider change in the config.
+    """
+
     def __init__(self, config):
         self.config = config
         self.logger = get_logger(__name__)
+        self._reload_lock = threading.RLock()
 
         # Set default provider
         self.provider = config.get('vision_provider', 'openai')
 
+        # Optional endpoint overrides, e.g. for a local stub server
+        self.api_endpoints = config.get('api_endpoints', {})
+
+        # Keep-alive connection pool shared by all OpenAI requests
+        self.http_settings = dict(DEFAULT_HTTP_POOL_SETTINGS)
+        self.http_settings.update(config.get('http_pool', {}))
+        self.pool_size = int(self.http_settings['min_connections'])
+        self.http_client = self._build_http_client()
+
         # Initialize API clients with keys from config
         self._initialize_api_clients()
+        config.add_listener(self._on_config_changed)
+
+        # Cache of previously scored images
+        cache_settings = config.get('analysis_cache', {})
+        self.cache = AnalysisCache(cache_settings) if cache_settings.get('enabled', True) else None
+
+        # Resizing and encoding applied to every frame before upload
+        self.preprocessor = ImagePreprocessor(config.get('preprocess_settings'))
+
+        # Structured output and recovery of malformed responses
+        self.parser_settings = dict(DEFAULT_PARSER_SETTINGS)
+        self.parser_settings.update(config.get('response_parsing', {}))
+        self._parse_lock = threading.Lock()
+        self._parse_stats = {'parsed': 0, 'salvaged': 0, 'reasked': 0, 'failed': 0}
+
+        # Request and token budget shared by every device
+        self.rate_limiter = RateLimiter(config.get('rate_limits'))
+
+        # Failover and hedging across providers
+        self.router = ProviderRouter(self, config.get('router_settings'))
+
+        # Optionally group frames from several devices into one request
+        batch_settings = config.get('batch_settings', {})
+        self.batcher = (
+            AnalysisBatcher(self._call_batch_api, batch_settings)
+            if batch_settings.get('enabled', False) else None
+        )
+
+    def _build_http_client(self):
+        return httpx.Client(
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self.http_settings['keepalive_expiry']
+            ),
+            timeout=self.http_settings['timeout']
+        )
+
+    def size_pool(self, device_count):
+        """Resize the HTTP connection pool to the number of monitored devices"""
+        size = max(int(self.http_settings['min_connections']), int(device_count))
+        with self._reload_lock:
+            if size == self.pool_size:
+                return
+            self.pool_size = size
+            old_client = self.http_client
+            self.http_client = self._build_http_client()
+            self._initialize_api_clients()
+        self._retire(old_client)
+        self.logger.info(f"HTTP connection pool sized for {device_count} devices ({size} connections)")
+
+    def _retire(self, http_client):
+        """Close a replaced HTTP client once requests still using it have finished"""
+        timer = threading.Timer(float(self.http_settings['timeout']), http_client.close)
+        timer.daemon = True
+        timer.start()
+
+    def _on_config_changed(self, changed):
+        if changed & RELOAD_KEYS:
+            self.reload()
+
+    def reload(self):
+        """Pick up new API keys, models, provider and endpoints"""
+        with self._reload_lock:
+            self.provider = self.config.get('vision_provider', 'openai')
+            self.api_endpoints = self.config.get('api_endpoints', {})
+            self._initialize_api_clients()
+        self.logger.info("Reloaded vision API clients")
+
+    def close(self):
+        """Stop batching and close the HTTP connection pool"""
+        self.config.remove_listener(self._on_config_changed)
+        if self.batcher:
+            self.batcher.stop()
+        self.http_client.close()
 
     def _initialize_api_clients(self):
         """Initialize API clients with current config"""
         try:
             # Initialize OpenAI client
             openai_key = self.config.get_api_key('openai')
-            self.openai_client = openai.OpenAI(api_key=openai_key) if openai_key else None
+            self.openai_client = openai.OpenAI(
+                api_key=openai_key,
+                base_url=self.api_endpoints.get('openai'),
+                http_client=self.http_client
+            ) if openai_key else None
 
             # Initialize Gemini client
             gemini_key = self.config.get_api_key('gemini')
             if gemini_key:
-                genai.configure(api_key=gemini_key)
+                if self.api_endpoints.get('gemini'):
+                    genai.configure(
+                        api_key=gemini_key,
+                        transport='rest',
+                        client_options={'api_endpoint': self.api_endpoints['gemini']}
+                    )
+                else:
+                    genai.configure(api_key=gemini_key)
                 self.gemini_model = genai.GenerativeModel(
                     self.config.get_model_settings('gemini').get('selected_model', 'gemini-1.5-flash-8b')
                 )
@@ -39,219 +196,434 @@ class ContentAnalyzer:
             self.openai_client = None
             self.gemini_model = None
 
-    def analyze_image(self, image):
-        """Analyze image for inappropriate content"""
+    def analyze_image(self, image, device_id=None, change_score=None, options=None):
+        """Analyze image for inappropriate content
+
+        change_score (0.0-1.0) is how much the frame differs from the previous
+        one and drives the automatic detail level; options are per-device
+        overrides of the preprocessing settings.
+        """
+        # Check against configured thresholds
+        return self.check_thresholds(self.score_image(image, device_id, change_score, options))
+
+    def score_image(self, image, device_id=None, change_score=None, options=None):
+        """Get the raw category scores of an image, or a dict with an 'error'"""
         try:
             # Validate API configuration
-            if not self._validate_api_config():
-                return False
+            if not self.validate_api_config():
+                return {"error": "API not configured"}
 
-            # Convert PIL Image to appropriate format
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format='PNG')
-            img_byte_arr = img_byte_arr.getvalue()
+            settings = self.preprocessor.resolve(options, change_score)
 
-            # Get analysis based on selected provider
-            if self.provider == 'openai':
-                analysis = self._call_openai_api(img_byte_arr)
-            elif self.provider == 'gemini':
-                analysis = self._call_gemini_api(img_byte_arr)
-            else:
-                self.logger.error(f"Unknown provider: {self.provider}")
-                return False
+            # Reuse a previous result for identical content with the same model and prompt
+            cache_key, analysis = self.lookup_cache(image, settings)
+
+            if analysis is None:
+                prepared = self.encode_image(image, settings, device_id)
+
+                if self.batcher:
+                    # Collecting a batch adds up to max_wait before the request starts
+                    analysis = self.batcher.submit(
+                        prepared, timeout=float(self.batcher.settings['max_wait']) + float(self.http_settings['timeout'])
+                    )
+                else:
+                    analysis = self._analyze_prepared(prepared)
 
+                self.store_cache(cache_key, analysis)
 
-            # Check against configured thresholds
-            return self._check_harmful_content(analysis)
+            return analysis
 
         except Exception as e:
             self.logger.error(f"Content analysis failed: {str(e)}")
-            return False
+            return {"error": str(e)}
+
+    def lookup_cache(self, image, settings):
+        """Get (cache_key, cached_analysis) for an image, both None when uncached"""
+        if not self.cache:
+            return None, None
+        model = self.config.get_model_settings(self.provider).get('selected_model')
+        cache_key = AnalysisCache.make_key(
+            image_digest(image),
+            self.provider,
+            model,
+            PROMPT_VERSION,
+            variant=ImagePreprocessor.signature(settings)
+        )
+        return cache_key, self.cache.get(cache_key)
+
+    def store_cache(self, cache_key, analysis):
+        """Cache a successful analysis"""
+        # Partially salvaged answers are not worth keeping
+        if cache_key and 'error' not in analysis and not analysis.get('partial'):
+            self.cache.put(cache_key, analysis)
+
+    def encode_image(self, image, settings, device_id=None):
+        """Resize and encode a PIL Image for upload"""
+        prepared = self.preprocessor.encode(image, settings, device_id)
+        prepared['device_id'] = device_id
+        return prepared
+
+    def _analyze_prepared(self, prepared):
+        """Analyze one encoded frame with the selected provider, or through the router"""
+        if not self.router.enabled:
+            return self._call_provider(self.provider, prepared)
+        return self.router.call(prepared, {
+            'openai': lambda prepared: self._call_provider('openai', prepared),
+            'gemini': lambda prepared: self._call_provider('gemini', prepared)
+        })
 
-    def _validate_api_config(self):
+    def _call_provider(self, provider, prepared):
+        """Call one provider for one frame, within the shared rate limit"""
+        call = self._call_openai_api if provider == 'openai' else self._call_gemini_api
+        if not self.rate_limiter.enabled:
+            return call(prepared)
+        return self.rate_limiter.run(
+            provider, estimate_tokens(provider, prepared), [prepared.get('device_id')], call, prepared
+        )
+
+    def api_error(self, error):
+        """Build the result of a failed API call, flagging 429s for the rate limiter"""
+        result = {"error": str(error)}
+        if is_rate_limited(error):
+            result['rate_limited'] = True
+            result['retry_after'] = retry_after(error)
+        return result
+
+    def get_preprocess_stats(self, device_id=None):
+        """Get encoded bytes and encode time counters per device"""
+        return self.preprocessor.get_stats(device_id)
+
+    def get_rate_limit_stats(self):
+        """Get queue depth and remaining request/token budget per provider"""
+        return self.rate_limiter.get_stats()
+
+    def get_router_stats(self):
+        """Get per-provider health and failover counters"""
+        return self.router.get_stats()
+
+    def get_parse_stats(self):
+        """Get counts of parsed, salvaged, re-asked and unparseable responses"""
+        with self._parse_lock:
+            return dict(self._parse_stats)
+
+    def get_batch_stats(self):
+        """Get batching counters, or None if batching is disabled"""
+        return self.batcher.get_stats() if self.batcher else None
+
+    def get_cache_stats(self):
+        """Get analysis cache counters, or None if caching is disabled"""
+        return self.cache.get_stats() if self.cache else None
+
+    def validate_api_config(self):
         """Validate API configuration"""
+        if self.provider not in ('openai', 'gemini'):
+            self.logger.error(f"Unknown provider: {self.provider}")
+            return False
+
+        # With failover any configured provider will do
+        if self.router.enabled and self.router.candidates():
+            return True
+
+        # Clients are rebuilt by reload() when keys change, never on the analysis path
         if self.provider == 'openai':
             if not self.openai_client:
-                self._initialize_api_clients()  # Try to reinitialize
-                if not self.openai_client:
-                    self.logger.error("OpenAI API key not configured")
-                    return False
+                self.logger.error("OpenAI API key not configured")
+                return False
             model_settings = self.config.get_model_settings('openai')
             if not model_settings.get('selected_model'):
                 self.logger.error("OpenAI model not selected")
                 return False
         elif self.provider == 'gemini':
             if not self.gemini_model:
-                self._initialize_api_clients()  # Try to reinitialize
-                if not self.gemini_model:
-                    self.logger.error("Gemini API key not configured")
-                    return False
+                self.logger.error("Gemini API key not configured")
+                return False
             model_settings = self.config.get_model_settings('gemini')
             if not model_settings.get('selected_model'):
                 self.logger.error("Gemini model not selected")
                 return False
         return True
 
-    def _call_openai_api(self, image_bytes):
-        """Call OpenAI Vision API for content analysis"""
+    def _openai_image(self, prepared):
+        """Build the image_url content part for an encoded frame"""
+        base64_image = base64.b64encode(prepared['data']).decode('utf-8')
+        image_url = {"url": f"data:{prepared['mime_type']};base64,{base64_image}"}
+        if prepared.get('detail') in ('low', 'high'):
+            image_url['detail'] = prepared['detail']
+        return {"type": "image_url", "image_url": image_url}
+
+    def _openai_request(self, prepared):
+        """Build the chat completion arguments for an OpenAI analysis request"""
+        # Get selected model from config
+        model_settings = self.config.get_model_settings('openai')
+        model = model_settings.get('selected_model', 'gpt-4o-mini')
+
+        return {
+            'model': model,
+            'messages': [
+                {
+                    "role": "system",
+                    "content": OPENAI_SYSTEM_PROMPT
+                },
+                {
+                    "role": "system",
+                    "content": OPENAI_EMOJI_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": "NannyAI, please analyze this screenshot for potentially harmful content."
+                        },
+                        self._openai_image(prepared)
+                    ]
+                }
+            ],
+            'max_tokens': 300,
+            'response_format': self._openai_response_format()
+        }
+
+    def _openai_response_format(self, batch=False):
+        """Strict JSON schema output, or plain JSON mode for models without it"""
+        if self.parser_settings.get('strict_schema', True):
+            return openai_response_format(batch)
+        return {"type": "json_object"}
+
+    def _openai_reask_request(self, content):
+        """Build a text-only request asking the model to reformat its answer"""
+        model_settings = self.config.get_model_settings('openai')
+        return {
+            'model': model_settings.get('selected_model', 'gpt-4o-mini'),
+            'messages': [{"role": "user", "content": REASK_PROMPT + content}],
+            'max_tokens': 150,
+            'response_format': self._openai_response_format()
+        }
+
+    def build_request(self, provider, prepared):
+        """Keyword arguments for an analysis request: chat.completions.create for
+        OpenAI, generate_content for Gemini"""
+        if provider == 'openai':
+            return self._openai_request(prepared)
+        return {
+            'contents': [GEMINI_PROMPT, self._gemini_image(prepared)],
+            'generation_config': self._gemini_generation_config()
+        }
+
+    def build_reask_request(self, provider, content):
+        """Keyword arguments for a text-only request asking the model to reformat its answer"""
+        if provider == 'openai':
+            return self._openai_reask_request(content)
+        return {
+            'contents': REASK_PROMPT + content,
+            'generation_config': self._gemini_generation_config()
+        }
+
+    def _openai_batch_request(self, prepared_list):
+        """Build one chat completion request covering several frames"""
+        request = self._openai_request(prepared_list[0])
+        content = [{"type": "text", "text": BATCH_PROMPT.format(count=len(prepared_list))}]
+        for number, prepared in enumerate(prepared_list, 1):
+            content.append({"type": "text", "text": f"Screenshot {number}:"})
+            content.append(self._openai_image(prepared))
+
+        request['messages'][-1]['content'] = content
+        request['max_tokens'] = 300 * len(prepared_list)
+        request['response_format'] = self._openai_response_format(batch=True)
+        return request
+
+    def _gemini_image(self, prepared):
+        """Pass the encoded frame to Gemini as an inline blob"""
+        return {'mime_type': prepared['mime_type'], 'data': prepared['data']}
+
+    def _gemini_generation_config(self, batch=False):
+        """Ask Gemini for JSON matching the score schema"""
+        if self.parser_settings.get('strict_schema', True):
+            return gemini_generation_config(batch)
+        return {'response_mime_type': 'application/json'}
+
+    def _count_parse(self, outcome):
+        with self._parse_lock:
+            self._parse_stats[outcome] += 1
+
+    def _parse_scores(self, content):
+        """Extract clamped category scores and program name from a model response"""
+        return parse_scores(content)
+
+    def _parse_batch(self, content, count):
+        """Split a batched response into per-frame scores"""
+        return parse_batch(content, count)
+
+    def _parse_response(self, provider, content):
+        """Parse a model response into scores, or None if nothing could be recovered"""
         try:
-            if not self.openai_client:
-                raise ValueError("OpenAI client not initialized")
-
-            base64_image = base64.b64encode(image_bytes).decode('utf-8')
+            scores = self._parse_scores(content)
+        except ResponseParseError as e:
+            self.logger.warning(f"Failed to parse {provider} response: {str(e)}")
+            return None
+
+        if scores.get('partial'):
+            self.logger.warning(f"Salvaged a partial {provider} response")
+            self._count_parse('salvaged')
+        else:
+            self._count_parse('parsed')
+        return scores
+
+    def _can_reask(self, content):
+        """Re-ask only when enabled and the model actually said something"""
+        return bool(self.parser_settings.get('reask') and isinstance(content, str) and content.strip())
+
+    def parse_response(self, provider, content):
+        """Parse a model response into (scores, reask)
+
+        reask is None when scores is final. Otherwise the response was
+        malformed or only partly recovered: send the build_request-style
+        arguments in reask and pass the answer (None if it failed) and
+        scores to finish_reask. Re-asking is text only, so it costs a
+        fraction of the image request.
+        """
+        scores = self._parse_response(provider, content)
+        if scores is not None and not scores.get('partial'):
+            return scores, None
+        if not self._can_reask(content):
+            return self.finish_reask(provider, None, scores), None
+
+        self._count_parse('reasked')
+        return scores, self.build_reask_request(provider, content)
+
+    def _parse_or_reask(self, provider, content):
+        """Parse a response, asking the model once to reformat it if it was malformed"""
+        scores, reask = self.parse_response(provider, content)
+        if reask is None:
+            return scores
 
-            # Get selected model from config
-            model_settings = self.config.get_model_settings('openai')
-            model = model_settings.get('selected_model', 'gpt-4o-mini')
-
-            response = self.openai_client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role":"system",
-                        "content":"""You're NannyAI. A bot specialised in protecting children and minors from harmful content on the internet. 
-                                    You will be provided with screenshots to analyze for potentially harmful content. For each category (violence, adult, hate, drugs, gambling), 
-                                    provide a confidence score as a float between 0.0 and 1.0, and identify the program/application visible in the screenshot. 
-                                    Return the results in a JSON format using the following format:
-                                    {
-                                        'violence': 0.0,
-                                        'adult': 0.0,
-                                        'hate': 0.0,
-                                        'drugs': 0.0,
-                                        'gambling': 0.0,
-                                        'program_name': 'name_of_program'
-                                    }
-                                    """
-
-
-                    },
-                    {
-                        "role":"system",
-                        "content":"NannyAI, pay close attention to chats and emojis that might hint towards anything sexual or violent since a minor would be viewing them. They won't explicitly mention anything to trigger but the emojis and their order would implicitly mention this. For example: eggplant emoji with peach emoji, etc."
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": "NannyAI, please analyze this screenshot for potentially harmful content."
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=300,
-                response_format={ "type": "json_object" }
-            )
-
-            # Extract scores from response
-            try:
+        try:
+            if provider == 'openai':
+                response = self.openai_client.chat.completions.create(**reask)
                 content = response.choices[0].message.content
-                print (content)
-                content = json.loads(response.choices[0].message.content) if isinstance(content, str) else content
-                scores = {
-                    'violence': 0.0,
-                    'adult': 0.0,
-                    'hate': 0.0,
-                    'drugs': 0.0,
-                    'gambling': 0.0,
-                    'program_name': None  # Add program_name to track offending application
-                }
-
+            else:
+                content = self.gemini_model.generate_content(**reask).text
+        except Exception as e:
+            self.logger.error(f"{provider} re-ask failed: {str(e)}")
+            content = None
+
+        return self.finish_reask(provider, content, scores)
+
+    def finish_reask(self, provider, content, salvaged=None):
+        """Parse the answer to a re-ask, falling back to the salvaged scores; there is no second re-ask"""
+        scores = self._parse_response(provider, content) if content else None
+        if scores is None:
+            scores = salvaged
+        if scores is None:
+            self._count_parse('failed')
+            return {"error": "Failed to parse response"}
+        return scores
+
+    def _call_batch_api(self, prepared_list):
+        """Analyze several encoded frames in one request, returning one result per frame
+
+        With the router enabled the whole batch fails over (and is hedged)
+        across providers like a single frame.
+        """
+        if len(prepared_list) == 1:
+            return [self._analyze_prepared(prepared_list[0])]
+
+        if not self.router.enabled:
+            batch = self._call_batch_provider(self.provider, prepared_list)
+        else:
+            batch = self.router.call(prepared_list, {
+                'openai': lambda prepared_list: self._call_batch_provider('openai', prepared_list),
+                'gemini': lambda prepared_list: self._call_batch_provider('gemini', prepared_list)
+            })
+
+        if 'results' not in batch:
+            return [batch] * len(prepared_list)
+        if 'provider' in batch:
+            for result in batch['results']:
+                result.setdefault('provider', batch['provider'])
+        return batch['results']
+
+    def _call_batch_provider(self, provider, prepared_list):
+        """Call one provider for a batch within the shared rate limit, returning {'results': [...]} or an error dict"""
+        if not self.rate_limiter.enabled:
+            return self._request_batch(provider, prepared_list)
+        return self.rate_limiter.run(
+            provider,
+            sum(estimate_tokens(provider, prepared) for prepared in prepared_list),
+            [prepared.get('device_id') for prepared in prepared_list],
+            lambda prepared_list: self._request_batch(provider, prepared_list),
+            prepared_list
+        )
+
+    def _request_batch(self, provider, prepared_list):
+        """Send one batched request, returning {'results': [...]} or an error dict"""
+        try:
+            if provider == 'openai':
+                if not self.openai_client:
+                    raise ValueError("OpenAI client not initialized")
+                response = self.openai_client.chat.completions.create(
+                    **self._openai_batch_request(prepared_list)
+                )
+                content = response.choices[0].message.content
+                self.logger.debug(f"OpenAI batch response: {content}")
+            else:
+                if not self.gemini_model:
+                    raise ValueError("Gemini client not initialized")
+                parts = [GEMINI_PROMPT, BATCH_PROMPT.format(count=len(prepared_list))]
+                for number, prepared in enumerate(prepared_list, 1):
+                    parts.append(f"Screenshot {number}:")
+                    parts.append(self._gemini_image(prepared))
+                content = self.gemini_model.generate_content(
+                    parts, generation_config=self._gemini_generation_config(batch=True)
+                ).text
 
-                for key in scores.keys():
-                    if key in content and key != 'program_name':
-                        scores[key] += content[key]
+            return {'results': self._parse_batch(content, len(prepared_list))}
 
-                # Special case check for 'explicit' contributing to the 'adult' score
-                if 'explicit' in content:
-                    scores['adult'] += content['explicit']
+        except Exception as e:
+            self.logger.error(f"Batched {provider} API call failed: {str(e)}")
+            return self.api_error(e)
 
-                # Get program name if provided
-                if 'program_name' in content:
-                    scores['program_name'] = content['program_name']
+    def _call_openai_api(self, prepared):
+        """Call OpenAI Vision API for content analysis"""
+        try:
+            if not self.openai_client:
+                raise ValueError("OpenAI client not initialized")
 
-                return scores
+            response = self.openai_client.chat.completions.create(**self.build_request('openai', prepared))
 
-            except Exception as e:
-                self.logger.error(f"Failed to parse OpenAI response: {str(e)}")
-                return {"error": "Failed to parse response"}
+            # Extract scores from response
+            content = response.choices[0].message.content
+            self.logger.debug(f"OpenAI response: {content}")
+            return self._parse_or_reask('openai', content)
 
         except Exception as e:
             self.logger.error(f"OpenAI API call failed: {str(e)}")
-            return {"error": str(e)}
+            return self.api_error(e)
 
-    def _call_gemini_api(self, image_bytes):
+    def _call_gemini_api(self, prepared):
         """Call Google Gemini Vision API for content analysis"""
         try:
             if not self.gemini_model:
                 raise ValueError("Gemini client not initialized")
 
-            # Convert bytes to PIL Image for Gemini
-            image = Image.open(io.BytesIO(image_bytes))
-
-            prompt = """
-            You're NannyAI. A bot that specialised in protecting children and minors from harmful content on the internet. You will be provided with screenshots to analyze for potentially harmful content. For each category (violence, adult, hate, drugs, gambling), provide a confidence score as a float between 0.0 and 1.0 and identify the program/application visible in the screenshot. Return the results in a JSON format with these categories as keys. Example would be:
-            {
-                    'violence': 0.0,
-                    'adult': 0.0,
-                    'hate': 0.0,
-                    'drugs': 0.0,
-                    'gambling': 0.0,
-                    'program_name': 'name_of_program'
-            }.
-            NannyAI, pay close attention to chats and emojis that might hint towards anything sexual or violent since a minor would be viewing them. They won't explicitly mention anything to trigger but the emojis and their order would implicitly mention this. For example: eggplant emoji with peach emoji, etc.
-            NannyAI, please analyze this image for potentially harmful content.
-            """
-
-            response = self.gemini_model.generate_content([prompt, image])
+            response = self.gemini_model.generate_content(**self.build_request('gemini', prepared))
 
             # Extract scores from response
-            try:
-                content = response.text
-                content = json.loads(response.text) if isinstance(content, str) else content
-                scores = {
-                    'violence': 0.0,
-                    'adult': 0.0,
-                    'hate': 0.0,
-                    'drugs': 0.0,
-                    'gambling': 0.0,
-                    'program_name': None  # Add program_name to track offending application
-                }
-
-
-                for key in scores.keys():
-                    if key in content and key != 'program_name':
-                        scores[key] += content[key]
-
-                # Special case check for 'explicit' contributing to the 'adult' score
-                if 'explicit' in content:
-                    scores['adult'] += content['explicit']
-
-                # Get program name if provided
-                if 'program_name' in content:
-                    scores['program_name'] = content['program_name']
-
-                return scores
-
-            except Exception as e:
-                self.logger.error(f"Failed to parse Gemini response: {str(e)}")
-                return {"error": "Failed to parse response"}
+            return self._parse_or_reask('gemini', response.text)
 
         except Exception as e:
             self.logger.error(f"Gemini API call failed: {str(e)}")
-            return {"error": str(e)}
+            return self.api_error(e)
 
-    def _check_harmful_content(self, analysis):
-        """Check if content is harmful based on configured thresholds"""
+    def check_thresholds(self, analysis):
+        """Get the analysis if a monitored category reaches its configured threshold, else False"""
         if "error" in analysis:
             return False
 
+        # Salvaged scores may be misread, so they never alert or terminate programs
+        if analysis.get('partial'):
+            self.logger.warning("Ignoring partially parsed scores for alerting")
+            return False
+
         # Get configured thresholds
         thresholds = self.config.get('content_thresholds', {
             'violence': 0.7,
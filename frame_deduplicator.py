@@ -0,0 +1,132 @@
+import threading
+import numpy as np
+from PIL import Image
+from utils.logger import get_logger
+
+DEFAULT_DEDUP_SETTINGS = {
+    'enabled': True,
+    'hash_size': 8,
+    'max_distance': 4
+}
+
+class FrameDeduplicator:
+    """Per-device perceptual hash (dHash) stage used to skip unchanged frames"""
+
+    def __init__(self, config):
+        self.config = config
+        self.logger = get_logger(__name__)
+        self._lock = threading.Lock()
+        self._last_frames = {}
+        self._hashed_versions = {}
+        self._stats = {}
+
+    def _get_settings(self):
+        """Get dedup settings merged over the defaults"""
+        settings = dict(DEFAULT_DEDUP_SETTINGS)
+        settings.update(self.config.get('dedup_settings', {}))
+        return settings
+
+    def compute_hash(self, image, hash_size=8):
+        """Compute the difference hash of an image as an integer"""
+        small = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+        pixels = np.asarray(small)
+
+        # One bit per pixel brighter than its right neighbour, row by row, first bit most significant
+        bits = (pixels[:, :-1] > pixels[:, 1:]).ravel()
+        padding = -bits.size % 8
+        return int.from_bytes(np.packbits(bits).tobytes(), 'big') >> padding
+
+    def check_frame(self, device_id, image, content_version=None):
+        """Check a frame against the previous one for this device
+
+        Returns a tuple (frame_hash, distance, previous) where previous is the
+        stored record of the last analyzed frame if the new frame is considered
+        unchanged, otherwise None. distance is None when there is nothing to
+        compare against.
+
+        content_version identifies the image content when the capture source
+        tracks it (such as a VNC framebuffer); a frame with the same version as
+        the last hashed one reuses its hash instead of recomputing it.
+        """
+        settings = self._get_settings()
+        hash_size = int(settings.get('hash_size', 8))
+
+        frame_hash = None
+        if content_version is not None:
+            with self._lock:
+                hashed = self._hashed_versions.get(device_id)
+            if hashed and hashed[0] == content_version and hashed[1] == hash_size:
+                frame_hash = hashed[2]
+        if frame_hash is None:
+            frame_hash = self.compute_hash(image, hash_size)
+            if content_version is not None:
+                with self._lock:
+                    self._hashed_versions[device_id] = (content_version, hash_size, frame_hash)
+
+        if not settings.get('enabled', True):
+            return frame_hash, None, None
+
+        with self._lock:
+            last = self._last_frames.get(device_id)
+            stats = self._stats.setdefault(device_id, {'hits': 0, 'misses': 0})
+
+            if not last or last['hash_size'] != hash_size:
+                stats['misses'] += 1
+                return frame_hash, None, None
+
+            distance = (frame_hash ^ last['hash']).bit_count()
+            if distance <= int(settings.get('max_distance', 4)):
+                stats['hits'] += 1
+                return frame_hash, distance, dict(last)
+
+            stats['misses'] += 1
+            return frame_hash, distance, None
+
+    def change_score(self, distance):
+        """Normalize a Hamming distance to a 0.0-1.0 change score"""
+        if distance is None:
+            return None
+        hash_size = int(self._get_settings().get('hash_size', 8))
+        return min(distance / (hash_size * hash_size), 1.0)
+
+    def record_analysis(self, device_id, frame_hash, analysis, filename=None):
+        """Remember the analysis of the last analyzed frame for a device"""
+        settings = self._get_settings()
+        with self._lock:
+            self._last_frames[device_id] = {
+                'hash': frame_hash,
+                'hash_size': int(settings.get('hash_size', 8)),
+                'analysis': analysis,
+                'filename': filename
+            }
+
+    def attach_filename(self, device_id, frame_hash, filename):
+        """Attach the saved screenshot filename to the last analyzed frame"""
+        with self._lock:
+            last = self._last_frames.get(device_id)
+            if last and last['hash'] == frame_hash:
+                last['filename'] = filename
+
+    def reset(self, device_id=None):
+        """Forget the last frame for a device, or for all devices"""
+        with self._lock:
+            if device_id is None:
+                self._last_frames.clear()
+                self._hashed_versions.clear()
+            else:
+                self._last_frames.pop(device_id, None)
+                self._hashed_versions.pop(device_id, None)
+
+    def get_stats(self, device_id=None):
+        """Get skip (hit) and analyzed (miss) counters"""
+        with self._lock:
+            if device_id is not None:
+                stats = dict(self._stats.get(device_id, {'hits': 0, 'misses': 0}))
+            else:
+                stats = {
+                    'hits': sum(s['hits'] for s in self._stats.values()),
+                    'misses': sum(s['misses'] for s in self._stats.values())
+                }
+        total = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / total if total else 0.0
+        return stats
@@ -1,9 +1,13 @@
 import tkinter as tk
 from tkinter import ttk
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from PIL import Image, ImageTk
 import random
 
+# Decoded previews kept for instant re-selection
+PREVIEW_CACHE_SIZE = 64
+
 class DashboardWindow(ttk.Frame):
     def __init__(self, parent, screenshot_history):
         super().__init__(parent)
@@ -11,6 +15,7 @@ class DashboardWindow(ttk.Frame):
         self.current_page = 0
         self.items_per_page = 10
         self.current_image = None  # Keep reference to prevent garbage collection
+        self._previews = OrderedDict()
         
         self._create_widgets()
         self._load_history()
@@ -191,23 +196,14 @@ class DashboardWindow(ttk.Frame):
         item = selection[0]
         filename = self.history_list.item(item)['tags'][0]
         
-        # Load and display the screenshot
-        screenshot = self.screenshot_history.get_screenshot(filename)
-        if screenshot:
-            # Resize for preview
-            preview_size = (400, 300)
-            screenshot.thumbnail(preview_size, Image.LANCZOS)
-            
-            # Convert to PhotoImage
-            self.current_image = ImageTk.PhotoImage(screenshot)
+        # Load and display the screenshot preview
+        preview = self._get_preview(filename)
+        if preview:
+            self.current_image = preview
             self.preview_label.configure(image=self.current_image)
 
             # Update analysis details
-            entry = next(
-                (e for e in self.screenshot_history.get_history()
-                 if e['filename'] == filename),
-                None
-            )
+            entry = self.screenshot_history.get_entry(filename)
             
             self.details_text.configure(state=tk.NORMAL)
             self.details_text.delete(1.0, tk.END)
@@ -224,6 +220,22 @@ class DashboardWindow(ttk.Frame):
             
             self.details_text.configure(state=tk.DISABLED)
 
+    def _get_preview(self, filename):
+        """Get the PhotoImage preview of a screenshot from the LRU cache or its thumbnail"""
+        if filename in self._previews:
+            self._previews.move_to_end(filename)
+            return self._previews[filename]
+
+        thumbnail = self.screenshot_history.get_thumbnail(filename)
+        if thumbnail is None:
+            return None
+
+        preview = ImageTk.PhotoImage(thumbnail)
+        self._previews[filename] = preview
+        while len(self._previews) > PREVIEW_CACHE_SIZE:
+            self._previews.popitem(last=False)
+        return preview
+
     def _delete_current(self):
         """Delete the currently selected screenshot"""
         selection = self.history_list.selection()
@@ -234,6 +246,7 @@ class DashboardWindow(ttk.Frame):
         filename = self.history_list.item(item)['tags'][0]
         
         if self.screenshot_history.delete_screenshot(filename):
+            self._previews.pop(filename, None)
             self.history_list.delete(item)
             self.preview_label.configure(image='')
             self.details_text.configure(state=tk.NORMAL)
@@ -248,12 +261,7 @@ class DashboardWindow(ttk.Frame):
 
     def _next_page(self):
         """Show next page of history"""
-        # Get entries for next page
-        entries = self.screenshot_history.get_history(
-            limit=self.items_per_page,
-            offset=(self.current_page + 1) * self.items_per_page
-        )
         # Check if there are entries in the next page before incrementing
-        if len(entries) > 0:
+        if (self.current_page + 1) * self.items_per_page < self.screenshot_history.count():
             self.current_page += 1
             self._load_history()
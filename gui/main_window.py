@@ -4,8 +4,9 @@ from .settings_window import SettingsWindow
 from .dashboard_window import DashboardWindow
 from .device_window import DeviceWindow
 from .styles import apply_styles
-from report_generator import ReportGenerator
-from datetime import datetime, timedelta
+from report_generator import ReportGenerator, REPORT_PERIODS, period_range
+from report_jobs import ReportJobRunner
+from report_scheduler import ReportScheduler
 import os
 import subprocess
 import platform
@@ -43,8 +44,20 @@ class MainWindow:
         self.notification_mgr = notification_mgr
         self.report_generator = ReportGenerator(
             screenshot_mgr.history_manager,
-            screenshot_mgr.device_manager
+            screenshot_mgr.device_manager,
+            config
         )
+        # Reports build on worker threads; progress comes back through root.after
+        self.report_runner = ReportJobRunner(self.report_generator, root, config.get('report_jobs'))
+        self._report_rows = {}
+        # Standard periods are pre-built while idle so opening them is instant
+        self.report_scheduler = ReportScheduler(
+            self.report_generator,
+            self.report_runner,
+            screenshot_mgr.device_manager,
+            config.get('report_schedule')
+        )
+        self.report_scheduler.start()
 
         self.root.title("NannyAI")
         self.root.geometry("800x600")
@@ -157,10 +170,7 @@ class MainWindow:
             period_frame,
             self.period_var,
             "last_7_days",
-            "last_7_days",
-            "last_30_days",
-            "today",
-            "yesterday"
+            *REPORT_PERIODS
         )
         period_menu.pack(side=tk.LEFT, padx=5)
 
@@ -185,6 +195,10 @@ class MainWindow:
             command=self._generate_report
         ).pack(pady=5)
 
+        # One row per report being built
+        self.report_jobs_frame = ttk.Frame(report_frame)
+        self.report_jobs_frame.pack(fill=tk.X)
+
         # Debug Mode Frame
         debug_frame = ttk.LabelFrame(parent, text="Debug Options", padding=10)
         debug_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -306,52 +320,95 @@ class MainWindow:
             return False
 
     def _generate_report(self):
-        end_date = datetime.now()
         period = self.period_var.get()
-        
-        if period == "last_7_days":
-            start_date = end_date - timedelta(days=7)
-        elif period == "last_30_days":
-            start_date = end_date - timedelta(days=30)
-        elif period == "today":
-            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        elif period == "yesterday":
-            end_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            start_date = end_date - timedelta(days=1)
-
         device_id = None if self.report_device_var.get() == "all" else self.report_device_var.get()
 
-        report_path = self.report_generator.generate_report(start_date, end_date, device_id)
-        
+        # The same report is already being built; its row shows the progress
+        key = (period, device_id)
+        if key in self._report_rows:
+            return
+
+        # Nothing new since the pre-built copy, so open it straight away
+        report_path = self.report_scheduler.lookup(period, device_id)
         if report_path:
-            if messagebox.askyesno(
-                "Report Generated",
-                f"Report generated successfully.\nWould you like to open it?"
-            ):
-                if not self._open_pdf(report_path):
-                    save_path = filedialog.asksaveasfilename(
-                        defaultextension=".pdf",
-                        initialfile=os.path.basename(report_path),
-                        filetypes=[("PDF files", "*.pdf")]
-                    )
-                    if save_path:
-                        try:
-                            import shutil
-                            shutil.copy2(report_path, save_path)
-                            messagebox.showinfo(
-                                "Success",
-                                f"Report saved to:\n{save_path}"
-                            )
-                        except Exception:
-                            messagebox.showerror(
-                                "Error",
-                                "Failed to save report to selected location"
-                            )
-        else:
+            self._offer_report(report_path)
+            return
+
+        self.report_scheduler.note_activity()
+        start_date, end_date = period_range(period)
+        job = self.report_runner.submit(
+            start_date,
+            end_date,
+            device_id,
+            key=key,
+            on_progress=self._on_report_progress,
+            on_done=self._on_report_done
+        )
+        job.add_listeners(on_done=self.report_scheduler.record)
+        self._add_report_row(job, period, device_id)
+
+    def _add_report_row(self, job, period, device_id):
+        """Show a progress bar and Cancel button for a running report"""
+        device = self.screenshot_mgr.device_manager.get_device(device_id) if device_id else None
+        title = f"{period.replace('_', ' ').capitalize()} - {device.name if device else 'All Devices'}"
+
+        row = ttk.Frame(self.report_jobs_frame)
+        row.pack(fill=tk.X, pady=2)
+        label = ttk.Label(row, text=f"{title}: {job.message}", width=40)
+        label.pack(side=tk.LEFT, padx=5)
+        bar = ttk.Progressbar(row, mode='determinate', maximum=100, length=150)
+        bar.pack(side=tk.LEFT, padx=5)
+        ttk.Button(
+            row,
+            text="Cancel",
+            command=lambda: self.report_runner.cancel(job.key)
+        ).pack(side=tk.LEFT, padx=5)
+        self._report_rows[job.key] = (row, label, bar, title)
+
+    def _on_report_progress(self, job):
+        if job.key in self._report_rows:
+            _, label, bar, title = self._report_rows[job.key]
+            label.config(text=f"{title}: {job.message}")
+            bar['value'] = job.progress * 100
+
+    def _on_report_done(self, job):
+        row = self._report_rows.pop(job.key, None)
+        if row:
+            row[0].destroy()
+
+        if job.status == 'done':
+            self._offer_report(job.path)
+        elif job.status == 'failed':
             messagebox.showerror(
                 "Error",
                 "Failed to generate report"
             )
 
+    def _offer_report(self, report_path):
+        """Offer to open a finished report, or save a copy if it cannot be opened"""
+        if messagebox.askyesno(
+            "Report Generated",
+            f"Report generated successfully.\nWould you like to open it?"
+        ):
+            if not self._open_pdf(report_path):
+                save_path = filedialog.asksaveasfilename(
+                    defaultextension=".pdf",
+                    initialfile=os.path.basename(report_path),
+                    filetypes=[("PDF files", "*.pdf")]
+                )
+                if save_path:
+                    try:
+                        import shutil
+                        shutil.copy2(report_path, save_path)
+                        messagebox.showinfo(
+                            "Success",
+                            f"Report saved to:\n{save_path}"
+                        )
+                    except Exception:
+                        messagebox.showerror(
+                            "Error",
+                            "Failed to save report to selected location"
+                        )
+
     def _open_settings(self):
         SettingsWindow(self.root, self.config)
@@ -276,54 +276,56 @@ class SettingsWindow(tk.Toplevel):
             if not self._validate_api_keys():
                 return
 
-            # Save API keys
-            self.config.set_api_key('openai', self.openai_key_var.get())
-            self.config.set_api_key('gemini', self.gemini_key_var.get())
+            # Apply everything as one change so clients reload once
+            with self.config.batch_changes():
+                # Save API keys
+                self.config.set_api_key('openai', self.openai_key_var.get())
+                self.config.set_api_key('gemini', self.gemini_key_var.get())
             
-            # Save selected models
-            self.config.set_selected_model('openai', self.openai_model_var.get())
-            self.config.set_selected_model('gemini', self.gemini_model_var.get())
+                # Save selected models
+                self.config.set_selected_model('openai', self.openai_model_var.get())
+                self.config.set_selected_model('gemini', self.gemini_model_var.get())
             
-            # Save interval
-            interval = int(self.interval_var.get())
-            self.config.set('screenshot_interval', interval)
+                # Save interval
+                interval = int(self.interval_var.get())
+                self.config.set('screenshot_interval', interval)
             
-            # Save vision provider
-            self.config.set('vision_provider', self.provider_var.get())
+                # Save vision provider
+                self.config.set('vision_provider', self.provider_var.get())
             
-            # Save monitored categories
-            monitored_categories = [
-                category for category, var in self.category_vars.items()
-                if var.get()
-            ]
-            self.config.set('monitored_categories', monitored_categories)
+                # Save monitored categories
+                monitored_categories = [
+                    category for category, var in self.category_vars.items()
+                    if var.get()
+                ]
+                self.config.set('monitored_categories', monitored_categories)
             
-            # Save thresholds
-            thresholds = {}
-            for category, var in self.threshold_vars.items():
-                try:
-                    value = float(var.get())
-                    if 0 <= value <= 1:
-                        thresholds[category] = value
-                    else:
-                        raise ValueError(f"Threshold for {category} must be between 0 and 1")
-                except ValueError as e:
-                    messagebox.showerror(
-                        "Error",
-                        str(e)
-                    )
-                    return
-            self.config.set('content_thresholds', thresholds)
+                # Save thresholds
+                thresholds = {}
+                for category, var in self.threshold_vars.items():
+                    try:
+                        value = float(var.get())
+                        if 0 <= value <= 1:
+                            thresholds[category] = value
+                        else:
+                            raise ValueError(f"Threshold for {category} must be between 0 and 1")
+                    except ValueError as e:
+                        messagebox.showerror(
+                            "Error",
+                            str(e)
+                        )
+                        return
+                self.config.set('content_thresholds', thresholds)
             
-            # Save email settings
-            email_settings = {
-                        'smtp_server': self.smtp_server_var.get(),
-                        'smtp_port': self.smtp_port_var.get(),
-                        'sender_email': self.sender_email_var.get(),
-                        'sender_password': self.sender_password_var.get(),
-                        'parent_email': self.parent_email_var.get()
-                    }
-            self.config.set('email_settings', email_settings)
+                # Save email settings
+                email_settings = {
+                            'smtp_server': self.smtp_server_var.get(),
+                            'smtp_port': self.smtp_port_var.get(),
+                            'sender_email': self.sender_email_var.get(),
+                            'sender_password': self.sender_password_var.get(),
+                            'parent_email': self.parent_email_var.get()
+                        }
+                self.config.set('email_settings', email_settings)
             
             self.destroy()
         except ValueError:
@@ -0,0 +1,416 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from utils.logger import get_logger
+from history_store import SCORE_CATEGORIES, entry_scores
+
+# Score at or above which a category counts as an alert in reports
+ALERT_THRESHOLD = 0.7
+
+ROLLUP_FORMAT = 4
+
+DEFAULT_ROLLUP_SETTINGS = {
+    'save_delay': 5.0,
+    'compact_records': 500
+}
+
+def _empty_bucket():
+    return {
+        'count': 0,
+        'alerts': 0,
+        'category_alerts': {category: 0 for category in SCORE_CATEGORIES},
+        'max': {category: 0.0 for category in SCORE_CATEGORIES}
+    }
+
+def _add_to_bucket(bucket, scores):
+    bucket['count'] += 1
+    alerted = False
+    for category, score in scores.items():
+        if score is None:
+            continue
+        bucket['max'][category] = max(bucket['max'][category], score)
+        if score >= ALERT_THRESHOLD:
+            bucket['category_alerts'][category] += 1
+            alerted = True
+    if alerted:
+        bucket['alerts'] += 1
+
+def _copy_bucket(bucket):
+    return {
+        'count': bucket['count'],
+        'alerts': bucket['alerts'],
+        'category_alerts': dict(bucket['category_alerts']),
+        'max': dict(bucket['max'])
+    }
+
+def _entry_hash(filename, timestamp, scores):
+    """Hash of what a report sees of an entry, so replacing it changes the hash"""
+    content = json.dumps([filename, timestamp, list(scores)])
+    return int.from_bytes(hashlib.blake2b(content.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def merge_buckets(buckets):
+    """Sum counts and take the maxima of several buckets"""
+    merged = _empty_bucket()
+    for bucket in buckets:
+        merged['count'] += bucket['count']
+        merged['alerts'] += bucket['alerts']
+        for category in SCORE_CATEGORIES:
+            merged['category_alerts'][category] += bucket['category_alerts'][category]
+            merged['max'][category] = max(merged['max'][category], bucket['max'][category])
+    return merged
+
+class HistoryRollups:
+    """Per-device hourly and daily aggregates of the screenshot history
+
+    Each bucket holds the screenshot count, the number of screenshots with
+    an alert, and per-category alert counts and maximum scores. Buckets are
+    updated as entries are added, so report queries cost O(days) instead of
+    O(screenshots). Removing an entry marks its buckets stale; they are
+    recomputed from the history store the next time they are read.
+
+    Rollups are saved to a JSON Lines file at most every save_delay
+    seconds. The first line is a snapshot of every bucket and each save
+    appends only the buckets changed since the last one; the file is
+    rewritten as a single snapshot once compact_records updates have
+    piled up. Writes happen outside the rollup lock, which is only held to
+    copy the changes. The rollups are rebuilt from the store when the file
+    is missing or out of step with it.
+
+    The data version of a device (and '*' for all devices) is a 64-bit
+    fingerprint of the entries in the store (filename, timestamp and
+    scores), so it survives restarts and lost rollup files, and changes
+    when an entry is added, removed or replaced with different scores.
+    """
+
+    def __init__(self, rollup_file, store, settings=None):
+        self.logger = get_logger(__name__)
+        self.rollup_file = rollup_file
+        self.store = store
+        self.settings = dict(DEFAULT_ROLLUP_SETTINGS)
+        self.settings.update(settings or {})
+        self._lock = threading.RLock()
+        self._file_lock = threading.Lock()
+        self._hours = {}
+        self._days = {}
+        self._stale = set()
+        self._fingerprints = {}
+        self._entry_count = 0
+        self._dirty = set()
+        self._records = 0
+        self._save_timer = None
+
+        # Unsaved changes are lost if the app is killed, so check the file against the store
+        if not self._load() or self._nonzero(self._fingerprints) != self._nonzero(self._store_fingerprints()):
+            self.rebuild()
+
+    @staticmethod
+    def _device_key(device_id):
+        # JSON object keys must be strings
+        return device_id or ''
+
+    @staticmethod
+    def _scores(entry):
+        return dict(zip(SCORE_CATEGORIES, entry_scores(entry)))
+
+    @staticmethod
+    def _hash(entry):
+        return _entry_hash(entry['filename'], entry['timestamp'], entry_scores(entry))
+
+    def _load(self):
+        """Replay the saved snapshot and updates, returning False if there are none usable"""
+        try:
+            if not os.path.exists(self.rollup_file):
+                return False
+            with open(self.rollup_file, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn last line leaves the fingerprints behind the store, forcing a rebuild
+                        self.logger.warning(f"Skipping corrupt history rollup line {line_number}")
+                        continue
+                    if self._records == 0 and (record.get('op') != 'snapshot' or record.get('format') != ROLLUP_FORMAT):
+                        return False
+                    self._apply(record)
+                    self._records += 1
+            return self._records > 0
+        except Exception as e:
+            self.logger.error(f"Failed to load history rollups: {str(e)}")
+            return False
+
+    def _apply(self, record):
+        """Apply a saved snapshot or update record"""
+        if record['op'] == 'snapshot':
+            self._hours = {}
+            self._days = {}
+        for table, changes in ((self._hours, record['hours']), (self._days, record['days'])):
+            for device_key, buckets in changes.items():
+                target = table.setdefault(device_key, {})
+                for key, bucket in buckets.items():
+                    if bucket is None:
+                        target.pop(key, None)
+                    else:
+                        target[key] = bucket
+        self._fingerprints = record['fingerprints']
+        self._entry_count = record['entries']
+        self._stale = {tuple(key) for key in record['stale']}
+
+    def _snapshot(self, compact):
+        """Copy every bucket, or only the changed ones, into a record (caller holds the lock)"""
+        hours, days = {}, {}
+        if compact:
+            for table, copy in ((self._hours, hours), (self._days, days)):
+                for device_key, buckets in table.items():
+                    copy[device_key] = {key: _copy_bucket(bucket) for key, bucket in buckets.items()}
+        else:
+            for device_key, key in self._dirty:
+                table, copy = (self._hours, hours) if len(key) == 13 else (self._days, days)
+                bucket = table.get(device_key, {}).get(key)
+                copy.setdefault(device_key, {})[key] = _copy_bucket(bucket) if bucket else None
+        self._dirty = set()
+
+        record = {
+            'op': 'snapshot' if compact else 'update',
+            'entries': self._entry_count,
+            'fingerprints': dict(self._fingerprints),
+            'stale': sorted(self._stale),
+            'hours': hours,
+            'days': days
+        }
+        if compact:
+            record['format'] = ROLLUP_FORMAT
+        return record
+
+    def _save(self, compact=False):
+        """Append the changed buckets, or rewrite the file as one snapshot
+
+        Only copying the changes happens under the rollup lock; _file_lock
+        keeps the records in the order they were taken.
+        """
+        with self._file_lock:
+            with self._lock:
+                self._save_timer = None
+                compact = compact or self._records == 0 or self._records > int(self.settings['compact_records'])
+                if not compact and not self._dirty:
+                    return
+                record = self._snapshot(compact)
+
+            try:
+                line = json.dumps(record) + "\n"
+                if compact:
+                    temp_file = f"{self.rollup_file}.tmp"
+                    with open(temp_file, 'w', encoding='utf-8') as f:
+                        f.write(line)
+                    os.replace(temp_file, self.rollup_file)
+                    self._records = 1
+                else:
+                    with open(self.rollup_file, 'a', encoding='utf-8') as f:
+                        f.write(line)
+                    self._records += 1
+            except Exception as e:
+                self.logger.error(f"Failed to save history rollups: {str(e)}")
+                # The changes in this record were not written, so the next save rewrites everything
+                self._records = 0
+
+    def _schedule_save(self):
+        """Save once save_delay seconds after the first unsaved change (caller holds the lock)"""
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(float(self.settings['save_delay']), self._save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _store_fingerprints(self):
+        fingerprints = {}
+        for filename, device_id, timestamp, scores in self.store.entry_keys():
+            self._toggle(fingerprints, self._device_key(device_id), _entry_hash(filename, timestamp, scores))
+        return fingerprints
+
+    @staticmethod
+    def _nonzero(fingerprints):
+        # A device whose entries were all deleted is back to 0
+        return {key: value for key, value in fingerprints.items() if value}
+
+    @staticmethod
+    def _toggle(fingerprints, device_key, value):
+        """Add or remove an entry hash from the device and overall fingerprints"""
+        for key in (device_key, '*'):
+            fingerprints[key] = fingerprints.get(key, 0) ^ value
+
+    def rebuild(self):
+        """Recompute every bucket from the history store"""
+        with self._lock:
+            self._hours = {}
+            self._days = {}
+            self._stale = set()
+            self._fingerprints = {}
+            self._entry_count = 0
+            for entry in self.store.entries_between():
+                self._add(entry)
+            self.logger.info(f"Rebuilt history rollups from {self._entry_count} entries")
+        self._save(compact=True)
+
+    def _add(self, entry):
+        device_key = self._device_key(entry.get('device_id'))
+        timestamp = entry['timestamp']
+        scores = self._scores(entry)
+        hours = self._hours.setdefault(device_key, {})
+        days = self._days.setdefault(device_key, {})
+        _add_to_bucket(hours.setdefault(timestamp[:13], _empty_bucket()), scores)
+        _add_to_bucket(days.setdefault(timestamp[:10], _empty_bucket()), scores)
+        self._dirty.add((device_key, timestamp[:13]))
+        self._dirty.add((device_key, timestamp[:10]))
+        self._toggle(self._fingerprints, device_key, self._hash(entry))
+        self._entry_count += 1
+
+    def add(self, entry):
+        """Count a newly saved history entry"""
+        with self._lock:
+            self._add(entry)
+            self._schedule_save()
+
+    def remove(self, entry):
+        """Uncount a deleted history entry; its buckets are recomputed on next read"""
+        with self._lock:
+            device_key = self._device_key(entry.get('device_id'))
+            timestamp = entry['timestamp']
+            self._stale.add((device_key, timestamp[:13]))
+            self._stale.add((device_key, timestamp[:10]))
+            self._entry_count -= 1
+            self._toggle(self._fingerprints, device_key, self._hash(entry))
+            self._schedule_save()
+
+    def _refresh(self, device_key, key):
+        """Recompute a stale hour ('YYYY-MM-DDTHH') or day ('YYYY-MM-DD') bucket"""
+        self._stale.discard((device_key, key))
+        if len(key) == 13:
+            start = datetime.strptime(key, '%Y-%m-%dT%H')
+            end = start + timedelta(hours=1)
+            buckets = self._hours.setdefault(device_key, {})
+        else:
+            start = datetime.strptime(key, '%Y-%m-%d')
+            end = start + timedelta(days=1)
+            buckets = self._days.setdefault(device_key, {})
+
+        bucket = _empty_bucket()
+        for entry in self.store.entries_between(start, end - timedelta(microseconds=1), device_id=device_key or None):
+            # The store matches None for device_id=None, so filter untagged entries here
+            if self._device_key(entry.get('device_id')) == device_key:
+                _add_to_bucket(bucket, self._scores(entry))
+        if bucket['count']:
+            buckets[key] = bucket
+        else:
+            buckets.pop(key, None)
+        self._dirty.add((device_key, key))
+        self._schedule_save()
+
+    def _bucket(self, device_key, key):
+        if (device_key, key) in self._stale:
+            self._refresh(device_key, key)
+        table = self._hours if len(key) == 13 else self._days
+        return table.get(device_key, {}).get(key)
+
+    def _device_keys(self, device_id):
+        if device_id is not None:
+            return [self._device_key(device_id)]
+        return list(set(self._days) | {device_key for device_key, _ in self._stale})
+
+    def _clipped(self, start, end, device_id):
+        """Bucket for a part of an hour, counted from the history store"""
+        bucket = _empty_bucket()
+        for entry in self.store.entries_between(start, end, device_id=device_id):
+            _add_to_bucket(bucket, self._scores(entry))
+        return bucket
+
+    def _hour_bucket(self, device_keys, device_id, hour, start, end):
+        """Bucket for the hour starting at hour, limited to start..end"""
+        hour_end = hour + timedelta(hours=1) - timedelta(microseconds=1)
+        if start <= hour and hour_end <= end:
+            key = hour.strftime('%Y-%m-%dT%H')
+            buckets = [bucket for device_key in device_keys for bucket in [self._bucket(device_key, key)] if bucket]
+            return merge_buckets(buckets) if buckets else None
+        # Only part of the hour is in range, so its bucket would overcount
+        bucket = self._clipped(max(start, hour), min(end, hour_end), device_id)
+        return bucket if bucket['count'] else None
+
+    def _day_buckets(self, device_keys, device_id, day, start, end):
+        """Buckets covering day within start..end: the day bucket if whole, else hour buckets"""
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+        if start <= day_start and day_end - timedelta(microseconds=1) <= end:
+            key = day.isoformat()
+            return [bucket for device_key in device_keys for bucket in [self._bucket(device_key, key)] if bucket]
+
+        buckets = []
+        hour = max(start, day_start).replace(minute=0, second=0, microsecond=0)
+        while hour < day_end and hour <= end:
+            bucket = self._hour_bucket(device_keys, device_id, hour, start, end)
+            if bucket:
+                buckets.append(bucket)
+            hour += timedelta(hours=1)
+        return buckets
+
+    def daily(self, start, end, device_id=None):
+        """Get [(date, bucket)] for days in start <= timestamp <= end with any screenshots
+
+        Whole days and hours come from the rollups; hours only partly inside
+        the range are counted from the history store, so the totals match
+        the store exactly.
+        """
+        with self._lock:
+            device_keys = self._device_keys(device_id)
+            result = []
+            day = start.date()
+            while day <= end.date():
+                buckets = self._day_buckets(device_keys, device_id, day, start, end)
+                if buckets:
+                    result.append((day, merge_buckets(buckets)))
+                day += timedelta(days=1)
+            return result
+
+    def hourly(self, start, end, device_id=None):
+        """Get {'YYYY-MM-DDTHH': bucket} for hours in start <= timestamp <= end with any screenshots"""
+        with self._lock:
+            device_keys = self._device_keys(device_id)
+            result = {}
+            hour = start.replace(minute=0, second=0, microsecond=0)
+            while hour <= end:
+                bucket = self._hour_bucket(device_keys, device_id, hour, start, end)
+                if bucket:
+                    result[hour.strftime('%Y-%m-%dT%H')] = bucket
+                hour += timedelta(hours=1)
+            return result
+
+    def summary(self, start, end, device_id=None):
+        """Get one bucket totalling start..end"""
+        return merge_buckets(bucket for _, bucket in self.daily(start, end, device_id))
+
+    def by_device(self, start, end):
+        """Get {device_id: bucket} totalling start..end for each tagged device"""
+        with self._lock:
+            devices = [device_key for device_key in self._device_keys(None) if device_key]
+        result = {}
+        for device_key in devices:
+            bucket = self.summary(start, end, device_key)
+            if bucket['count']:
+                result[device_key] = bucket
+        return result
+
+    def version(self, device_id=None):
+        """Data version that changes whenever history changes, overall or for one device"""
+        with self._lock:
+            key = '*' if device_id is None else self._device_key(device_id)
+            return f"{self._fingerprints.get(key, 0):016x}"
+
+    def close(self):
+        """Save pending changes"""
+        with self._lock:
+            pending = self._save_timer is not None
+            if pending:
+                self._save_timer.cancel()
+        if pending:
+            self._save()
@@ -0,0 +1,547 @@
+import os
+import json
+import sqlite3
+import time
+import bisect
+import itertools
+import threading
+from utils.logger import get_logger
+
+SCORE_CATEGORIES = ('violence', 'adult', 'hate', 'drugs', 'gambling')
+
+DEFAULT_JOURNAL_SETTINGS = {
+    'fsync_batch_size': 20,
+    'fsync_interval': 1.0,
+    'compact_ratio': 0.3,
+    'compact_min_records': 100,
+    'compact_check_interval': 30
+}
+
+def entry_scores(entry):
+    """Get an entry's scores as floats (or None) in SCORE_CATEGORIES order"""
+    analysis = entry.get('analysis') or {}
+    scores = []
+    for category in SCORE_CATEGORIES:
+        try:
+            scores.append(float(analysis.get(category)))
+        except (TypeError, ValueError):
+            scores.append(None)
+    return tuple(scores)
+
+def _timestamp_bound(value):
+    """Turn a datetime or ISO string range bound into a comparable ISO string"""
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+class HistoryIndex:
+    """In-memory history kept sorted by timestamp on insert
+
+    Entries are ordered by (timestamp, insertion sequence) in one global list
+    and one list per device, with a filename -> entry map for lookups, so
+    paginated queries cost O(log N + k) instead of a full sort.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self._keys = {}
+        self._sorted = []
+        self._by_device = {}
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry):
+        """Insert an entry, replacing any entry with the same filename"""
+        filename = entry['filename']
+        self.remove(filename)
+
+        key = (entry['timestamp'], next(self._sequence), filename)
+        self.entries[filename] = entry
+        self._keys[filename] = key
+        bisect.insort(self._sorted, key)
+        bisect.insort(self._by_device.setdefault(entry.get('device_id'), []), key)
+
+    def remove(self, filename):
+        """Remove an entry, returning it or None if it was not indexed"""
+        entry = self.entries.pop(filename, None)
+        if entry is None:
+            return None
+
+        key = self._keys.pop(filename)
+        self._delete_key(self._sorted, key)
+        device_keys = self._by_device.get(entry.get('device_id'))
+        if device_keys is not None:
+            self._delete_key(device_keys, key)
+            if not device_keys:
+                del self._by_device[entry.get('device_id')]
+        return entry
+
+    @staticmethod
+    def _delete_key(keys, key):
+        index = bisect.bisect_left(keys, key)
+        if index < len(keys) and keys[index] == key:
+            del keys[index]
+
+    def _keys_for(self, device_id):
+        if device_id:
+            return self._by_device.get(device_id, [])
+        return self._sorted
+
+    def query(self, limit=None, offset=0, device_id=None):
+        """Get entries newest first, optionally for a single device"""
+        keys = self._keys_for(device_id)
+        end = max(len(keys) - offset, 0)
+        start = max(end - limit, 0) if limit else 0
+        return [self.entries[key[2]] for key in reversed(keys[start:end])]
+
+    def get(self, filename):
+        """Get a single entry by filename"""
+        return self.entries.get(filename)
+
+    def count(self, device_id=None):
+        """Count entries, optionally for a single device"""
+        return len(self._keys_for(device_id))
+
+    def device_entries(self, device_id):
+        """Get entries for a device, oldest first"""
+        return [self.entries[key[2]] for key in self._by_device.get(device_id, [])]
+
+    def entry_keys(self):
+        """Get (filename, device_id, timestamp, scores) for every entry"""
+        return [
+            (filename, entry.get('device_id'), entry['timestamp'], entry_scores(entry))
+            for filename, entry in self.entries.items()
+        ]
+
+    def between(self, start=None, end=None, device_id=None):
+        """Get entries with start <= timestamp <= end, oldest first"""
+        keys = self._keys_for(device_id)
+        start, end = _timestamp_bound(start), _timestamp_bound(end)
+        low = bisect.bisect_left(keys, (start,)) if start is not None else 0
+        high = bisect.bisect_right(keys, (end, float('inf'))) if end is not None else len(keys)
+        return [self.entries[key[2]] for key in keys[low:high]]
+
+class JSONHistoryStore:
+    """Screenshot history kept in memory and rewritten to a single JSON file"""
+
+    def __init__(self, history_file):
+        self.logger = get_logger(__name__)
+        self.history_file = history_file
+        self.index = HistoryIndex()
+        self._load_history()
+        for entry in self.history:
+            self.index.add(entry)
+
+    def _load_history(self):
+        """Load screenshot history from JSON file"""
+        try:
+            if os.path.exists(self.history_file):
+                with open(self.history_file, 'r') as f:
+                    self.history = json.load(f)
+            else:
+                self.history = []
+        except Exception as e:
+            self.logger.error(f"Failed to load history: {str(e)}")
+            self.history = []
+
+    def _save_history(self):
+        """Save screenshot history to JSON file"""
+        try:
+            with open(self.history_file, 'w') as f:
+                json.dump(self.history, f, indent=4)
+        except Exception as e:
+            self.logger.error(f"Failed to save history: {str(e)}")
+
+    def add(self, entry):
+        """Add a history entry"""
+        self.history.append(entry)
+        self.index.add(entry)
+        self._save_history()
+
+    def remove(self, filename):
+        """Remove the history entry for a screenshot"""
+        self.history = [
+            entry for entry in self.history
+            if entry['filename'] != filename
+        ]
+        self.index.remove(filename)
+        self._save_history()
+
+    def query(self, limit=None, offset=0, device_id=None):
+        """Get entries newest first, optionally for a single device"""
+        return self.index.query(limit=limit, offset=offset, device_id=device_id)
+
+    def get_entry(self, filename):
+        """Get a single entry by filename"""
+        return self.index.get(filename)
+
+    def count(self, device_id=None):
+        """Count entries, optionally for a single device"""
+        return self.index.count(device_id)
+
+    def get_device_entries(self, device_id):
+        """Get entries for a device, oldest first"""
+        return self.index.device_entries(device_id)
+
+    def entries_between(self, start=None, end=None, device_id=None):
+        """Get entries with start <= timestamp <= end, oldest first"""
+        return self.index.between(start, end, device_id)
+
+    def entry_keys(self):
+        """Get (filename, device_id, timestamp, scores) for every entry"""
+        return self.index.entry_keys()
+
+    def close(self):
+        """Nothing to release for the JSON store"""
+        pass
+
+class SQLiteHistoryStore:
+    """Screenshot history stored in an indexed SQLite database (WAL mode)"""
+
+    def __init__(self, db_path, legacy_json_file=None):
+        self.logger = get_logger(__name__)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+        if legacy_json_file and os.path.exists(legacy_json_file):
+            self._migrate_json(legacy_json_file)
+
+    def _create_schema(self):
+        """Create the history table and its indexes"""
+        score_columns = ", ".join(f"{category} REAL" for category in SCORE_CATEGORIES)
+        with self._lock:
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS screenshots (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    filename TEXT NOT NULL UNIQUE,
+                    filepath TEXT,
+                    timestamp TEXT NOT NULL,
+                    device_id TEXT,
+                    device_name TEXT,
+                    {score_columns},
+                    entry TEXT NOT NULL
+                )
+            """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_screenshots_timestamp ON screenshots (timestamp)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_screenshots_device ON screenshots (device_id, timestamp)"
+            )
+            for category in SCORE_CATEGORIES:
+                self.conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_screenshots_{category} ON screenshots ({category})"
+                )
+
+    def _migrate_json(self, json_file):
+        """One-shot import of a legacy history.json file"""
+        try:
+            with open(json_file, 'r') as f:
+                entries = json.load(f)
+
+            with self._lock:
+                self.conn.execute("BEGIN")
+                try:
+                    self.conn.executemany(self._insert_sql(), [self._row(entry) for entry in entries])
+                    self.conn.execute("COMMIT")
+                except Exception:
+                    self.conn.execute("ROLLBACK")
+                    raise
+
+            os.replace(json_file, f"{json_file}.migrated")
+            self.logger.info(f"Migrated {len(entries)} history entries from {json_file}")
+        except Exception as e:
+            self.logger.error(f"Failed to migrate history from {json_file}: {str(e)}")
+
+    @staticmethod
+    def _insert_sql():
+        columns = ", ".join(SCORE_CATEGORIES)
+        placeholders = ", ".join("?" for _ in SCORE_CATEGORIES)
+        return (
+            "INSERT OR REPLACE INTO screenshots "
+            f"(filename, filepath, timestamp, device_id, device_name, {columns}, entry) "
+            f"VALUES (?, ?, ?, ?, ?, {placeholders}, ?)"
+        )
+
+    def _row(self, entry):
+        return (
+            entry['filename'],
+            entry.get('filepath'),
+            entry['timestamp'],
+            entry.get('device_id'),
+            entry.get('device_name'),
+            *entry_scores(entry),
+            json.dumps(entry)
+        )
+
+    def add(self, entry):
+        """Insert a history entry"""
+        with self._lock:
+            self.conn.execute(self._insert_sql(), self._row(entry))
+
+    def remove(self, filename):
+        """Remove the history entry for a screenshot"""
+        with self._lock:
+            self.conn.execute("DELETE FROM screenshots WHERE filename = ?", (filename,))
+
+    def query(self, limit=None, offset=0, device_id=None):
+        """Get entries newest first, optionally for a single device"""
+        sql = "SELECT entry FROM screenshots"
+        params = []
+        if device_id:
+            sql += " WHERE device_id = ?"
+            params.append(device_id)
+        sql += " ORDER BY timestamp DESC LIMIT ? OFFSET ?"
+        params.extend([limit if limit else -1, offset])
+
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_entry(self, filename):
+        """Get a single entry by filename"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT entry FROM screenshots WHERE filename = ?",
+                (filename,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count(self, device_id=None):
+        """Count entries, optionally for a single device"""
+        with self._lock:
+            if device_id:
+                row = self.conn.execute(
+                    "SELECT COUNT(*) FROM screenshots WHERE device_id = ?",
+                    (device_id,)
+                ).fetchone()
+            else:
+                row = self.conn.execute("SELECT COUNT(*) FROM screenshots").fetchone()
+        return row[0]
+
+    def get_device_entries(self, device_id):
+        """Get entries for a device, oldest first"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT entry FROM screenshots WHERE device_id = ? ORDER BY timestamp",
+                (device_id,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def entries_between(self, start=None, end=None, device_id=None):
+        """Get entries with start <= timestamp <= end, oldest first"""
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append("timestamp >= ?")
+            params.append(_timestamp_bound(start))
+        if end is not None:
+            conditions.append("timestamp <= ?")
+            params.append(_timestamp_bound(end))
+        if device_id:
+            conditions.append("device_id = ?")
+            params.append(device_id)
+
+        sql = "SELECT entry FROM screenshots"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp"
+
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def entry_keys(self):
+        """Get (filename, device_id, timestamp, scores) for every entry"""
+        columns = ", ".join(SCORE_CATEGORIES)
+        with self._lock:
+            rows = self.conn.execute(f"SELECT filename, device_id, timestamp, {columns} FROM screenshots").fetchall()
+        return [(row[0], row[1], row[2], tuple(row[3:])) for row in rows]
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self.conn.close()
+
+class JournalHistoryStore:
+    """Screenshot history kept as an append-only JSON Lines journal
+
+    Each line is either {"op": "add", "entry": {...}} or a tombstone
+    {"op": "del", "filename": ...}. Appends are fsynced in batches and a
+    background thread rewrites the journal once the share of dead lines
+    crosses compact_ratio.
+    """
+
+    def __init__(self, journal_file, legacy_json_file=None, settings=None):
+        self.logger = get_logger(__name__)
+        self.journal_file = journal_file
+        self.settings = dict(DEFAULT_JOURNAL_SETTINGS)
+        self.settings.update(settings or {})
+        self._lock = threading.Lock()
+        self.index = HistoryIndex()
+        self._total_lines = 0
+        self._pending_sync = 0
+        self._last_sync = time.monotonic()
+        self._last_compact = time.monotonic()
+
+        if not os.path.exists(journal_file) and legacy_json_file and os.path.exists(legacy_json_file):
+            self._migrate_json(legacy_json_file)
+
+        self._load_journal()
+        self._file = open(journal_file, 'a', encoding='utf-8')
+
+        self._stop_event = threading.Event()
+        self._compactor = threading.Thread(target=self._compactor_loop, daemon=True)
+        self._compactor.start()
+
+    def _migrate_json(self, json_file):
+        """One-shot conversion of a legacy history.json file into a journal"""
+        try:
+            with open(json_file, 'r') as f:
+                entries = json.load(f)
+            self._write_snapshot(entries)
+            os.replace(json_file, f"{json_file}.migrated")
+            self.logger.info(f"Migrated {len(entries)} history entries from {json_file}")
+        except Exception as e:
+            self.logger.error(f"Failed to migrate history from {json_file}: {str(e)}")
+
+    def _load_journal(self):
+        """Replay the journal line by line"""
+        if not os.path.exists(self.journal_file):
+            return
+
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    self.logger.warning(f"Skipping corrupt history journal line {line_number}")
+                    continue
+
+                self._total_lines += 1
+                if record.get('op') == 'add':
+                    self.index.add(record['entry'])
+                elif record.get('op') == 'del':
+                    self.index.remove(record.get('filename'))
+
+    def _write_snapshot(self, entries):
+        """Atomically replace the journal with add records for the given entries"""
+        temp_file = f"{self.journal_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps({'op': 'add', 'entry': entry}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.journal_file)
+
+    def _append(self, record):
+        """Append a record, fsyncing once the batch is large or old enough"""
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        self._total_lines += 1
+        self._pending_sync += 1
+
+        if (self._pending_sync >= self.settings['fsync_batch_size'] or
+                time.monotonic() - self._last_sync >= self.settings['fsync_interval']):
+            self._sync()
+
+    def _sync(self):
+        if self._pending_sync:
+            os.fsync(self._file.fileno())
+            self._pending_sync = 0
+        self._last_sync = time.monotonic()
+
+    def _dead_ratio(self):
+        if not self._total_lines:
+            return 0.0
+        return (self._total_lines - len(self.index)) / self._total_lines
+
+    def _compactor_loop(self):
+        """Flush pending writes and compact the journal in the background"""
+        while not self._stop_event.wait(min(self.settings['fsync_interval'], self.settings['compact_check_interval'])):
+            try:
+                with self._lock:
+                    self._sync()
+                    should_compact = (
+                        time.monotonic() - self._last_compact >= self.settings['compact_check_interval']
+                        and self._total_lines >= self.settings['compact_min_records']
+                        and self._dead_ratio() >= self.settings['compact_ratio']
+                    )
+                    if should_compact:
+                        self._last_compact = time.monotonic()
+                if should_compact:
+                    self.compact()
+            except Exception as e:
+                self.logger.error(f"History journal maintenance failed: {str(e)}")
+
+    def compact(self):
+        """Rewrite the journal with only the live entries"""
+        with self._lock:
+            try:
+                self._sync()
+                self._file.close()
+                self._write_snapshot(self.index.entries.values())
+                removed = self._total_lines - len(self.index)
+                self._total_lines = len(self.index)
+                self.logger.info(f"Compacted history journal, dropped {removed} dead records")
+            except Exception as e:
+                self.logger.error(f"Failed to compact history journal: {str(e)}")
+            finally:
+                self._file = open(self.journal_file, 'a', encoding='utf-8')
+
+    def add(self, entry):
+        """Append a history entry"""
+        with self._lock:
+            self.index.add(entry)
+            self._append({'op': 'add', 'entry': entry})
+
+    def remove(self, filename):
+        """Append a tombstone for a screenshot"""
+        with self._lock:
+            if self.index.remove(filename) is not None:
+                self._append({'op': 'del', 'filename': filename})
+
+    def query(self, limit=None, offset=0, device_id=None):
+        """Get entries newest first, optionally for a single device"""
+        with self._lock:
+            return self.index.query(limit=limit, offset=offset, device_id=device_id)
+
+    def get_entry(self, filename):
+        """Get a single entry by filename"""
+        with self._lock:
+            return self.index.get(filename)
+
+    def count(self, device_id=None):
+        """Count entries, optionally for a single device"""
+        with self._lock:
+            return self.index.count(device_id)
+
+    def get_device_entries(self, device_id):
+        """Get entries for a device, oldest first"""
+        with self._lock:
+            return self.index.device_entries(device_id)
+
+    def entries_between(self, start=None, end=None, device_id=None):
+        """Get entries with start <= timestamp <= end, oldest first"""
+        with self._lock:
+            return self.index.between(start, end, device_id)
+
+    def entry_keys(self):
+        """Get (filename, device_id, timestamp, scores) for every entry"""
+        with self._lock:
+            return self.index.entry_keys()
+
+    def close(self):
+        """Stop the compactor and flush the journal"""
+        self._stop_event.set()
+        self._compactor.join(timeout=1.0)
+        with self._lock:
+            self._sync()
+            self._file.close()
@@ -0,0 +1,117 @@
+import io
+import time
+import threading
+from PIL import Image
+from utils.logger import get_logger
+
+DEFAULT_PREPROCESS_SETTINGS = {
+    'max_long_edge': 1568,
+    'format': 'JPEG',
+    'quality': 80,
+    'detail': 'high',
+    'detail_change_threshold': 0.25,
+    'low_detail_long_edge': 512
+}
+
+MIME_TYPES = {
+    'PNG': 'image/png',
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp'
+}
+
+class ImagePreprocessor:
+    """Downscale and encode frames before upload, tracking size and encode time"""
+
+    def __init__(self, settings=None):
+        self.logger = get_logger(__name__)
+        self.settings = dict(DEFAULT_PREPROCESS_SETTINGS)
+        self.settings.update(settings or {})
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def resolve(self, overrides=None, change_score=None):
+        """Merge per-device overrides and pick the detail level for a frame
+
+        detail 'auto' (opt-in) becomes 'low' when the frame's change score
+        (0.0-1.0) is below detail_change_threshold, and 'high' otherwise or
+        when no score is known.
+        """
+        settings = dict(self.settings)
+        settings.update(overrides or {})
+        settings['format'] = str(settings['format']).upper()
+        if settings['format'] not in MIME_TYPES:
+            self.logger.warning(f"Unsupported upload format {settings['format']}, using PNG")
+            settings['format'] = 'PNG'
+
+        detail = settings.get('detail', 'high')
+        if detail == 'auto':
+            if change_score is not None and change_score < settings['detail_change_threshold']:
+                detail = 'low'
+            else:
+                detail = 'high'
+        settings['detail'] = detail
+
+        if detail == 'low' and settings.get('low_detail_long_edge'):
+            max_edge = settings.get('max_long_edge') or settings['low_detail_long_edge']
+            settings['max_long_edge'] = min(max_edge, settings['low_detail_long_edge'])
+        return settings
+
+    @staticmethod
+    def signature(settings):
+        """Describe resolved settings, for use in cache keys"""
+        return f"{settings['max_long_edge']}:{settings['format']}:{settings['quality']}:{settings['detail']}"
+
+    def encode(self, image, settings, device_id=None):
+        """Resize and encode an image with resolved settings"""
+        started = time.perf_counter()
+
+        max_edge = settings.get('max_long_edge')
+        if max_edge and max(image.size) > max_edge:
+            scale = max_edge / max(image.size)
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, Image.BILINEAR)
+
+        image_format = settings['format']
+        if image_format in ('JPEG', 'WEBP') and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        buffer = io.BytesIO()
+        if image_format == 'PNG':
+            image.save(buffer, format='PNG')
+        else:
+            image.save(buffer, format=image_format, quality=int(settings['quality']))
+        data = buffer.getvalue()
+
+        encode_time = time.perf_counter() - started
+        self._record(device_id, len(data), encode_time)
+
+        return {
+            'data': data,
+            'mime_type': MIME_TYPES[image_format],
+            'detail': settings['detail'],
+            'size': image.size,
+            'encoded_bytes': len(data),
+            'encode_time': encode_time
+        }
+
+    def _record(self, device_id, encoded_bytes, encode_time):
+        with self._lock:
+            stats = self._stats.setdefault(device_id, {
+                'frames': 0,
+                'total_bytes': 0,
+                'total_encode_time': 0.0,
+                'last_bytes': 0,
+                'last_encode_time': 0.0
+            })
+            stats['frames'] += 1
+            stats['total_bytes'] += encoded_bytes
+            stats['total_encode_time'] += encode_time
+            stats['last_bytes'] = encoded_bytes
+            stats['last_encode_time'] = encode_time
+
+    def get_stats(self, device_id=None):
+        """Get encoded size and encode time counters for a device, or all devices"""
+        with self._lock:
+            if device_id is not None:
+                return dict(self._stats.get(device_id, {}))
+            return {device: dict(stats) for device, stats in self._stats.items()}
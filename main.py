@@ -13,9 +13,9 @@ def main():
     # Initialize configuration
     config = ConfigManager()
     
-    # Initialize components
-    screenshot_mgr = ScreenshotManager(config)
+    # Initialize components; one analyzer is shared by monitoring and the GUI
     content_analyzer = ContentAnalyzer(config)
+    screenshot_mgr = ScreenshotManager(config, content_analyzer)
     notification_mgr = NotificationManager(config)
     
     # Setup main GUI window
@@ -32,7 +32,12 @@ def main():
         # Cleanup on exit
         if hasattr(app, 'system_tray'):
             app.system_tray.stop()
+        app.report_scheduler.stop()
+        app.report_runner.shutdown()
         screenshot_mgr.stop_monitoring()
+        screenshot_mgr.close_backends()
+        screenshot_mgr.history_manager.close()
+        content_analyzer.close()
 
 if __name__ == "__main__":
     main()
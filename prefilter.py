@@ -0,0 +1,234 @@
+import platform
+import re
+import threading
+import numpy as np
+from utils.logger import get_logger
+
+SAFE = 'safe'
+RISKY = 'risky'
+
+DEFAULT_PREFILTER_SETTINGS = {
+    'enabled': False,
+    'stages': ['window_title', 'skin_tone', 'ocr_keywords'],
+    'safe_titles': [
+        'Visual Studio Code',
+        'PyCharm',
+        'IntelliJ IDEA',
+        'Microsoft Excel',
+        'LibreOffice Calc',
+        'Microsoft Word',
+        'LibreOffice Writer',
+        'Terminal'
+    ],
+    'safe_processes': [
+        'code',
+        'pycharm64',
+        'idea64',
+        'excel',
+        'winword',
+        'soffice.bin',
+        'gnome-terminal-server',
+        'konsole',
+        'windowsterminal'
+    ],
+    'skin_risky_ratio': 0.35,
+    'ocr_keywords': []
+}
+
+# One X display connection per capture thread, as for the capture backends
+_x11 = threading.local()
+
+def _x11_display():
+    from Xlib import display
+    connection = getattr(_x11, 'connection', None)
+    if connection is None:
+        connection = display.Display()
+        _x11.connection = connection
+    return connection
+
+def close_window_connection():
+    """Close the current thread's X display connection, if it has one"""
+    connection = getattr(_x11, 'connection', None)
+    _x11.connection = None
+    if connection is not None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+def _process_name(pid):
+    try:
+        import psutil
+        return psutil.Process(pid).name()
+    except Exception:
+        return None
+
+def _x11_active_window():
+    from Xlib import X
+    connection = _x11_display()
+    root = connection.screen().root
+    active = root.get_full_property(connection.intern_atom('_NET_ACTIVE_WINDOW'), X.AnyPropertyType)
+    if not active or not active.value:
+        return None, None
+    window = connection.create_resource_object('window', active.value[0])
+
+    name = window.get_full_property(connection.intern_atom('_NET_WM_NAME'), 0)
+    if name and name.value:
+        value = name.value
+        title = value.decode('utf-8', 'replace') if isinstance(value, bytes) else value
+    else:
+        title = window.get_wm_name()
+
+    pid = window.get_full_property(connection.intern_atom('_NET_WM_PID'), X.AnyPropertyType)
+    process_name = _process_name(int(pid.value[0])) if pid and len(pid.value) else None
+    return title or None, process_name
+
+def get_active_window():
+    """Get (title, process_name) of the focused window on this machine
+
+    Either is None when it cannot be determined.
+    """
+    system = platform.system().lower()
+    try:
+        if system == 'windows':
+            import ctypes
+            from ctypes import wintypes
+            user32 = ctypes.windll.user32
+            hwnd = user32.GetForegroundWindow()
+            length = user32.GetWindowTextLengthW(hwnd)
+            buffer = ctypes.create_unicode_buffer(length + 1)
+            user32.GetWindowTextW(hwnd, buffer, length + 1)
+            pid = wintypes.DWORD()
+            user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
+            return buffer.value or None, _process_name(pid.value) if pid.value else None
+
+        if system == 'linux':
+            try:
+                return _x11_active_window()
+            except Exception:
+                # Reconnect on the next frame
+                close_window_connection()
+                return None, None
+    except Exception:
+        return None, None
+    return None, None
+
+class PrefilterStage:
+    """A cheap CPU check run before the cloud provider
+
+    evaluate() returns (verdict, detail) where verdict is SAFE, RISKY or
+    None when the stage has no opinion about the frame.
+    """
+
+    name = None
+
+    def __init__(self, settings):
+        self.settings = settings
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def evaluate(self, image, context):
+        raise NotImplementedError
+
+class WindowTitleStage(PrefilterStage):
+    """Marks frames from known-safe applications as safe
+
+    When the focused window's process is known it must be one of
+    safe_processes. Otherwise the title must be one of safe_titles or end
+    with " - <safe title>", as applications append their own name, so a
+    browser tab that merely mentions a safe application is not cleared.
+    """
+
+    name = 'window_title'
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        titles = settings.get('safe_titles', [])
+        self._pattern = re.compile(
+            r'(?:^|\s[-\u2013\u2014]\s)(' + '|'.join(re.escape(title) for title in titles) + r')\s*$',
+            re.IGNORECASE
+        ) if titles else None
+        self._processes = {self._normalize(name) for name in settings.get('safe_processes', [])}
+
+    @staticmethod
+    def _normalize(process_name):
+        name = process_name.strip().lower()
+        return name[:-4] if name.endswith('.exe') else name
+
+    def evaluate(self, image, context):
+        process_name = context.get('process_name')
+        if process_name:
+            if self._normalize(process_name) in self._processes:
+                return SAFE, process_name
+            return None, None
+
+        title = context.get('window_title')
+        if not title or not self._pattern:
+            return None, None
+        match = self._pattern.search(title)
+        return (SAFE, match.group(1)) if match else (None, None)
+
+class SkinToneStage(PrefilterStage):
+    """Flags frames with a large share of skin-coloured pixels
+
+    Pixels are classified in YCbCr space on a 64x64 thumbnail. A low share
+    says nothing about text-based content, so this stage never votes safe.
+    """
+
+    name = 'skin_tone'
+
+    def evaluate(self, image, context):
+        pixels = np.asarray(image.resize((64, 64)).convert('YCbCr'))
+        cb, cr = pixels[..., 1], pixels[..., 2]
+        ratio = float(((cb >= 77) & (cb <= 127) & (cr >= 133) & (cr <= 173)).mean())
+        if ratio >= float(self.settings.get('skin_risky_ratio', 0.35)):
+            return RISKY, f"skin ratio {ratio:.2f}"
+        return None, None
+
+class OCRKeywordStage(PrefilterStage):
+    """Flags frames whose visible text contains a configured keyword (needs pytesseract)"""
+
+    name = 'ocr_keywords'
+
+    @classmethod
+    def is_available(cls):
+        try:
+            import pytesseract
+            return True
+        except ImportError:
+            return False
+
+    def evaluate(self, image, context):
+        keywords = [keyword.lower() for keyword in self.settings.get('ocr_keywords', [])]
+        if not keywords:
+            return None, None
+
+        import pytesseract
+        text = pytesseract.image_to_string(image.convert('L')).lower()
+        hits = [keyword for keyword in keywords if keyword in text]
+        return (RISKY, ', '.join(hits)) if hits else (None, None)
+
+PREFILTER_STAGES = {
+    stage.name: stage for stage in (WindowTitleStage, SkinToneStage, OCRKeywordStage)
+}
+
+def register_stage(stage_class):
+    """Make a PrefilterStage subclass available to the 'stages' setting"""
+    PREFILTER_STAGES[stage_class.name] = stage_class
+    return stage_class
+
+def build_stages(settings):
+    """Instantiate the configured stages that can run on this machine"""
+    logger = get_logger(__name__)
+    stages = []
+    for name in settings.get('stages', []):
+        stage_class = PREFILTER_STAGES.get(name)
+        if not stage_class:
+            logger.warning(f"Unknown prefilter stage: {name}")
+        elif not stage_class.is_available():
+            logger.info(f"Prefilter stage {name} not available")
+        else:
+            stages.append(stage_class(settings))
+    return stages
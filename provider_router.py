@@ -0,0 +1,247 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
+from utils.logger import get_logger
+
+DEFAULT_ROUTER_SETTINGS = {
+    'enabled': False,
+    'providers': ['openai', 'gemini'],
+    'window': 50,
+    'min_samples': 5,
+    'max_error_rate': 0.5,
+    'cooldown': 60,
+    'hedge': False,
+    'hedge_percentile': 0.95,
+    'hedge_min_delay': 2.0
+}
+
+class ProviderHealth:
+    """Rolling latency and error rate of one provider/model"""
+
+    def __init__(self, window=50):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+        self.last_failure = 0.0
+
+    def record(self, latency, ok):
+        with self._lock:
+            self._samples.append((latency, ok))
+            if not ok:
+                self.last_failure = time.monotonic()
+
+    def error_rate(self):
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def percentile(self, fraction):
+        """Latency percentile of successful calls, or None without samples"""
+        with self._lock:
+            latencies = sorted(latency for latency, ok in self._samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+    def snapshot(self):
+        return {
+            'samples': len(self),
+            'error_rate': self.error_rate(),
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95)
+        }
+
+class ProviderRouter:
+    """Routes analysis requests across providers with failover and hedging
+
+    Providers are tried in order of preference, starting with the selected
+    vision_provider. A provider/model whose rolling error rate reaches
+    max_error_rate is moved to the back of the order for cooldown seconds.
+    A request that fails goes on to the next provider. With hedge enabled,
+    the next provider is also started once the first has taken longer than
+    its hedge_percentile latency, and the first good answer wins.
+
+    callers maps each provider name to a function (or coroutine function
+    for call_async) taking the encoded frame and returning its analysis.
+    """
+
+    def __init__(self, content_analyzer, settings=None):
+        self.content_analyzer = content_analyzer
+        self.logger = get_logger(__name__)
+        self.settings = dict(DEFAULT_ROUTER_SETTINGS)
+        self.settings.update(settings or {})
+        self._lock = threading.Lock()
+        self._health = {}
+        self._executor = None
+        self.failovers = 0
+        self.hedges = 0
+
+    @property
+    def enabled(self):
+        return bool(self.settings.get('enabled'))
+
+    def _model(self, provider):
+        return self.content_analyzer.config.get_model_settings(provider).get('selected_model')
+
+    def _health_for(self, provider):
+        key = f"{provider}:{self._model(provider)}"
+        with self._lock:
+            if key not in self._health:
+                self._health[key] = ProviderHealth(int(self.settings['window']))
+            return self._health[key]
+
+    def _is_available(self, provider):
+        analyzer = self.content_analyzer
+        if provider == 'openai':
+            return bool(analyzer.openai_client and self._model('openai'))
+        if provider == 'gemini':
+            return bool(analyzer.gemini_model)
+        return False
+
+    def _is_tripped(self, provider):
+        health = self._health_for(provider)
+        return (
+            len(health) >= int(self.settings['min_samples']) and
+            health.error_rate() >= float(self.settings['max_error_rate']) and
+            time.monotonic() - health.last_failure < float(self.settings['cooldown'])
+        )
+
+    def candidates(self):
+        """Configured providers in the order they should be tried"""
+        preferred = [self.content_analyzer.provider]
+        preferred += [p for p in self.settings['providers'] if p != self.content_analyzer.provider]
+        available = [p for p in preferred if self._is_available(p)]
+        healthy = [p for p in available if not self._is_tripped(p)]
+        return healthy + [p for p in available if p not in healthy]
+
+    def _hedge_delay(self, provider):
+        p95 = self._health_for(provider).percentile(float(self.settings['hedge_percentile']))
+        return max(float(self.settings['hedge_min_delay']), p95 or 0.0)
+
+    def _finish(self, provider, started, result):
+        ok = isinstance(result, dict) and 'error' not in result
+        self._health_for(provider).record(time.monotonic() - started, ok)
+        if ok:
+            result['provider'] = provider
+        else:
+            self.logger.warning(f"{provider} analysis failed: {result.get('error') if isinstance(result, dict) else result}")
+        return result
+
+    def _timed(self, provider, caller, prepared):
+        started = time.monotonic()
+        try:
+            result = caller(prepared)
+        except Exception as e:
+            result = {"error": str(e)}
+        return self._finish(provider, started, result)
+
+    def _note_failover(self, provider):
+        with self._lock:
+            self.failovers += 1
+        self.logger.info(f"Failing over to {provider}")
+
+    def call(self, prepared, callers):
+        """Analyze an encoded frame, failing over and hedging across providers"""
+        order = [p for p in self.candidates() if p in callers]
+        if not order:
+            return {"error": "No vision provider available"}
+
+        launched = []
+        result = None
+        if self.settings.get('hedge') and len(order) > 1:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(thread_name_prefix="analysis-hedge")
+                executor = self._executor
+
+            primary, secondary = order[0], order[1]
+            futures = {executor.submit(self._timed, primary, callers[primary], prepared): primary}
+            launched.append(primary)
+            done, _ = wait(futures, timeout=self._hedge_delay(primary))
+            if not done:
+                with self._lock:
+                    self.hedges += 1
+                futures[executor.submit(self._timed, secondary, callers[secondary], prepared)] = secondary
+                launched.append(secondary)
+
+            # The slower request keeps running but only updates the health stats
+            for future in as_completed(futures):
+                result = future.result()
+                if 'error' not in result:
+                    return result
+
+        for provider in order:
+            if provider in launched:
+                continue
+            if launched:
+                self._note_failover(provider)
+            launched.append(provider)
+            result = self._timed(provider, callers[provider], prepared)
+            if 'error' not in result:
+                return result
+        return result
+
+    async def _timed_async(self, provider, caller, prepared):
+        started = time.monotonic()
+        try:
+            result = await caller(prepared)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            result = {"error": str(e)}
+        return self._finish(provider, started, result)
+
+    async def call_async(self, prepared, callers):
+        """Async variant of call(); the losing hedged request is cancelled"""
+        order = [p for p in self.candidates() if p in callers]
+        if not order:
+            return {"error": "No vision provider available"}
+
+        primary = order[0]
+        tasks = {asyncio.ensure_future(self._timed_async(primary, callers[primary], prepared)): primary}
+        if self.settings.get('hedge') and len(order) > 1:
+            done, _ = await asyncio.wait(list(tasks), timeout=self._hedge_delay(primary))
+            if not done:
+                with self._lock:
+                    self.hedges += 1
+                secondary = order[1]
+                tasks[asyncio.ensure_future(self._timed_async(secondary, callers[secondary], prepared))] = secondary
+
+        result = None
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if 'error' not in result:
+                        return result
+        finally:
+            for task in pending:
+                task.cancel()
+
+        for provider in order:
+            if provider in tasks.values():
+                continue
+            self._note_failover(provider)
+            result = await self._timed_async(provider, callers[provider], prepared)
+            if 'error' not in result:
+                return result
+        return result
+
+    def get_stats(self):
+        """Get rolling health per provider/model and failover and hedge counters"""
+        with self._lock:
+            health = dict(self._health)
+            failovers, hedges = self.failovers, self.hedges
+        return {
+            'providers': {key: item.snapshot() for key, item in health.items()},
+            'failovers': failovers,
+            'hedges': hedges
+        }
@@ -0,0 +1,277 @@
+import asyncio
+import itertools
+import math
+import threading
+import time
+from utils.logger import get_logger
+
+DEFAULT_RATE_LIMIT_SETTINGS = {
+    'enabled': False,
+    'limits': {
+        'openai': {'rpm': 500, 'tpm': 200000},
+        'gemini': {'rpm': 60, 'tpm': 1000000}
+    },
+    'alert_priority_window': 600,
+    'max_wait': None,
+    'max_retries': 2,
+    'default_retry_after': 10
+}
+
+# Prompt text plus the response budget (max_tokens) of one request
+REQUEST_OVERHEAD_TOKENS = 700
+
+HIGH_PRIORITY = 0
+LOW_PRIORITY = 1
+
+def estimate_tokens(provider, prepared):
+    """Estimate the tokens one encoded frame costs, including prompt and response"""
+    if provider == 'openai':
+        if prepared.get('detail') == 'low':
+            image_tokens = 85
+        else:
+            # High detail: fit in 2048x2048, shortest side to 768, then 170 per 512px tile
+            width, height = prepared.get('size', (1024, 1024))
+            scale = min(1.0, 2048.0 / max(width, height))
+            width, height = width * scale, height * scale
+            scale = min(1.0, 768.0 / min(width, height))
+            width, height = width * scale, height * scale
+            image_tokens = 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+    else:
+        image_tokens = 258
+    return image_tokens + REQUEST_OVERHEAD_TOKENS
+
+def is_rate_limited(error):
+    """Whether a provider exception is an HTTP 429"""
+    return getattr(error, 'status_code', None) == 429 or getattr(error, 'code', None) == 429
+
+def retry_after(error):
+    """Get the Retry-After delay of a 429 in seconds, if the provider sent one"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """Continuously refilled bucket of per-minute capacity"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until amount tokens are available (after refill)"""
+        missing = min(amount, self.capacity) - self.tokens
+        return max(0.0, missing / self.rate) if self.rate else float('inf')
+
+class Waiter:
+    def __init__(self, seq, provider, tokens, device_id, priority):
+        self.seq = seq
+        self.provider = provider
+        self.tokens = tokens
+        self.device_id = device_id
+        self.priority = priority
+        self.superseded = False
+
+class RateLimiter:
+    """Client-side request and token budget shared by every device
+
+    Each provider has a requests-per-minute and a tokens-per-minute bucket.
+    Requests wait in a queue ordered by priority, then arrival. Devices with
+    an alert in the last alert_priority_window seconds are high priority.
+    A newer low-priority request from the same device supersedes a waiting
+    one, so a backlog holds at most the latest frame per device; frames
+    wait for budget rather than being dropped, unless max_wait is set. A
+    429 from the provider pauses its buckets for the Retry-After delay.
+    """
+
+    def __init__(self, settings=None):
+        self.logger = get_logger(__name__)
+        self.settings = dict(DEFAULT_RATE_LIMIT_SETTINGS)
+        self.settings.update(settings or {})
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._buckets = {}
+        self._paused_until = {}
+        self._waiters = {}
+        self._alerts = {}
+        self._counters = {}
+
+    @property
+    def enabled(self):
+        return bool(self.settings.get('enabled'))
+
+    def _provider_state(self, provider):
+        """Get (rpm_bucket, tpm_bucket) for a provider (caller holds the lock)"""
+        if provider not in self._buckets:
+            limits = dict(DEFAULT_RATE_LIMIT_SETTINGS['limits'].get(provider, {'rpm': 60, 'tpm': 100000}))
+            limits.update(self.settings.get('limits', {}).get(provider, {}))
+            self._buckets[provider] = (TokenBucket(limits['rpm']), TokenBucket(limits['tpm']))
+            self._waiters[provider] = []
+            self._counters[provider] = {'granted': 0, 'coalesced': 0, 'timed_out': 0, 'rate_limited': 0}
+        return self._buckets[provider]
+
+    def note_alert(self, device_id):
+        """Raise a device's priority after it triggered an alert"""
+        with self._lock:
+            self._alerts[device_id] = time.monotonic()
+
+    def priority(self, device_id):
+        with self._lock:
+            alerted = self._alerts.get(device_id)
+        window = float(self.settings['alert_priority_window'])
+        return HIGH_PRIORITY if alerted is not None and time.monotonic() - alerted < window else LOW_PRIORITY
+
+    def _enqueue(self, provider, tokens, device_ids):
+        priority = min((self.priority(device_id) for device_id in device_ids), default=LOW_PRIORITY)
+        device_id = device_ids[0] if len(device_ids) == 1 else None
+        with self._lock:
+            self._provider_state(provider)
+            waiters = self._waiters[provider]
+            if priority == LOW_PRIORITY and device_id is not None:
+                for waiter in waiters:
+                    if waiter.device_id == device_id and waiter.priority == LOW_PRIORITY:
+                        waiter.superseded = True
+                        self._counters[provider]['coalesced'] += 1
+                waiters[:] = [waiter for waiter in waiters if not waiter.superseded]
+
+            waiter = Waiter(next(self._seq), provider, tokens, device_id, priority)
+            waiters.append(waiter)
+            waiters.sort(key=lambda item: (item.priority, item.seq))
+            return waiter
+
+    def _try_acquire(self, waiter):
+        """Returns 'granted', 'superseded' or the seconds to wait before retrying"""
+        with self._lock:
+            if waiter.superseded:
+                return 'superseded'
+
+            now = time.monotonic()
+            paused = self._paused_until.get(waiter.provider, 0.0) - now
+            if paused > 0:
+                return paused
+
+            waiters = self._waiters[waiter.provider]
+            if waiters[0] is not waiter:
+                return 0.05
+
+            rpm, tpm = self._provider_state(waiter.provider)
+            rpm.refill(now)
+            tpm.refill(now)
+            wait = max(rpm.wait_time(1), tpm.wait_time(waiter.tokens))
+            if wait > 0:
+                return wait
+
+            rpm.tokens -= 1
+            tpm.tokens -= min(waiter.tokens, tpm.capacity)
+            waiters.pop(0)
+            self._counters[waiter.provider]['granted'] += 1
+            return 'granted'
+
+    def _abandon(self, waiter):
+        with self._lock:
+            waiters = self._waiters[waiter.provider]
+            if waiter in waiters:
+                waiters.remove(waiter)
+            self._counters[waiter.provider]['timed_out'] += 1
+
+    def _deadline(self):
+        max_wait = self.settings.get('max_wait')
+        return time.monotonic() + float(max_wait) if max_wait is not None else None
+
+    def acquire(self, provider, tokens, device_ids=()):
+        """Block until the budget allows a request; returns 'granted', 'superseded' or 'timeout'
+
+        'timeout' is only possible when max_wait is set.
+        """
+        waiter = self._enqueue(provider, tokens, list(device_ids))
+        deadline = self._deadline()
+        while True:
+            status = self._try_acquire(waiter)
+            if isinstance(status, str):
+                return status
+            if deadline is not None and time.monotonic() + min(status, 0.25) > deadline:
+                self._abandon(waiter)
+                return 'timeout'
+            time.sleep(min(status, 0.25))
+
+    async def acquire_async(self, provider, tokens, device_ids=()):
+        """Async variant of acquire() that waits without blocking the loop"""
+        waiter = self._enqueue(provider, tokens, list(device_ids))
+        deadline = self._deadline()
+        try:
+            while True:
+                status = self._try_acquire(waiter)
+                if isinstance(status, str):
+                    return status
+                if deadline is not None and time.monotonic() + min(status, 0.25) > deadline:
+                    self._abandon(waiter)
+                    return 'timeout'
+                await asyncio.sleep(min(status, 0.25))
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+    def penalize(self, provider, delay=None):
+        """Pause a provider after a 429, for Retry-After or default_retry_after seconds"""
+        delay = delay if delay is not None else float(self.settings['default_retry_after'])
+        with self._lock:
+            self._provider_state(provider)
+            self._paused_until[provider] = max(self._paused_until.get(provider, 0.0), time.monotonic() + delay)
+            self._counters[provider]['rate_limited'] += 1
+        self.logger.warning(f"{provider} rate limited, pausing requests for {delay:.1f}s")
+
+    def _denied(self, status):
+        if status == 'superseded':
+            return {"error": "Superseded by a newer frame"}
+        return {"error": "Rate limit budget exhausted"}
+
+    def run(self, provider, tokens, device_ids, call, prepared):
+        """Call a provider within the budget, retrying after 429s"""
+        for _ in range(int(self.settings['max_retries']) + 1):
+            status = self.acquire(provider, tokens, device_ids)
+            if status != 'granted':
+                return self._denied(status)
+            result = call(prepared)
+            if not (isinstance(result, dict) and result.get('rate_limited')):
+                return result
+            self.penalize(provider, result.get('retry_after'))
+        return result
+
+    async def run_async(self, provider, tokens, device_ids, call, prepared):
+        """Async variant of run(); call is a coroutine function"""
+        for _ in range(int(self.settings['max_retries']) + 1):
+            status = await self.acquire_async(provider, tokens, device_ids)
+            if status != 'granted':
+                return self._denied(status)
+            result = await call(prepared)
+            if not (isinstance(result, dict) and result.get('rate_limited')):
+                return result
+            self.penalize(provider, result.get('retry_after'))
+        return result
+
+    def get_stats(self):
+        """Get queue depth, remaining budget and counters per provider"""
+        now = time.monotonic()
+        with self._lock:
+            stats = {}
+            for provider, (rpm, tpm) in self._buckets.items():
+                rpm.refill(now)
+                tpm.refill(now)
+                waiters = self._waiters[provider]
+                stats[provider] = {
+                    'queue_depth': len(waiters),
+                    'high_priority_waiting': sum(1 for w in waiters if w.priority == HIGH_PRIORITY),
+                    'requests_available': int(rpm.tokens),
+                    'tokens_available': int(tpm.tokens),
+                    'paused_for': max(0.0, self._paused_until.get(provider, 0.0) - now),
+                    **self._counters[provider]
+                }
+            return stats
@@ -0,0 +1,188 @@
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from utils.logger import get_logger
+from history_store import SCORE_CATEGORIES
+
+DEFAULT_CHART_SETTINGS = {
+    'memory_entries': 32,
+    'disk_entries': 200
+}
+
+def render_png(figure):
+    """Render a Figure with its own Agg canvas and release it"""
+    try:
+        FigureCanvasAgg(figure)
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format='png')
+        return buffer.getvalue()
+    finally:
+        figure.clear()
+
+def trends_figure(daily):
+    """Line chart of alerts per category per day from [(date, rollup bucket)]"""
+    dates = [date for date, _ in daily]
+    counts = np.array(
+        [[bucket['category_alerts'][category] for category in SCORE_CATEGORIES] for _, bucket in daily],
+        dtype=int
+    ).reshape(len(daily), len(SCORE_CATEGORIES))
+
+    figure = Figure(figsize=(8, 4))
+    axes = figure.add_subplot()
+    for index, category in enumerate(SCORE_CATEGORIES):
+        axes.plot(dates, counts[:, index], marker='o', label=category.capitalize())
+    axes.set_title('Alert Trends Over Time')
+    axes.set_xlabel('Date')
+    axes.set_ylabel('Number of Alerts')
+    axes.tick_params(axis='x', labelrotation=45)
+    axes.legend()
+    figure.tight_layout()
+    return figure
+
+def hourly_heatmap_figure(hourly, start_date, end_date):
+    """Heatmap of alerts by day and hour of day from {'YYYY-MM-DDTHH': rollup bucket}"""
+    days = (end_date.date() - start_date.date()).days + 1
+    grid = np.zeros((days, 24), dtype=int)
+    if hourly:
+        keys = np.array(sorted(hourly))
+        alerts = np.array([hourly[key]['alerts'] for key in keys], dtype=int)
+        hours = np.array([key[11:13] for key in keys], dtype=int)
+        day_numbers = (
+            np.array([key[:10] for key in keys], dtype='datetime64[D]') -
+            np.datetime64(start_date.date(), 'D')
+        ).astype(int)
+        np.add.at(grid, (day_numbers, hours), alerts)
+
+    figure = Figure(figsize=(8, 4))
+    axes = figure.add_subplot()
+    image = axes.imshow(grid, aspect='auto', cmap='Reds', interpolation='nearest')
+    axes.set_title('Alerts by Hour of Day')
+    axes.set_xlabel('Hour')
+    axes.set_xticks(range(0, 24, 3))
+    labels = np.arange(np.datetime64(start_date.date(), 'D'), np.datetime64(start_date.date(), 'D') + days)
+    step = max(1, days // 10)
+    axes.set_yticks(range(0, days, step))
+    axes.set_yticklabels([str(day) for day in labels[::step]])
+    figure.colorbar(image, ax=axes, label='Alerts')
+    figure.tight_layout()
+    return figure
+
+def device_bars_figure(device_buckets, device_names):
+    """Stacked bars of alerts per category for each device from {device_id: rollup bucket}"""
+    device_ids = list(device_buckets)
+    counts = np.array(
+        [[device_buckets[device_id]['category_alerts'][category] for category in SCORE_CATEGORIES]
+         for device_id in device_ids],
+        dtype=int
+    ).reshape(len(device_ids), len(SCORE_CATEGORIES))
+    bottoms = np.cumsum(counts, axis=1) - counts
+    positions = np.arange(len(device_ids))
+
+    figure = Figure(figsize=(8, 4))
+    axes = figure.add_subplot()
+    for index, category in enumerate(SCORE_CATEGORIES):
+        axes.bar(positions, counts[:, index], bottom=bottoms[:, index], label=category.capitalize())
+    axes.set_title('Alerts by Device')
+    axes.set_ylabel('Number of Alerts')
+    axes.set_xticks(positions)
+    axes.set_xticklabels([device_names.get(device_id, device_id) for device_id in device_ids], rotation=30, ha='right')
+    axes.legend()
+    figure.tight_layout()
+    return figure
+
+class ChartCache:
+    """PNG cache for report charts
+
+    Charts are keyed by name, date range, device and the history data
+    version, so a chart is drawn again only once new history arrives.
+    Recent PNGs are kept in memory and all of them on disk, pruned to the
+    newest disk_entries files.
+    """
+
+    def __init__(self, cache_dir, settings=None):
+        self.logger = get_logger(__name__)
+        self.cache_dir = cache_dir
+        self.settings = dict(DEFAULT_CHART_SETTINGS)
+        self.settings.update(settings or {})
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(name, start_date, end_date, device_id, data_version):
+        return "|".join([
+            name,
+            start_date.isoformat(),
+            end_date.isoformat(),
+            device_id or '*',
+            str(data_version)
+        ])
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + ".png")
+
+    def get_or_render(self, key, build_figure):
+        """Get the cached PNG bytes for key, or draw build_figure() and cache it"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+        path = self._path(key)
+        png = None
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    png = f.read()
+            except OSError:
+                png = None
+
+        if png is None:
+            png = render_png(build_figure())
+            self._write(path, png)
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.hits += 1
+
+        with self._lock:
+            self._memory[key] = png
+            while len(self._memory) > int(self.settings['memory_entries']):
+                self._memory.popitem(last=False)
+        return png
+
+    def _write(self, path, png):
+        try:
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(png)
+            os.replace(temp_path, path)
+            self._prune()
+        except OSError as e:
+            self.logger.warning(f"Failed to cache chart: {str(e)}")
+
+    def _prune(self):
+        """Drop the oldest cached charts beyond disk_entries"""
+        files = [
+            os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith('.png')
+        ]
+        excess = len(files) - int(self.settings['disk_entries'])
+        if excess > 0:
+            for path in sorted(files, key=os.path.getmtime)[:excess]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def get_stats(self):
+        with self._lock:
+            return {'memory_entries': len(self._memory), 'hits': self.hits, 'misses': self.misses}
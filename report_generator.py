@@ -1,44 +1,119 @@
 import os
+import csv
+import heapq
+import threading
 from datetime import datetime, timedelta
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-import matplotlib.pyplot as plt
 import io
 from utils.logger import get_logger
+from history_rollups import ALERT_THRESHOLD
+from history_store import SCORE_CATEGORIES
+from report_charts import ChartCache, trends_figure, hourly_heatmap_figure, device_bars_figure
+
+DEFAULT_REPORT_SETTINGS = {
+    'alert_rows_per_table': 100,
+    'max_alert_rows': 500,
+    'export_details': None
+}
+
+ALERT_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 14),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 12),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+# Standard periods offered in the report menu
+REPORT_PERIODS = ('last_7_days', 'last_30_days', 'today', 'yesterday')
+
+def period_range(period, now=None):
+    """Get (start_date, end_date) for one of REPORT_PERIODS, both inclusive
+
+    Starts fall on the hour, so a period is made of whole rollup hours and
+    a report built earlier in the same hour still covers the same data.
+    """
+    end_date = now or datetime.now()
+    hour = end_date.replace(minute=0, second=0, microsecond=0)
+    start_date = hour - timedelta(days=7)
+
+    if period == "last_7_days":
+        start_date = hour - timedelta(days=7)
+    elif period == "last_30_days":
+        start_date = hour - timedelta(days=30)
+    elif period == "today":
+        start_date = hour.replace(hour=0)
+    elif period == "yesterday":
+        # End just before midnight so today's first screenshots are not counted
+        start_date = hour.replace(hour=0) - timedelta(days=1)
+        end_date = hour.replace(hour=0) - timedelta(microseconds=1)
+    return start_date, end_date
+
+class ReportCancelled(Exception):
+    """Raised from a progress callback to abort report generation"""
 
 class ReportGenerator:
-    def __init__(self, screenshot_history, device_manager):
+    def __init__(self, screenshot_history, device_manager, config=None):
         self.logger = get_logger(__name__)
         self.screenshot_history = screenshot_history
+        self.rollups = screenshot_history.rollups
         self.device_manager = device_manager
+        self.settings = dict(DEFAULT_REPORT_SETTINGS)
+        if config is not None:
+            self.settings.update(config.get('report_settings', {}))
         self.reports_dir = "data/reports"
         os.makedirs(self.reports_dir, exist_ok=True)
-
-    def generate_report(self, start_date=None, end_date=None, device_id=None):
-        """Generate a comprehensive activity report"""
+        self.charts = ChartCache(
+            os.path.join(self.reports_dir, "charts"),
+            config.get('chart_cache') if config is not None else None
+        )
+
+    def generate_report(self, start_date=None, end_date=None, device_id=None, progress=None):
+        """Generate a comprehensive activity report
+
+        progress(fraction, message) is called between sections and for each
+        page laid out; it may raise ReportCancelled to stop, in which case
+        the partial PDF is discarded and the exception propagates.
+        """
+        progress = progress or (lambda fraction, message: None)
+        temp_path = None
+        export_path = None
         try:
+            progress(0.0, "Collecting statistics")
+
             # Default to last 7 days if no dates specified
             if not end_date:
                 end_date = datetime.now()
             if not start_date:
                 start_date = end_date - timedelta(days=7)
 
-            # Get relevant screenshots
-            entries = self._get_filtered_entries(start_date, end_date, device_id)
-            if not entries:
+            # Totals come from the hourly/daily rollups rather than a history scan
+            summary = self.rollups.summary(start_date, end_date, device_id)
+            if not summary['count']:
                 self.logger.warning("No data available for the specified period")
                 return None
 
+            # Device names are looked up once per report
+            device_names = {}
+
             # Create report filename
-            device_info = f"_{self.device_manager.get_device(device_id).name}" if device_id else ""
+            device_info = f"_{self._device_name(device_id, device_names)}" if device_id else ""
             filename = f"activity_report{device_info}_{start_date.strftime('%Y%m%d')}-{end_date.strftime('%Y%m%d')}.pdf"
             filepath = os.path.join(self.reports_dir, filename)
 
-            # Generate PDF
-            doc = SimpleDocTemplate(filepath, pagesize=letter)
+            # Generate PDF into a private file so a cancelled or concurrent build never clobbers a finished one
+            temp_path = f"{filepath}.{threading.get_ident()}.tmp"
+            doc = SimpleDocTemplate(temp_path, pagesize=letter)
             styles = getSampleStyleSheet()
             story = []
 
@@ -58,63 +133,71 @@ class ReportGenerator:
             story.append(Spacer(1, 12))
 
             # Add summary statistics
-            story.extend(self._create_summary_section(entries))
+            story.extend(self._create_summary_section(summary))
             story.append(Spacer(1, 20))
 
             # Add alert trends graph
-            story.extend(self._create_trends_section(entries))
+            progress(0.1, "Drawing charts")
+            story.extend(self._create_trends_section(start_date, end_date, device_id))
+            story.append(Spacer(1, 20))
+            story.extend(self._create_heatmap_section(start_date, end_date, device_id))
             story.append(Spacer(1, 20))
 
             # Add device activity summary
             if not device_id:
-                story.extend(self._create_device_summary_section(entries))
+                story.extend(self._create_device_summary_section(start_date, end_date, device_names))
                 story.append(Spacer(1, 20))
 
-            # Add detailed alerts table
-            story.extend(self._create_alerts_section(entries))
-
-            # Build PDF
-            doc.build(story)
+            # Add detailed alerts table; the full list goes to a side file
+            progress(0.3, "Collecting alerts")
+            alerts = self._alert_entries(self._get_filtered_entries(start_date, end_date, device_id))
+            if alerts:
+                export_path = self._export_alerts(alerts, os.path.splitext(filepath)[0], device_names)
+            story.extend(self._create_alerts_section(alerts, device_names, export_path))
+
+            # Build PDF, checking for cancellation as each page is laid out
+            progress(0.5, "Laying out pages")
+            def on_page(canvas, page_doc):
+                progress(0.5, f"Laying out page {page_doc.page}")
+            doc.build(story, onFirstPage=on_page, onLaterPages=on_page)
+            os.replace(temp_path, filepath)
+            progress(1.0, "Finished")
             self.logger.info(f"Report generated successfully: {filepath}")
             return filepath
 
+        except ReportCancelled:
+            self.logger.info("Report generation cancelled")
+            self._discard(temp_path)
+            self._discard(export_path)
+            raise
         except Exception as e:
             self.logger.error(f"Failed to generate report: {str(e)}")
+            self._discard(temp_path)
             return None
 
+    def _device_name(self, device_id, cache):
+        """Resolve a device name, remembering it in cache"""
+        if device_id not in cache:
+            device = self.device_manager.get_device(device_id) if device_id else None
+            cache[device_id] = device.name if device else 'Unknown Device'
+        return cache[device_id]
+
+    def _discard(self, path):
+        if path and os.path.exists(path):
+            os.remove(path)
+
     def _get_filtered_entries(self, start_date, end_date, device_id=None):
-        """Get filtered screenshot entries"""
-        entries = self.screenshot_history.get_history()
-        filtered_entries = []
-        
-        for entry in entries:
-            timestamp = datetime.fromisoformat(entry['timestamp'])
-            if start_date <= timestamp <= end_date:
-                if device_id is None or entry.get('device_id') == device_id:
-                    filtered_entries.append(entry)
-        
-        return filtered_entries
+        """Get screenshot entries in the period, oldest first, from the store's timestamp index"""
+        return self.screenshot_history.entries_between(start_date, end_date, device_id)
 
-    def _create_summary_section(self, entries):
-        """Create summary statistics section"""
+    def _create_summary_section(self, summary):
+        """Create summary statistics section from a rollup bucket"""
         styles = getSampleStyleSheet()
         elements = []
         
         # Calculate statistics
-        total_screenshots = len(entries)
-        alerts_by_category = {
-            'violence': 0,
-            'adult': 0,
-            'hate': 0,
-            'drugs': 0,
-            'gambling': 0
-        }
-        
-        for entry in entries:
-            analysis = entry.get('analysis', {})
-            for category, score in analysis.items():
-                if category in alerts_by_category and score >= 0.7:
-                    alerts_by_category[category] += 1
+        total_screenshots = summary['count']
+        alerts_by_category = summary['category_alerts']
 
         # Create summary table
         summary_data = [
@@ -148,78 +231,59 @@ class ReportGenerator:
         
         return elements
 
-    def _create_trends_section(self, entries):
+    def _chart(self, name, start_date, end_date, device_id, build_figure):
+        """Get a chart as a PDF flowable, drawing it only if history changed since it was cached"""
+        key = ChartCache.make_key(name, start_date, end_date, device_id, self.rollups.version(device_id))
+        png = self.charts.get_or_render(key, build_figure)
+        return Image(io.BytesIO(png), width=6*inch, height=3*inch)
+
+    def _create_trends_section(self, start_date, end_date, device_id=None):
         """Create trends visualization section"""
         styles = getSampleStyleSheet()
         elements = []
 
-        # Create trends graph
-        plt.figure(figsize=(8, 4))
-        dates = sorted(list({datetime.fromisoformat(e['timestamp']).date() for e in entries}))
-        
-        alerts_by_date = {
-            'violence': [0] * len(dates),
-            'adult': [0] * len(dates),
-            'hate': [0] * len(dates),
-            'drugs': [0] * len(dates),
-            'gambling': [0] * len(dates)
-        }
-
-        for entry in entries:
-            date = datetime.fromisoformat(entry['timestamp']).date()
-            date_index = dates.index(date)
-            analysis = entry.get('analysis', {})
-            
-            for category in alerts_by_date.keys():
-                if analysis.get(category, 0) >= 0.7:
-                    alerts_by_date[category][date_index] += 1
-
-        # Plot trends
-        plt.clf()
-        for category, values in alerts_by_date.items():
-            plt.plot(dates, values, marker='o', label=category.capitalize())
-
-        plt.title('Alert Trends Over Time')
-        plt.xlabel('Date')
-        plt.ylabel('Number of Alerts')
-        plt.xticks(rotation=45)
-        plt.legend()
-        plt.tight_layout()
-
-        # Save plot to bytes buffer
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png')
-        img_buffer.seek(0)
+        chart = self._chart(
+            'trends', start_date, end_date, device_id,
+            lambda: trends_figure(self.rollups.daily(start_date, end_date, device_id))
+        )
 
         # Add to PDF
         elements.append(Paragraph("Alert Trends", styles['Heading2']))
         elements.append(Spacer(1, 12))
-        elements.append(Image(img_buffer, width=6*inch, height=3*inch))
+        elements.append(chart)
         
         return elements
 
-    def _create_device_summary_section(self, entries):
+    def _create_heatmap_section(self, start_date, end_date, device_id=None):
+        """Create the alerts by hour of day section"""
+        styles = getSampleStyleSheet()
+        elements = []
+
+        chart = self._chart(
+            'heatmap', start_date, end_date, device_id,
+            lambda: hourly_heatmap_figure(self.rollups.hourly(start_date, end_date, device_id), start_date, end_date)
+        )
+
+        elements.append(Paragraph("Alerts by Hour", styles['Heading2']))
+        elements.append(Spacer(1, 12))
+        elements.append(chart)
+
+        return elements
+
+    def _create_device_summary_section(self, start_date, end_date, device_names):
         """Create device activity summary section"""
         styles = getSampleStyleSheet()
         elements = []
 
-        # Group entries by device
+        device_buckets = self.rollups.by_device(start_date, end_date)
+
         device_stats = {}
-        for entry in entries:
-            device_id = entry.get('device_id')
-            if device_id:
-                if device_id not in device_stats:
-                    device = self.device_manager.get_device(device_id)
-                    device_stats[device_id] = {
-                        'name': device.name if device else 'Unknown Device',
-                        'screenshots': 0,
-                        'alerts': 0
-                    }
-                
-                device_stats[device_id]['screenshots'] += 1
-                analysis = entry.get('analysis', {})
-                if any(score >= 0.7 for score in analysis.values()):
-                    device_stats[device_id]['alerts'] += 1
+        for device_id, bucket in device_buckets.items():
+            device_stats[device_id] = {
+                'name': self._device_name(device_id, device_names),
+                'screenshots': bucket['count'],
+                'alerts': bucket['alerts']
+            }
 
         # Create device summary table
         if device_stats:
@@ -250,61 +314,130 @@ class ReportGenerator:
             elements.append(Spacer(1, 12))
             elements.append(table)
 
+            # Alerts per category for each device, stacked
+            names = {device_id: stats['name'] for device_id, stats in device_stats.items()}
+            elements.append(Spacer(1, 12))
+            elements.append(self._chart(
+                'devices', start_date, end_date, None,
+                lambda: device_bars_figure(device_buckets, names)
+            ))
+
         return elements
 
-    def _create_alerts_section(self, entries):
-        """Create detailed alerts section"""
+    def _alert_entries(self, entries):
+        """Get [(entry, {category: score})] for entries with at least one alert, oldest first"""
+        alerts = []
+        for entry in entries:
+            analysis = entry.get('analysis') or {}
+            alerted = {}
+            for category in SCORE_CATEGORIES:
+                try:
+                    score = float(analysis.get(category))
+                except (TypeError, ValueError):
+                    continue
+                if score >= ALERT_THRESHOLD:
+                    alerted[category] = score
+            if alerted:
+                alerts.append((entry, alerted))
+        return alerts
+
+    def _export_alerts(self, alerts, base_path, device_names):
+        """Write every alert with all its scores to CSV, or Parquet if configured and pyarrow is installed
+
+        Returns the path written, or None.
+        """
+        export = self.settings.get('export_details')
+        if export not in ('csv', 'parquet'):
+            return None
+
+        columns = ['timestamp', 'device_id', 'device_name', *SCORE_CATEGORIES, 'program_name', 'filename']
+        rows = []
+        for entry, _ in alerts:
+            analysis = entry.get('analysis') or {}
+            rows.append([
+                entry['timestamp'],
+                entry.get('device_id'),
+                self._device_name(entry.get('device_id'), device_names),
+                *(analysis.get(category) for category in SCORE_CATEGORIES),
+                analysis.get('program_name'),
+                entry['filename']
+            ])
+
+        try:
+            if export == 'parquet':
+                try:
+                    import pyarrow
+                    import pyarrow.parquet
+                    path = f"{base_path}_alerts.parquet"
+                    table = pyarrow.table({name: [row[i] for row in rows] for i, name in enumerate(columns)})
+                    pyarrow.parquet.write_table(table, path)
+                    return path
+                except ImportError:
+                    self.logger.info("pyarrow not installed, exporting alerts as CSV")
+
+            path = f"{base_path}_alerts.csv"
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                writer.writerows(rows)
+            return path
+        except Exception as e:
+            self.logger.error(f"Failed to export alert details: {str(e)}")
+            return None
+
+    def _create_alerts_section(self, alerts, device_names, export_path=None):
+        """Create detailed alerts section
+
+        Shows the max_alert_rows alerts with the highest scores, in time
+        order, as a series of alert_rows_per_table row tables that repeat
+        their header, so layout time stays bounded however many alerts the
+        period has.
+        """
         styles = getSampleStyleSheet()
         elements = []
+        if not alerts:
+            return elements
 
-        # Filter entries with alerts
-        alert_entries = [
-            entry for entry in entries
-            if any(float(score) >= 0.7 for score in entry.get('analysis', {}).values())
-        ]
-
-        if alert_entries:
-            table_data = [['Date/Time', 'Device', 'Categories', 'Scores']]
-            
-            for entry in alert_entries:
-                timestamp = datetime.fromisoformat(entry['timestamp'])
-                device = self.device_manager.get_device(entry.get('device_id'))
-                device_name = device.name if device else 'Unknown Device'
-                
-                # Format alert categories and scores
-                analysis = entry.get('analysis', {})
-                alert_cats = []
-                alert_scores = []
-                
-                for category, score in analysis.items():
-                    if score >= 0.7:
-                        alert_cats.append(category.capitalize())
-                        alert_scores.append(f"{score:.2f}")
+        max_rows = int(self.settings['max_alert_rows'])
+        shown = alerts
+        if max_rows and len(alerts) > max_rows:
+            shown = heapq.nlargest(max_rows, alerts, key=lambda alert: max(alert[1].values()))
+            shown.sort(key=lambda alert: alert[0]['timestamp'])
 
-                table_data.append([
-                    timestamp.strftime('%Y-%m-%d %H:%M'),
-                    device_name,
-                    '\n'.join(alert_cats),
-                    '\n'.join(alert_scores)
-                ])
+        rows = []
+        for entry, alerted in shown:
+            timestamp = datetime.fromisoformat(entry['timestamp'])
+            rows.append([
+                timestamp.strftime('%Y-%m-%d %H:%M'),
+                self._device_name(entry.get('device_id'), device_names),
+                '\n'.join(category.capitalize() for category in alerted),
+                '\n'.join(f"{score:.2f}" for score in alerted.values())
+            ])
+
+        elements.append(Paragraph("Detailed Alerts", styles['Heading2']))
+        elements.append(Spacer(1, 12))
 
-            table = Table(table_data, colWidths=[1.5*inch, 1.5*inch, 2*inch, 1.5*inch])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 14),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 12),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
+        header = ['Date/Time', 'Device', 'Categories', 'Scores']
+        chunk_size = max(1, int(self.settings['alert_rows_per_table']))
+        for start in range(0, len(rows), chunk_size):
+            table = Table(
+                [header] + rows[start:start + chunk_size],
+                colWidths=[1.5*inch, 1.5*inch, 2*inch, 1.5*inch],
+                repeatRows=1
+            )
+            table.setStyle(ALERT_TABLE_STYLE)
+            elements.append(table)
 
-            elements.append(Paragraph("Detailed Alerts", styles['Heading2']))
+        hidden = len(alerts) - len(shown)
+        if hidden:
             elements.append(Spacer(1, 12))
-            elements.append(table)
+            elements.append(Paragraph(
+                f"{hidden} more alerts with lower scores are not shown.", styles['Normal']
+            ))
+        if export_path:
+            elements.append(Spacer(1, 6))
+            elements.append(Paragraph(
+                f"All {len(alerts)} alerts: {os.path.basename(export_path)}", styles['Normal']
+            ))
 
         return elements
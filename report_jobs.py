@@ -0,0 +1,192 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.logger import get_logger
+from report_generator import ReportCancelled
+
+DEFAULT_REPORT_JOB_SETTINGS = {
+    'workers': 2,
+    'poll_interval_ms': 100,
+    'idle_poll_interval_ms': 500
+}
+
+class ReportJob:
+    """One report being built in the background
+
+    status is 'queued', 'running', 'done', 'failed' or 'cancelled'; path
+    is the generated PDF once status is 'done'. data_version is the history
+    version the report was started from.
+    """
+
+    def __init__(self, key, start_date, end_date, device_id, data_version=None):
+        self.key = key
+        self.start_date = start_date
+        self.end_date = end_date
+        self.device_id = device_id
+        self.data_version = data_version
+        self.status = 'queued'
+        self.progress = 0.0
+        self.message = "Queued"
+        self.path = None
+        self.future = None
+        self._cancel_event = threading.Event()
+        self._progress_listeners = []
+        self._done_listeners = []
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def cancel(self):
+        """Ask the job to stop at its next progress checkpoint"""
+        self._cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            self.status = 'cancelled'
+
+    def add_listeners(self, on_progress=None, on_done=None):
+        if on_progress:
+            self._progress_listeners.append(on_progress)
+        if on_done:
+            self._done_listeners.append(on_done)
+
+class ReportJobRunner:
+    """Builds PDF reports on a thread pool so the Tk main loop never blocks
+
+    Identical requests (same key) share one job. Progress and completion
+    callbacks are queued by the workers and delivered on the Tk thread by
+    polling with root.after; without a root they run on the worker thread.
+    Jobs may be submitted from any thread.
+    """
+
+    def __init__(self, report_generator, root=None, settings=None):
+        self.report_generator = report_generator
+        self.root = root
+        self.logger = get_logger(__name__)
+        self.settings = dict(DEFAULT_REPORT_JOB_SETTINGS)
+        self.settings.update(settings or {})
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._events = queue.Queue()
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, int(self.settings['workers'])),
+            thread_name_prefix="report"
+        )
+        # Polling runs for the runner's lifetime so other threads never have to touch Tk
+        if root is not None:
+            root.after(self.settings['poll_interval_ms'], self._poll)
+
+    def submit(self, start_date, end_date, device_id=None, key=None, on_progress=None, on_done=None):
+        """Queue a report, or attach to the identical one already running
+
+        on_progress(job) and on_done(job) are called as the job advances
+        and when it finishes, whatever its outcome.
+        """
+        key = key or (start_date.isoformat(), end_date.isoformat(), device_id)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or job.cancelled:
+                job = ReportJob(
+                    key, start_date, end_date, device_id,
+                    self.report_generator.rollups.version(device_id)
+                )
+                self._jobs[key] = job
+                job.add_listeners(on_progress, on_done)
+                job.future = self._executor.submit(self._run, job)
+            else:
+                job.add_listeners(on_progress, on_done)
+        return job
+
+    def active_jobs(self):
+        """Jobs still queued or running; finished ones may await Tk delivery"""
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.future.done()]
+
+    def cancel(self, key):
+        """Cancel the job for a key, if one is running"""
+        with self._lock:
+            job = self._jobs.get(key)
+        if job:
+            job.cancel()
+            if job.status == 'cancelled':
+                # Cancelled before it started, so _run will never report it
+                self._post(job, 'finished')
+
+    def cancel_all(self):
+        for job in self.active_jobs():
+            self.cancel(job.key)
+
+    def _checkpoint(self, job, fraction, message):
+        """Progress callback handed to the generator; raises to abort a cancelled job"""
+        if job.cancelled:
+            raise ReportCancelled()
+        job.progress = fraction
+        job.message = message
+        self._post(job, 'progress')
+
+    def _run(self, job):
+        job.status = 'running'
+        try:
+            job.path = self.report_generator.generate_report(
+                job.start_date,
+                job.end_date,
+                job.device_id,
+                progress=lambda fraction, message: self._checkpoint(job, fraction, message)
+            )
+            job.status = 'done' if job.path else 'failed'
+            job.message = "Finished" if job.path else "No report generated"
+        except ReportCancelled:
+            job.status = 'cancelled'
+            job.message = "Cancelled"
+        except Exception as e:
+            self.logger.error(f"Report job failed: {str(e)}")
+            job.status = 'failed'
+            job.message = str(e)
+        self._post(job, 'finished')
+
+    def _post(self, job, kind):
+        if self.root is None:
+            self._deliver(job, kind)
+        else:
+            self._events.put((job, kind))
+
+    def _deliver(self, job, kind):
+        if kind == 'finished':
+            with self._lock:
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+            listeners = job._done_listeners
+        else:
+            listeners = job._progress_listeners
+
+        for listener in list(listeners):
+            try:
+                listener(job)
+            except Exception as e:
+                self.logger.error(f"Report job callback failed: {str(e)}")
+
+    def _poll(self):
+        """Deliver queued job events on the Tk thread"""
+        while True:
+            try:
+                job, kind = self._events.get_nowait()
+            except queue.Empty:
+                break
+            self._deliver(job, kind)
+
+        if self._stopped:
+            return
+        with self._lock:
+            busy = bool(self._jobs)
+        interval = self.settings['poll_interval_ms'] if busy else self.settings['idle_poll_interval_ms']
+        self.root.after(interval, self._poll)
+
+    def shutdown(self):
+        """Cancel running jobs and stop the workers"""
+        self._stopped = True
+        self.cancel_all()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import CancelledError
+from datetime import datetime
+from utils.logger import get_logger
+from report_generator import REPORT_PERIODS, period_range
+
+DEFAULT_SCHEDULER_SETTINGS = {
+    'enabled': True,
+    'periods': list(REPORT_PERIODS),
+    'per_device': True,
+    'check_interval': 300,
+    'idle_seconds': 120
+}
+
+MANIFEST_FORMAT = 1
+
+class ReportScheduler:
+    """Pre-builds the standard period reports while the app is idle
+
+    Every check_interval seconds, once no report has been requested or
+    built for idle_seconds, each configured period is built for all devices
+    (and each device with per_device) if its manifest entry is out of date.
+    An entry is current while the history data version and the period's
+    hour-resolved range match the ones the PDF was built from. The
+    manifest lives in data/reports/manifest.json next to the PDFs.
+
+    Rebuilds reuse the cached rollups and charts, so only what changed
+    since the last build is recomputed.
+    """
+
+    def __init__(self, report_generator, job_runner, device_manager, settings=None):
+        self.report_generator = report_generator
+        self.job_runner = job_runner
+        self.device_manager = device_manager
+        self.logger = get_logger(__name__)
+        self.settings = dict(DEFAULT_SCHEDULER_SETTINGS)
+        self.settings.update(settings or {})
+        self.manifest_file = os.path.join(report_generator.reports_dir, "manifest.json")
+        self._lock = threading.Lock()
+        self._manifest = self._load_manifest()
+        self._last_activity = time.monotonic()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def manifest_key(period, device_id):
+        return f"{period}|{device_id or '*'}"
+
+    @staticmethod
+    def _range_signature(start_date, end_date):
+        # Periods start on the hour; data inside the hour is covered by the data version
+        return [start_date.strftime('%Y-%m-%dT%H'), end_date.strftime('%Y-%m-%dT%H')]
+
+    def _load_manifest(self):
+        try:
+            if os.path.exists(self.manifest_file):
+                with open(self.manifest_file, 'r') as f:
+                    data = json.load(f)
+                if data.get('format') == MANIFEST_FORMAT:
+                    return data.get('reports', {})
+        except Exception as e:
+            self.logger.error(f"Failed to load report manifest: {str(e)}")
+        return {}
+
+    def _save_manifest(self):
+        """Write the manifest atomically (caller holds the lock)"""
+        try:
+            temp_file = f"{self.manifest_file}.tmp"
+            with open(temp_file, 'w') as f:
+                json.dump({'format': MANIFEST_FORMAT, 'reports': self._manifest}, f, indent=4)
+            os.replace(temp_file, self.manifest_file)
+        except Exception as e:
+            self.logger.error(f"Failed to save report manifest: {str(e)}")
+
+    def start(self):
+        """Start the background scheduling thread"""
+        if not self.settings.get('enabled') or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="report-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def note_activity(self):
+        """Postpone pre-building after the user asked for a report"""
+        self._last_activity = time.monotonic()
+
+    def _is_idle(self):
+        return (
+            not self.job_runner.active_jobs() and
+            time.monotonic() - self._last_activity >= float(self.settings['idle_seconds'])
+        )
+
+    def targets(self):
+        """(period, device_id) pairs to keep built"""
+        device_ids = [None]
+        if self.settings.get('per_device'):
+            device_ids += [device.device_id for device in self.device_manager.get_all_devices()]
+        return [(period, device_id) for period in self.settings['periods'] for device_id in device_ids]
+
+    def lookup(self, period, device_id=None):
+        """Get the path of an up-to-date pre-built report, or None"""
+        start_date, end_date = period_range(period)
+        with self._lock:
+            entry = self._manifest.get(self.manifest_key(period, device_id))
+        if not entry or not os.path.exists(entry['path']):
+            return None
+        if entry['data_version'] != self.report_generator.rollups.version(device_id):
+            return None
+        if entry['range'] != self._range_signature(start_date, end_date):
+            return None
+        return entry['path']
+
+    def record(self, job):
+        """Remember a finished report built for a (period, device_id) key"""
+        if job.status != 'done' or not isinstance(job.key, tuple):
+            return
+        period, device_id = job.key
+        if period not in REPORT_PERIODS:
+            return
+
+        key = self.manifest_key(period, device_id)
+        with self._lock:
+            previous = self._manifest.get(key)
+            self._manifest[key] = {
+                'path': job.path,
+                'data_version': job.data_version,
+                'range': self._range_signature(job.start_date, job.end_date),
+                'built_at': datetime.now().isoformat()
+            }
+            if previous and previous['path'] != job.path:
+                self._discard_unreferenced(previous['path'])
+            self._save_manifest()
+
+    def _discard_unreferenced(self, path):
+        """Delete a superseded PDF and its alert export unless another entry still uses it (caller holds the lock)"""
+        if any(entry['path'] == path for entry in self._manifest.values()):
+            return
+        base = os.path.splitext(path)[0]
+        for candidate in (path, f"{base}_alerts.csv", f"{base}_alerts.parquet"):
+            try:
+                if os.path.exists(candidate):
+                    os.remove(candidate)
+            except OSError as e:
+                self.logger.warning(f"Failed to remove old report {candidate}: {str(e)}")
+
+    def _loop(self):
+        while not self._stop_event.wait(float(self.settings['check_interval'])):
+            try:
+                self.run_pending()
+            except Exception as e:
+                self.logger.error(f"Report pre-generation failed: {str(e)}")
+
+    def run_pending(self):
+        """Build out-of-date reports one at a time while the app stays idle"""
+        for period, device_id in self.targets():
+            if self._stop_event.is_set() or not self._is_idle():
+                return
+            if self.lookup(period, device_id):
+                continue
+
+            start_date, end_date = period_range(period)
+            if not self.report_generator.rollups.summary(start_date, end_date, device_id)['count']:
+                continue
+
+            job = self.job_runner.submit(start_date, end_date, device_id, key=(period, device_id))
+            try:
+                job.future.result()
+            except CancelledError:
+                return
+            # Record now rather than on the Tk thread, so lookup sees it on the next pass
+            self.record(job)
+            self.logger.info(f"Pre-built {period} report for {device_id or 'all devices'}: {job.status}")
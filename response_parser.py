@@ -0,0 +1,210 @@
+import ast
+import json
+import re
+from history_store import SCORE_CATEGORIES
+
+DEFAULT_PARSER_SETTINGS = {
+    'strict_schema': True,
+    'reask': True
+}
+
+SCORES_SCHEMA = {
+    'type': 'object',
+    'properties': dict(
+        {category: {'type': 'number'} for category in SCORE_CATEGORIES},
+        program_name={'type': ['string', 'null']}
+    ),
+    'required': list(SCORE_CATEGORIES) + ['program_name'],
+    'additionalProperties': False
+}
+
+# Gemini takes an OpenAPI subset: no type unions or additionalProperties
+GEMINI_SCORES_SCHEMA = {
+    'type': 'object',
+    'properties': dict(
+        {category: {'type': 'number'} for category in SCORE_CATEGORIES},
+        program_name={'type': 'string', 'nullable': True}
+    ),
+    'required': list(SCORE_CATEGORIES)
+}
+
+REASK_PROMPT = (
+    "Rewrite the following screenshot analysis as a JSON object with the keys "
+    "violence, adult, hate, drugs, gambling (floats between 0.0 and 1.0) and "
+    "program_name (string or null). Reply with the JSON only.\n\n"
+)
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+# The optional percent sign is kept so clamp_score can scale it
+_NUMBER = r"['\"]?\s*[:=]\s*['\"]?(-?\d+(?:\.\d+)?\s*%?)"
+
+class ResponseParseError(ValueError):
+    """Raised when no scores can be recovered from a model response"""
+
+def openai_response_format(batch=False):
+    """Strict structured output schema for OpenAI chat completions"""
+    schema = SCORES_SCHEMA
+    if batch:
+        schema = {
+            'type': 'object',
+            'properties': {'results': {'type': 'array', 'items': SCORES_SCHEMA}},
+            'required': ['results'],
+            'additionalProperties': False
+        }
+    return {
+        'type': 'json_schema',
+        'json_schema': {
+            'name': 'content_scores_batch' if batch else 'content_scores',
+            'strict': True,
+            'schema': schema
+        }
+    }
+
+def gemini_generation_config(batch=False):
+    """JSON output config for Gemini generate_content"""
+    schema = GEMINI_SCORES_SCHEMA
+    if batch:
+        schema = {
+            'type': 'object',
+            'properties': {'results': {'type': 'array', 'items': GEMINI_SCORES_SCHEMA}},
+            'required': ['results']
+        }
+    return {'response_mime_type': 'application/json', 'response_schema': schema}
+
+def _balanced(text, opening, closing):
+    """Get the first balanced opening...closing span in text, or None"""
+    start = text.find(opening)
+    while start != -1:
+        depth = 0
+        in_string = None
+        escaped = False
+        for index in range(start, len(text)):
+            char = text[index]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == in_string:
+                    in_string = None
+            elif char in '"\'':
+                in_string = char
+            elif char == opening:
+                depth += 1
+            elif char == closing:
+                depth -= 1
+                if depth == 0:
+                    return text[start:index + 1]
+        start = text.find(opening, start + 1)
+    return None
+
+def _loads(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    # Models following the prompt's example sometimes answer with Python-style quotes
+    try:
+        value = ast.literal_eval(text)
+        if isinstance(value, (dict, list)):
+            return value
+    except (ValueError, SyntaxError):
+        pass
+    return None
+
+def extract_json(content):
+    """Recover a JSON object or array from a model response
+
+    Accepts parsed objects, bare JSON, JSON in markdown fences and JSON
+    surrounded by prose. Returns None when nothing parses.
+    """
+    if isinstance(content, (dict, list)):
+        return content
+    if not isinstance(content, str):
+        return None
+
+    text = content.strip()
+    candidates = [text]
+    candidates += [match.strip() for match in _FENCE.findall(text)]
+    for candidate in list(candidates):
+        for opening, closing in (('{', '}'), ('[', ']')):
+            span = _balanced(candidate, opening, closing)
+            if span:
+                candidates.append(span)
+
+    for candidate in candidates:
+        value = _loads(candidate)
+        if value is not None:
+            return value
+    return None
+
+def clamp_score(value):
+    """Coerce a score to a float in [0.0, 1.0], or None if it is not a number"""
+    if isinstance(value, bool):
+        return None
+    try:
+        score = float(str(value).strip().rstrip('%')) if isinstance(value, str) else float(value)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(value, str) and value.strip().endswith('%'):
+        score /= 100.0
+    if score != score:
+        return None
+    return min(max(score, 0.0), 1.0)
+
+def _salvage(text):
+    """Pull category scores out of malformed or truncated text"""
+    found = {}
+    for category in SCORE_CATEGORIES + ('explicit',):
+        match = re.search(re.escape(category) + _NUMBER, text, re.IGNORECASE)
+        if match:
+            found[category] = match.group(1)
+    match = re.search(r"program_name['\"]?\s*:\s*['\"]([^'\"]*)['\"]", text)
+    if match:
+        found['program_name'] = match.group(1)
+    return found
+
+def parse_scores(content):
+    """Parse one analysis into clamped category scores and a program name
+
+    Missing categories score 0.0. Results recovered from malformed text
+    are marked 'partial'. Raises ResponseParseError if no category score
+    can be found.
+    """
+    data = extract_json(content)
+    partial = False
+    if not isinstance(data, dict):
+        data = _salvage(content) if isinstance(content, str) else {}
+        partial = True
+
+    scores = {category: 0.0 for category in SCORE_CATEGORIES}
+    scores['program_name'] = None
+    found = 0
+    for category in SCORE_CATEGORIES:
+        score = clamp_score(data.get(category)) if category in data else None
+        if score is not None:
+            scores[category] = score
+            found += 1
+
+    # Special case check for 'explicit' contributing to the 'adult' score
+    explicit = clamp_score(data.get('explicit')) if 'explicit' in data else None
+    if explicit is not None:
+        scores['adult'] = min(scores['adult'] + explicit, 1.0)
+        found += 1
+
+    if not found:
+        raise ResponseParseError("No category scores in response")
+
+    if data.get('program_name'):
+        scores['program_name'] = str(data['program_name'])
+    if partial:
+        scores['partial'] = True
+    return scores
+
+def parse_batch(content, count):
+    """Split a batched response into per-frame scores"""
+    data = extract_json(content)
+    results = data.get('results') if isinstance(data, dict) else data
+    if not isinstance(results, list) or len(results) != count:
+        raise ResponseParseError(f"Expected {count} results in batched response")
+    return [parse_scores(result) for result in results]
@@ -1,45 +1,58 @@
 import os
 from datetime import datetime
 from PIL import Image
-import json
 from utils.logger import get_logger
+from history_store import JSONHistoryStore, SQLiteHistoryStore, JournalHistoryStore
+from history_rollups import HistoryRollups
+
+# Fits the Dashboard preview pane
+THUMBNAIL_SIZE = (400, 300)
 
 class ScreenshotHistory:
-    def __init__(self):
+    def __init__(self, backend='sqlite', settings=None, rollup_settings=None):
         self.logger = get_logger(__name__)
         self.screenshots_dir = os.path.join("data", "screenshots")
+        self.thumbnails_dir = os.path.join(self.screenshots_dir, "thumbnails")
         self.history_file = os.path.join(self.screenshots_dir, "history.json")
+        self.db_file = os.path.join(self.screenshots_dir, "history.db")
+        self.journal_file = os.path.join(self.screenshots_dir, "history.jsonl")
+        self.rollup_file = os.path.join(self.screenshots_dir, "rollups.jsonl")
         self._ensure_directories()
-        self._load_history()
+        self.store = self._create_store(backend, settings)
+        self._remove_legacy_rollups()
+        self.rollups = HistoryRollups(self.rollup_file, self.store, rollup_settings)
 
     def _ensure_directories(self):
         """Ensure required directories exist"""
         os.makedirs(self.screenshots_dir, exist_ok=True)
+        os.makedirs(self.thumbnails_dir, exist_ok=True)
 
-    def _load_history(self):
-        """Load screenshot history from JSON file"""
+    def _remove_legacy_rollups(self):
+        """Drop the old single-file rollups, which the rollup journal rebuilds from the store"""
+        legacy_file = os.path.join(self.screenshots_dir, "rollups.json")
         try:
-            if os.path.exists(self.history_file):
-                with open(self.history_file, 'r') as f:
-                    self.history = json.load(f)
-            else:
-                self.history = []
-        except Exception as e:
-            self.logger.error(f"Failed to load history: {str(e)}")
-            self.history = []
+            if os.path.exists(legacy_file):
+                os.remove(legacy_file)
+        except OSError as e:
+            self.logger.warning(f"Failed to remove old rollups file: {str(e)}")
 
-    def _save_history(self):
-        """Save screenshot history to JSON file"""
-        try:
-            with open(self.history_file, 'w') as f:
-                json.dump(self.history, f, indent=4)
-        except Exception as e:
-            self.logger.error(f"Failed to save history: {str(e)}")
+    def _create_store(self, backend, settings=None):
+        """Create the storage backend for history entries"""
+        if backend == 'journal':
+            return JournalHistoryStore(self.journal_file, legacy_json_file=self.history_file, settings=settings)
+        if backend == 'sqlite':
+            try:
+                return SQLiteHistoryStore(self.db_file, legacy_json_file=self.history_file)
+            except Exception as e:
+                self.logger.error(f"Failed to open SQLite history, falling back to JSON: {str(e)}")
+        elif backend != 'json':
+            self.logger.warning(f"Unknown history backend: {backend}, using JSON")
+        return JSONHistoryStore(self.history_file)
 
-    def save_screenshot(self, image, analysis_results=None):
-        """Save a new screenshot with metadata"""
+    def save_screenshot(self, image, analysis_results=None, timestamp=None):
+        """Save a new screenshot with metadata, returning its filename"""
         try:
-            timestamp = datetime.now()
+            timestamp = timestamp or datetime.now()
             device_info = ''
             if analysis_results and 'device_name' in analysis_results:
                 device_info = f"_{analysis_results['device_name']}"
@@ -49,6 +62,7 @@ class ScreenshotHistory:
 
             # Save the image
             image.save(filepath)
+            self._save_thumbnail(image, filename)
 
             # Add entry to history
             entry = {
@@ -59,31 +73,38 @@ class ScreenshotHistory:
                 'device_name': analysis_results.get('device_name') if analysis_results else None,
                 'analysis': analysis_results or {}
             }
-            self.history.append(entry)
-            self._save_history()
-            return True
+            if analysis_results and analysis_results.get('reused_from'):
+                entry['reused_from'] = analysis_results['reused_from']
+            # A second save in the same second reuses the filename and replaces the entry
+            replaced = self.store.get_entry(filename)
+            self.store.add(entry)
+            if replaced:
+                self.rollups.remove(replaced)
+            self.rollups.add(entry)
+            return filename
         except Exception as e:
             self.logger.error(f"Failed to save screenshot: {str(e)}")
             return False
 
     def get_history(self, limit=None, offset=0, device_id=None):
         """Get screenshot history entries"""
-        entries = self.history
-        if device_id:
-            entries = [
-                entry for entry in entries
-                if entry.get('device_id') == device_id
-            ]
-            
-        entries = sorted(
-            entries,
-            key=lambda x: x['timestamp'],
-            reverse=True
-        )
-        
-        if limit:
-            return entries[offset:offset + limit]
-        return entries[offset:]
+        return self.store.query(limit=limit, offset=offset, device_id=device_id)
+
+    def get_entry(self, filename):
+        """Get the history entry for a specific screenshot"""
+        return self.store.get_entry(filename)
+
+    def entries_between(self, start=None, end=None, device_id=None):
+        """Get entries with start <= timestamp <= end, oldest first"""
+        return self.store.entries_between(start, end, device_id)
+
+    def data_version(self, device_id=None):
+        """Version string that changes whenever history is added or deleted"""
+        return self.rollups.version(device_id)
+
+    def count(self, device_id=None):
+        """Count history entries, optionally for a single device"""
+        return self.store.count(device_id)
 
     def get_screenshot(self, filename):
         """Load a specific screenshot"""
@@ -96,18 +117,49 @@ class ScreenshotHistory:
             self.logger.error(f"Failed to load screenshot: {str(e)}")
             return None
 
+    def _thumbnail_path(self, filename):
+        return os.path.join(self.thumbnails_dir, os.path.splitext(filename)[0] + ".jpg")
+
+    def _save_thumbnail(self, image, filename):
+        """Write a small JPEG preview next to the full screenshot"""
+        try:
+            thumbnail = image.convert('RGB')
+            thumbnail.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS, reducing_gap=3.0)
+            thumbnail.save(self._thumbnail_path(filename), 'JPEG', quality=85)
+            return thumbnail
+        except Exception as e:
+            self.logger.warning(f"Failed to save thumbnail for {filename}: {str(e)}")
+            return None
+
+    def get_thumbnail(self, filename):
+        """Load the preview of a screenshot, creating it for older screenshots"""
+        try:
+            thumbpath = self._thumbnail_path(filename)
+            if os.path.exists(thumbpath):
+                with Image.open(thumbpath) as thumbnail:
+                    thumbnail.load()
+                    return thumbnail.copy()
+
+            screenshot = self.get_screenshot(filename)
+            if screenshot is None:
+                return None
+            with screenshot:
+                return self._save_thumbnail(screenshot, filename)
+        except Exception as e:
+            self.logger.error(f"Failed to load thumbnail: {str(e)}")
+            return None
+
     def delete_screenshot(self, filename):
-        """Delete a screenshot and its history entry"""
+        """Delete a screenshot, its thumbnail and its history entry"""
         try:
-            filepath = os.path.join(self.screenshots_dir, filename)
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            
-            self.history = [
-                entry for entry in self.history
-                if entry['filename'] != filename
-            ]
-            self._save_history()
+            for filepath in (os.path.join(self.screenshots_dir, filename), self._thumbnail_path(filename)):
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+
+            entry = self.store.get_entry(filename)
+            self.store.remove(filename)
+            if entry:
+                self.rollups.remove(entry)
             return True
         except Exception as e:
             self.logger.error(f"Failed to delete screenshot: {str(e)}")
@@ -115,7 +167,9 @@ class ScreenshotHistory:
 
     def get_device_screenshots(self, device_id):
         """Get screenshots for a specific device"""
-        return [
-            entry for entry in self.history
-            if entry.get('device_id') == device_id
-        ]
+        return self.store.get_device_entries(device_id)
+
+    def close(self):
+        """Save the rollups and release the storage backend"""
+        self.rollups.close()
+        self.store.close()
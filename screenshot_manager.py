@@ -1,18 +1,25 @@
+import asyncio
 import threading
 import time
 from datetime import datetime
 import os
 from utils.logger import get_logger
-from PIL import Image, ImageGrab
 import platform
-import io
 from screenshot_history import ScreenshotHistory
 from device_manager import DeviceManager
 from content_analyzer import ContentAnalyzer
 from program_terminator import ProgramTerminator
+from frame_deduplicator import FrameDeduplicator
+from change_detector import ChangeDetector
+from tiered_analyzer import TieredAnalyzer
+from prefilter import get_active_window, close_window_connection
+from capture_pipeline import CapturePipeline, Frame
+from async_analyzer import AsyncAnalysisEngine
+from capture_backends import get_available_backends, BackendRegistry
+from vnc_device_monitor import VNCConnectionPool
 
 class ScreenshotManager:
-    def __init__(self, config):
+    def __init__(self, config, content_analyzer=None):
         self.config = config
         self.logger = get_logger(__name__)
         self.device_manager = DeviceManager()
@@ -24,123 +31,130 @@ class ScreenshotManager:
         self._screenshot_methods = []
         self._init_screenshot_methods()
 
-        self.history_manager = ScreenshotHistory()
-        self.content_analyzer = ContentAnalyzer(config)
+        self.history_manager = ScreenshotHistory(
+            config.get('history_backend', 'sqlite'),
+            config.get('journal_settings'),
+            config.get('rollup_settings')
+        )
+        # Share the application's analyzer (and its HTTP pool) when one is given
+        self.content_analyzer = content_analyzer or ContentAnalyzer(config)
+        self.content_analyzer.size_pool(len(self.device_manager.get_all_devices()))
+        self.deduplicator = FrameDeduplicator(config)
+        self.change_detector = ChangeDetector(config)
+
+        # Cheap local tier that clears obviously benign frames before the cloud call
+        self.tiered_analyzer = TieredAnalyzer(self.content_analyzer, config.get('prefilter_settings'))
+
+        # Optional asyncio engine multiplexing all vision requests on one event loop
+        async_settings = config.get('async_analysis', {})
+        self.analysis_engine = (
+            AsyncAnalysisEngine(self.content_analyzer, async_settings)
+            if async_settings.get('enabled', False) else None
+        )
+
+        self.pipeline = CapturePipeline(
+            config.get('pipeline_settings'),
+            self._analyze_frame,
+            self._persist_frame,
+            analyze_async_fn=self._analyze_frame_async if self.analysis_engine else None,
+            engine=self.analysis_engine
+        )
 
     def _init_screenshot_methods(self):
         """Initialize available screenshot methods based on platform"""
-        system = platform.system().lower()
-
-        # PIL's ImageGrab works on both Windows and macOS
-        self._screenshot_methods.append(('pil', self._take_pil_screenshot))
-
-        # X11 method only on Linux
-        if system == 'linux':
-            try:
-                from Xlib import display, X
-                self._screenshot_methods.append(('x11', self._take_x11_screenshot))
-            except ImportError:
-                self.logger.warning("X11 backend not available")
-
-    def _take_x11_screenshot(self):
-        """Take screenshot using X11 (Linux only)"""
-        try:
-            if self.debug_mode:
-                self.logger.info("Attempting X11 screenshot")
-
-            from Xlib import display, X
-            d = display.Display()
-            root = d.screen().root
-            geometry = root.get_geometry()
-
-            screenshot = root.get_image(0, 0, geometry.width, geometry.height,
-                                      X.ZPixmap, 0xffffffff)
-
-            image = Image.frombytes("RGB", (geometry.width, geometry.height),
-                                  screenshot.data, "raw", "BGRX")
-
-            if self.debug_mode:
-                self.logger.info("X11 screenshot successful")
-
-            return image
-        except Exception as e:
-            if self.debug_mode:
-                self.logger.error(f"X11 screenshot failed: {str(e)}")
-            raise
-
-    def _take_pil_screenshot(self):
-        """Take screenshot using PIL ImageGrab (cross-platform)"""
-        try:
-            if self.debug_mode:
-                self.logger.info("Attempting PIL screenshot")
-
-            screenshot = ImageGrab.grab()
-
-            if self.debug_mode:
-                self.logger.info("PIL screenshot successful")
-
-            return screenshot
-        except Exception as e:
-            if self.debug_mode:
-                self.logger.error(f"PIL screenshot failed: {str(e)}")
-            raise
+        # Backends keep one persistent connection per device thread
+        self._backends = get_available_backends()
+        for backend in self._backends:
+            self._screenshot_methods.append((backend.name, backend.capture))
+
+        # Reuse each device's saved choice until it keeps failing; benchmark only for devices without one
+        self.backend_registry = BackendRegistry(
+            self._backends,
+            failure_threshold=self.config.get('backend_failure_threshold', 3)
+        )
+        self.backend_registry.seed({
+            device.device_id: device.config['screenshot_backend']
+            for device in self.device_manager.get_all_devices()
+            if device.config.get('screenshot_backend') and not self._is_vnc_device(device)
+        })
+
+        # Remote devices capture over pooled persistent VNC sessions
+        self.vnc_pool = VNCConnectionPool(self.config.get('vnc_settings'))
+
+        if not any(backend.name == 'x11' for backend in self._backends) and platform.system().lower() == 'linux':
+            self.logger.warning("X11 backend not available")
+
+    def close_backends(self):
+        """Close all capture backend connections"""
+        for backend in self._backends:
+            backend.close_all()
+        self.vnc_pool.close_all()
 
     def test_screenshot_capability(self, device_id=None):
-        """Test if screenshots can be taken"""
-        last_error = None
+        """Test if screenshots can be taken, using the cached backend choice"""
         device = self.device_manager.get_device(device_id) if device_id else None
 
-        for method_name, method in self._screenshot_methods:
-            try:
-                if self.debug_mode:
-                    self.logger.info(f"Testing screenshot method: {method_name}")
+        if self._is_vnc_device(device):
+            success, error_msg = self.vnc_pool.test_connection(device_id, device.config)
+            if success:
+                self._remember_backend(device, 'vnc')
+            else:
+                self.device_manager.set_device_error(device_id, error_msg)
+            return success, error_msg
 
-                screenshot = method()
-                if screenshot:
-                    if device:
-                        device.config['screenshot_backend'] = method_name
-                        self.device_manager.update_device_config(device_id, device.config)
-                    if self.debug_mode:
-                        self.logger.info(f"Successfully using {method_name} backend")
-                    return True, None
-            except Exception as e:
-                error_msg = f"{method_name} screenshot failed: {str(e)}"
-                if self.debug_mode:
-                    self.logger.error(error_msg)
-                last_error = error_msg
+        backend = self.backend_registry.select(device_id)
+        if backend:
+            self._remember_backend(device, backend)
+            if self.debug_mode:
+                self.logger.info(f"Successfully using {backend} backend")
+            return True, None
 
-        error_msg = f"No working screenshot method found. Last error: {last_error}"
+        error_msg = f"No working screenshot method found. Last error: {self.backend_registry.last_error()}"
         if device:
             self.device_manager.set_device_error(device_id, error_msg)
         return False, error_msg
 
+    @staticmethod
+    def _is_vnc_device(device):
+        return bool(device and device.config.get('vnc_host'))
+
+    def _remember_backend(self, device, backend):
+        """Persist a device's backend only when the choice changes"""
+        if device and device.config.get('screenshot_backend') != backend:
+            device.config['screenshot_backend'] = backend
+            self.device_manager.update_device_config(device.device_id, device.config)
+
     def take_screenshot(self, device_id=None):
         """Take a screenshot and return the image object"""
-        try:
-            device = self.device_manager.get_device(device_id) if device_id else None
-            backend = device.config.get('screenshot_backend') if device else None
+        return self._capture(device_id)[0]
 
-            if not backend:
-                success, error = self.test_screenshot_capability(device_id)
-                if not success:
-                    return None
+    def _capture(self, device_id=None):
+        """Capture a device, returning (image, dirty_ratio, content_version)
 
-            method_dict = dict(self._screenshot_methods)
-            backend = device.config.get('screenshot_backend') if device else self._screenshot_methods[0][0]
-            screenshot = method_dict[backend]()
+        dirty_ratio and content_version are only known for VNC devices, whose
+        framebuffer is kept up to date with incremental updates.
+        """
+        device = None
+        try:
+            device = self.device_manager.get_device(device_id) if device_id else None
+            dirty_ratio = content_version = None
+            if self._is_vnc_device(device):
+                screenshot, dirty_ratio, content_version = self.vnc_pool.capture(device_id, device.config)
+                backend = 'vnc'
+            else:
+                screenshot, backend = self.backend_registry.capture(device_id)
 
-            if screenshot:
-                if device:
-                    self.device_manager.set_device_error(device_id, None)
-                return screenshot
-            raise Exception("Screenshot capture returned None")
+            if device:
+                self._remember_backend(device, backend)
+                self.device_manager.set_device_error(device_id, None)
+            return screenshot, dirty_ratio, content_version
 
         except Exception as e:
             error_msg = f"Screenshot failed: {str(e)}"
             self.logger.error(error_msg)
             if device:
                 self.device_manager.set_device_error(device_id, error_msg)
-            return None
+            return None, None, None
 
     def start_monitoring(self, device_id=None):
         """Start monitoring for a specific device or all devices"""
@@ -165,6 +179,8 @@ class ScreenshotManager:
             return False
 
         if not device.is_active:
+            self.content_analyzer.size_pool(len(self.device_manager.get_all_devices()))
+            self.pipeline.start()
             self.device_manager.set_device_status(device_id, True)
             thread = threading.Thread(target=self._monitor_loop, args=(device_id,), daemon=True)
             self.monitor_threads[device_id] = thread
@@ -178,6 +194,9 @@ class ScreenshotManager:
         else:
             for device in self.device_manager.get_all_devices():
                 self._stop_device_monitoring(device.device_id)
+            self.pipeline.stop()
+            if self.analysis_engine:
+                self.analysis_engine.stop()
 
     def _stop_device_monitoring(self, device_id):
         """Stop monitoring for a specific device"""
@@ -187,6 +206,9 @@ class ScreenshotManager:
             if device_id in self.monitor_threads:
                 self.monitor_threads[device_id].join(timeout=1.0)
                 del self.monitor_threads[device_id]
+            self.pipeline.discard(device_id)
+            self.deduplicator.reset(device_id)
+            self.change_detector.reset(device_id)
 
     def set_debug_mode(self, enabled):
         """Enable or disable debug mode"""
@@ -199,6 +221,30 @@ class ScreenshotManager:
         device = self.device_manager.get_device(device_id)
         return device.config.get('screenshot_backend') if device else None
 
+    def get_dedup_stats(self, device_id=None):
+        """Get frame deduplication counters for a device or all devices"""
+        return self.deduplicator.get_stats(device_id)
+
+    def get_backend_stats(self):
+        """Get capture backend benchmark timings and per-device choices"""
+        return self.backend_registry.get_stats()
+
+    def get_vnc_stats(self):
+        """Get connection state of pooled VNC sessions"""
+        return self.vnc_pool.get_stats()
+
+    def get_change_stats(self, device_id=None):
+        """Get counters of frames analyzed in full, as crops, or skipped as unchanged"""
+        return self.change_detector.get_stats(device_id)
+
+    def get_prefilter_stats(self):
+        """Get local/cloud tier counts and per-stage prefilter verdicts"""
+        return self.tiered_analyzer.get_stats()
+
+    def get_pipeline_stats(self):
+        """Get per-stage latency metrics and queue state of the capture pipeline"""
+        return self.pipeline.get_stats()
+
     def get_device_error(self, device_id):
         """Get the last error for a specific device"""
         device = self.device_manager.get_device(device_id)
@@ -286,6 +332,10 @@ class ScreenshotManager:
                 else:
                     self.logger.warning(f"Could not safely terminate program: {program_to_terminate}")
 
+            # Devices that just alerted go first when the request budget is short
+            if alerts:
+                self.content_analyzer.rate_limiter.note_alert(device.device_id)
+
             # Send notification if needed
             if alerts and hasattr(self, 'notification_mgr'):
                 alert_message = f"Alert from {device.name}:\n" + "\n".join(alerts)
@@ -301,65 +351,40 @@ class ScreenshotManager:
             return False
 
     def _monitor_loop(self, device_id):
-        """Main monitoring loop for a specific device"""
+        """Capture stage for a specific device, kept on its own schedule"""
         device = self.device_manager.get_device(device_id)
         retry_count = 0
         max_retries = 3
+        next_capture = time.monotonic()
 
         while device and device.is_active:
             try:
                 interval = device.config.get('screenshot_interval',
                                         self.config.get('screenshot_interval', 30))
-                screenshot = self.take_screenshot(device_id)
+
+                capture_started = time.monotonic()
+                screenshot, dirty_ratio, content_version = self._capture(device_id)
+                self.pipeline.record_capture(time.monotonic() - capture_started)
 
                 if screenshot:
                     retry_count = 0
-
-                    try:
-                        if self.debug_mode:
-                            self.logger.info(f"Analyzing screenshot for device: {device.name}")
-
-                        analysis_results = self.content_analyzer.analyze_image(screenshot)
-
-                        if analysis_results:
-                            if isinstance(analysis_results, dict):
-                                device_info = {
-                                    'device_id': device_id,
-                                    'device_name': device.name,
-                                    'timestamp': datetime.now().isoformat()
-                                }
-                                analysis_results.update(device_info)
-
-                                has_alerts = self._process_content_analysis(analysis_results, device)
-
-                                if self.debug_mode:
-                                    if has_alerts:
-                                        self.logger.info(f"Alerts detected for device: {device.name}")
-                                    else:
-                                        self.logger.info(f"No alerts for device: {device.name}")
-
-                                self.history_manager.save_screenshot(screenshot, analysis_results)
-                            else:
-                                self.logger.error(f"Invalid analysis results format: {type(analysis_results)}")
-                                error_results = {
-                                    'error': 'Invalid analysis format',
-                                    'device_id': device_id,
-                                    'device_name': device.name,
-                                    'timestamp': datetime.now().isoformat()
-                                }
-                                self.history_manager.save_screenshot(screenshot, error_results)
-
-                    except Exception as e:
-                        self.logger.error(f"Content analysis error: {str(e)}")
-                        error_results = {
-                            'error': str(e),
-                            'device_id': device_id,
-                            'device_name': device.name,
-                            'timestamp': datetime.now().isoformat()
-                        }
-                        self.history_manager.save_screenshot(screenshot, error_results)
-
-                time.sleep(interval)
+                    frame = Frame(
+                        device_id, screenshot, datetime.now(),
+                        dirty_ratio=dirty_ratio,
+                        content_version=content_version
+                    )
+                    # The focused window is only known for the local screen
+                    if self.tiered_analyzer.enabled and not self._is_vnc_device(device):
+                        frame.window_title, frame.window_process = get_active_window()
+                    self.pipeline.submit(frame)
+
+                # Schedule against the previous slot so analysis latency never stretches the interval
+                next_capture += interval
+                delay = next_capture - time.monotonic()
+                if delay < 0:
+                    next_capture = time.monotonic()
+                    delay = 0
+                time.sleep(delay)
 
             except Exception as e:
                 retry_count += 1
@@ -373,5 +398,180 @@ class ScreenshotManager:
                     break
 
                 time.sleep(min(5 * retry_count, 30))
+                next_capture = time.monotonic()
+
+            device = self.device_manager.get_device(device_id)
+
+        # Release this thread's display connections
+        for backend in self._backends:
+            backend.close()
+        close_window_connection()
+
+    def _analyze_frame(self, frame):
+        """Analysis stage: score a frame and return it if it should be persisted"""
+        device, analysis_results = self._check_frame(frame)
+        if not device:
+            return None
+
+        if not frame.reused:
+            if self.debug_mode:
+                self.logger.info(f"Analyzing screenshot for device: {device.name}")
+            options = device.config.get('preprocess_settings')
+            local_scores = self.tiered_analyzer.prefilter(frame.image, frame.window_context())
+            regions = self.change_detector.plan(frame.device_id, frame.image) if local_scores is None else None
+
+            if local_scores is not None:
+                scores = local_scores
+            elif regions is None:
+                scores = self.content_analyzer.score_image(
+                    frame.image,
+                    device_id=frame.device_id,
+                    change_score=frame.change_score,
+                    options=options
+                )
+                scores = self.change_detector.record_full(frame.device_id, frame.image, scores)
+            else:
+                # Only the changed regions are sent; the rest keeps its previous scores
+                region_scores = [
+                    self.content_analyzer.score_image(frame.image.crop(region), frame.device_id, options=options)
+                    for region in regions
+                ]
+                scores = self.change_detector.record_regions(frame.device_id, frame.image, regions, region_scores)
+
+            analysis_results = self.content_analyzer.check_thresholds(scores)
+            analyzed = self._is_scored(scores)
+        else:
+            analyzed = False
+
+        return self._finish_frame(frame, device, analysis_results, analyzed)
+
+    async def _analyze_frame_async(self, frame):
+        """Analysis stage on the async engine's event loop"""
+        loop = asyncio.get_running_loop()
+        device, analysis_results = self._check_frame(frame)
+        if not device:
+            return None
+
+        if not frame.reused:
+            if self.debug_mode:
+                self.logger.info(f"Analyzing screenshot for device: {device.name}")
+            # Frame diffs and baselines are CPU work, so keep them off the loop
+            detector = self.change_detector
+            options = device.config.get('preprocess_settings')
+            local_scores = await loop.run_in_executor(
+                None, self.tiered_analyzer.prefilter, frame.image, frame.window_context()
+            )
+            regions = None
+            if local_scores is None:
+                regions = await loop.run_in_executor(None, detector.plan, frame.device_id, frame.image)
+
+            if local_scores is not None:
+                scores = local_scores
+            elif regions is None:
+                scores = await self.analysis_engine.score_image_async(
+                    frame.image,
+                    device_id=frame.device_id,
+                    change_score=frame.change_score,
+                    options=options
+                )
+                scores = await loop.run_in_executor(None, detector.record_full, frame.device_id, frame.image, scores)
+            else:
+                region_scores = await asyncio.gather(*[
+                    self.analysis_engine.score_image_async(frame.image.crop(region), frame.device_id, options=options)
+                    for region in regions
+                ])
+                scores = await loop.run_in_executor(
+                    None, detector.record_regions, frame.device_id, frame.image, regions, region_scores
+                )
+
+            analysis_results = self.content_analyzer.check_thresholds(scores)
+            analyzed = self._is_scored(scores)
+        else:
+            analyzed = False
+
+        # Alerting may send email or terminate programs, so keep it off the loop
+        return await loop.run_in_executor(None, self._finish_frame, frame, device, analysis_results, analyzed)
+
+    def _check_frame(self, frame):
+        """Look up the device and reuse the previous analysis for an unchanged frame"""
+        device = self.device_manager.get_device(frame.device_id)
+        if not device:
+            return None, None
+
+        frame_hash, distance, previous = self.deduplicator.check_frame(
+            frame.device_id, frame.image, content_version=frame.content_version
+        )
+        frame.frame_hash = frame_hash
+        frame.change_score = self.deduplicator.change_score(distance)
+        if not previous:
+            return device, None
+
+        if self.debug_mode:
+            dirty = f", dirty {frame.dirty_ratio:.1%}" if frame.dirty_ratio is not None else ""
+            self.logger.info(
+                f"Frame unchanged for device: {device.name} (distance {distance}{dirty}), reusing analysis"
+            )
+
+        frame.reused = True
+        analysis_results = previous['analysis']
+        if isinstance(analysis_results, dict):
+            analysis_results = dict(analysis_results)
+            analysis_results['reused_from'] = previous['filename']
+        return device, analysis_results
+
+    @staticmethod
+    def _is_scored(scores):
+        """Whether scores are a real analysis rather than an error (such as a timeout) or a salvaged guess"""
+        return isinstance(scores, dict) and 'error' not in scores and not scores.get('partial')
+
+    def _finish_frame(self, frame, device, analysis_results, analyzed=False):
+        """Record the analysis, raise alerts and return the frame if it should be persisted
+
+        analyzed is True when the frame was scored successfully; only then is
+        its result kept for reuse by near-identical frames, so a failed call
+        is retried on the next frame instead of passing as benign.
+        """
+        device_info = {
+            'device_id': frame.device_id,
+            'device_name': device.name,
+            'timestamp': frame.captured_at.isoformat()
+        }
+        if frame.window_title:
+            device_info['window_title'] = frame.window_title
+        if frame.window_process:
+            device_info['window_process'] = frame.window_process
+
+        try:
+            if analyzed:
+                self.deduplicator.record_analysis(frame.device_id, frame.frame_hash, analysis_results)
+
+            if not analysis_results:
+                return None
+
+            if isinstance(analysis_results, dict):
+                analysis_results.update(device_info)
+
+                has_alerts = self._process_content_analysis(analysis_results, device)
+
+                if self.debug_mode:
+                    if has_alerts:
+                        self.logger.info(f"Alerts detected for device: {device.name}")
+                    else:
+                        self.logger.info(f"No alerts for device: {device.name}")
+
+                frame.analysis = analysis_results
+            else:
+                self.logger.error(f"Invalid analysis results format: {type(analysis_results)}")
+                frame.analysis = dict(device_info, error='Invalid analysis format')
+
+        except Exception as e:
+            self.logger.error(f"Content analysis error: {str(e)}")
+            frame.analysis = dict(device_info, error=str(e))
+
+        return frame
 
-            device = self.device_manager.get_device(device_id)
\ No newline at end of file
+    def _persist_frame(self, frame):
+        """Persistence stage: write the screenshot and its history entry"""
+        filename = self.history_manager.save_screenshot(frame.image, frame.analysis, timestamp=frame.captured_at)
+        if filename and not frame.reused and 'error' not in frame.analysis:
+            self.deduplicator.attach_filename(frame.device_id, frame.frame_hash, filename)
@@ -0,0 +1,35 @@
+import pytest
+
+class StubConfig:
+    """In-memory stand-in for ConfigManager, without the keyring or config file"""
+
+    def __init__(self, values=None, api_keys=None):
+        self.config = dict(values or {})
+        self.api_keys = dict(api_keys or {})
+        self.listeners = []
+
+    def get(self, key, default=None):
+        return self.config.get(key, default)
+
+    def set(self, key, value):
+        self.config[key] = value
+
+    def get_api_key(self, provider):
+        return self.api_keys.get(provider)
+
+    def get_model_settings(self, provider):
+        return self.config.get('model_settings', {}).get(provider, {
+            'available_models': [],
+            'selected_model': None
+        })
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+@pytest.fixture
+def make_config():
+    return StubConfig
@@ -0,0 +1,52 @@
+import threading
+import time
+from analysis_batcher import AnalysisBatcher
+from content_analyzer import ContentAnalyzer
+
+SCORES = {'violence': 0.1, 'adult': 0.0, 'hate': 0.0, 'drugs': 0.0, 'gambling': 0.0, 'program_name': None}
+
+def test_submit_gives_up_after_the_timeout():
+    release = threading.Event()
+
+    def stuck_batch(prepared_list):
+        release.wait(5.0)
+        return [dict(SCORES) for _ in prepared_list]
+
+    batcher = AnalysisBatcher(stuck_batch, {'max_wait': 0.01})
+    try:
+        started = time.monotonic()
+        result = batcher.submit({'device_id': 'a'}, timeout=0.2)
+        assert 'error' in result
+        assert time.monotonic() - started < 1.0
+    finally:
+        release.set()
+        batcher.stop()
+
+def test_batches_fail_over_through_the_router(make_config):
+    config = make_config({
+        'vision_provider': 'openai',
+        'model_settings': {'openai': {'selected_model': 'stub-model'}},
+        'router_settings': {'enabled': True},
+        'batch_settings': {'enabled': True}
+    })
+    analyzer = ContentAnalyzer(config)
+    try:
+        # Both providers look configured; only Gemini answers
+        analyzer.openai_client = object()
+        analyzer.gemini_model = object()
+        calls = []
+
+        def request_batch(provider, prepared_list):
+            calls.append(provider)
+            if provider == 'openai':
+                return {'error': 'upstream unavailable'}
+            return {'results': [dict(SCORES) for _ in prepared_list]}
+
+        analyzer._request_batch = request_batch
+        results = analyzer._call_batch_api([{'device_id': 'a'}, {'device_id': 'b'}])
+
+        assert calls == ['openai', 'gemini']
+        assert [result['provider'] for result in results] == ['gemini', 'gemini']
+        assert analyzer.get_router_stats()['failovers'] == 1
+    finally:
+        analyzer.close()
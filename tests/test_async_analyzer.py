@@ -0,0 +1,203 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from PIL import Image
+from async_analyzer import AsyncAnalysisEngine
+from content_analyzer import ContentAnalyzer
+
+SCORES = {'violence': 0.1, 'adult': 0.0, 'hate': 0.0, 'drugs': 0.0, 'gambling': 0.0, 'program_name': None}
+
+class StubOpenAI(ThreadingHTTPServer):
+    """Chat completions endpoint that answers after a delay and counts concurrent requests"""
+
+    daemon_threads = True
+
+    def __init__(self, delay):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+        self.requests = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers['Content-Length']))
+        with server.lock:
+            server.active += 1
+            server.requests += 1
+            server.peak = max(server.peak, server.active)
+        time.sleep(server.delay)
+        with server.lock:
+            server.active -= 1
+
+        body = json.dumps({
+            'id': 'stub',
+            'object': 'chat.completion',
+            'created': 0,
+            'model': 'stub-model',
+            'choices': [{
+                'index': 0,
+                'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': json.dumps(SCORES)}
+            }]
+        }).encode('utf-8')
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            # The client gave up on a cancelled request
+            pass
+
+@pytest.fixture
+def stub_server():
+    servers = []
+
+    def start(delay=0.2):
+        server = StubOpenAI(delay)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def make_engine(make_config):
+    engines = []
+
+    def build(server, concurrency=2, **values):
+        config = make_config(dict({
+            'vision_provider': 'openai',
+            'api_endpoints': {'openai': server.url},
+            'model_settings': {'openai': {'selected_model': 'stub-model'}},
+            'analysis_cache': {'enabled': False}
+        }, **values), api_keys={'openai': 'test-key'})
+        analyzer = ContentAnalyzer(config)
+        engine = AsyncAnalysisEngine(analyzer, {'concurrency': {'openai': concurrency}, 'request_timeout': 5})
+        engine.start()
+        engines.append((engine, analyzer))
+        return engine
+
+    yield build
+    for engine, analyzer in engines:
+        engine.stop()
+        analyzer.close()
+
+def frame(shade):
+    return Image.new('RGB', (64, 48), (shade, shade, shade))
+
+def test_requests_are_scored_through_the_stub(stub_server, make_engine):
+    server = stub_server(delay=0.0)
+    engine = make_engine(server)
+
+    scores = engine.submit(engine.score_image_async(frame(10), 'device_1')).result(timeout=10)
+
+    assert scores['violence'] == pytest.approx(0.1)
+    assert 'error' not in scores
+    assert server.requests == 1
+
+def test_concurrency_limit_per_provider(stub_server, make_engine):
+    server = stub_server(delay=0.3)
+    engine = make_engine(server, concurrency=2)
+
+    futures = [
+        engine.submit(engine.score_image_async(frame(shade), f'device_{shade}'))
+        for shade in range(6)
+    ]
+    results = [future.result(timeout=20) for future in futures]
+
+    assert all('error' not in scores for scores in results)
+    assert server.requests == 6
+    assert server.peak == 2
+
+def test_cancelled_request_frees_its_slot(stub_server, make_engine):
+    server = stub_server(delay=0.5)
+    engine = make_engine(server, concurrency=1)
+
+    slow = engine.submit(engine.score_image_async(frame(1), 'device_1'))
+    time.sleep(0.2)
+    slow.cancel()
+
+    started = time.monotonic()
+    scores = engine.submit(engine.score_image_async(frame(2), 'device_2')).result(timeout=10)
+    assert 'error' not in scores
+    assert slow.cancelled()
+    # The second request did not have to wait out the first one's full delay plus its own
+    assert time.monotonic() - started < 1.0
+
+def test_newer_frame_supersedes_a_waiting_one(stub_server, make_engine):
+    server = stub_server(delay=0.0)
+    engine = make_engine(server, rate_limits={
+        'enabled': True,
+        'limits': {'openai': {'rpm': 1, 'tpm': 100000}},
+        'max_wait': 5
+    })
+
+    first = engine.submit(engine.score_image_async(frame(1), 'device_1')).result(timeout=10)
+    assert 'error' not in first
+
+    # The budget is spent, so this frame waits until the next one from the same device replaces it
+    waiting = engine.submit(engine.score_image_async(frame(2), 'device_1'))
+    time.sleep(0.3)
+    newer = engine.submit(engine.score_image_async(frame(3), 'device_1'))
+
+    assert waiting.result(timeout=10) == {'error': 'Superseded by a newer frame'}
+    assert server.requests == 1
+    newer.cancel()
+
+def test_partial_scores_are_reasked_and_never_alert(make_config):
+    config = make_config({'analysis_cache': {'enabled': False}})
+    analyzer = ContentAnalyzer(config)
+    try:
+        # With no client to re-ask, the salvaged scores are returned as they are
+        analyzer.parser_settings['reask'] = False
+        scores = analyzer._parse_or_reask('openai', 'adult: 95%, violence: 10%')
+        assert scores['partial'] is True
+        assert scores['adult'] == pytest.approx(0.95)
+        assert analyzer.check_thresholds(scores) is False
+
+        analyzer.parser_settings['reask'] = True
+        assert analyzer.finish_reask('openai', '{"adult": 0.95}', scores) == {
+            'violence': 0.0, 'adult': 0.95, 'hate': 0.0, 'drugs': 0.0, 'gambling': 0.0, 'program_name': None
+        }
+        assert analyzer.finish_reask('openai', None, scores) is scores
+        assert analyzer.get_parse_stats()['salvaged'] == 1
+    finally:
+        analyzer.close()
+
+def test_malformed_responses_come_with_a_reask_request(make_config):
+    config = make_config({
+        'analysis_cache': {'enabled': False},
+        'model_settings': {'openai': {'selected_model': 'stub-model'}}
+    })
+    analyzer = ContentAnalyzer(config)
+    try:
+        scores, reask = analyzer.parse_response('openai', json.dumps(SCORES))
+        assert reask is None and scores['violence'] == pytest.approx(0.1)
+
+        scores, reask = analyzer.parse_response('openai', 'adult: 95%')
+        assert scores['partial'] is True
+        assert reask['model'] == 'stub-model'
+        assert 'adult: 95%' in reask['messages'][0]['content']
+
+        scores, reask = analyzer.parse_response('gemini', 'adult: 95%')
+        assert reask['contents'].endswith('adult: 95%')
+        assert analyzer.get_parse_stats()['reasked'] == 2
+    finally:
+        analyzer.close()
@@ -0,0 +1,42 @@
+from PIL import Image
+from capture_backends import BackendRegistry
+
+class FakeBackend:
+    def __init__(self, name, works=True):
+        self.name = name
+        self.works = works
+        self.captures = 0
+
+    def capture(self):
+        self.captures += 1
+        if not self.works:
+            raise RuntimeError("no display")
+        return Image.new('RGB', (8, 8))
+
+    def close(self):
+        pass
+
+def test_seeded_choices_skip_the_benchmark():
+    mss, pil = FakeBackend('mss'), FakeBackend('pil')
+    registry = BackendRegistry([mss, pil])
+    registry.seed({'device_1': 'pil', 'device_2': 'gone'})
+
+    assert registry.capture('device_1')[1] == 'pil'
+    assert mss.captures == 0
+    assert registry.get_stats()['timings'] == {}
+
+    # A saved backend that no longer exists is ignored and the device is benchmarked
+    assert registry.capture('device_2')[1] in ('mss', 'pil')
+    assert mss.captures > 0
+
+def test_a_failing_seeded_choice_is_reprobed():
+    broken, working = FakeBackend('mss', works=False), FakeBackend('pil')
+    registry = BackendRegistry([broken, working], failure_threshold=2)
+    registry.seed({'device_1': 'mss'})
+
+    for _ in range(2):
+        try:
+            registry.capture('device_1')
+        except RuntimeError:
+            pass
+    assert registry.capture('device_1')[1] == 'pil'
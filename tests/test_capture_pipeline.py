@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+from capture_pipeline import CapturePipeline, Frame, FrameQueue
+
+def make_frame(device_id, index=0):
+    frame = Frame(device_id, None, index)
+    frame.index = index
+    return frame
+
+def test_claimed_device_waits_in_the_queue_and_coalesces():
+    frames = FrameQueue(8, 'coalesce')
+    frames.put(make_frame('a', 0))
+    first = frames.get(claim=True)
+
+    frames.put(make_frame('a', 1))
+    frames.put(make_frame('a', 2))
+    frames.put(make_frame('b', 0))
+
+    # 'a' is busy, so the next claim skips to 'b'
+    assert frames.get(claim=True).device_id == 'b'
+    assert frames.get(timeout=0.05, claim=True) is None
+
+    frames.release(first.device_id)
+    newest = frames.get(timeout=0.05, claim=True)
+    assert (newest.device_id, newest.index) == ('a', 2)
+
+def test_each_device_has_one_frame_in_analysis(tmp_path):
+    lock = threading.Lock()
+    active = {}
+    overlaps = []
+    analyzed = []
+    persisted = []
+
+    def analyze(frame):
+        with lock:
+            active[frame.device_id] = active.get(frame.device_id, 0) + 1
+            if active[frame.device_id] > 1:
+                overlaps.append(frame.device_id)
+        time.sleep(0.02)
+        with lock:
+            active[frame.device_id] -= 1
+            analyzed.append((frame.device_id, frame.index))
+        return frame
+
+    pipeline = CapturePipeline(
+        {'analysis_workers': 4},
+        analyze,
+        lambda frame: persisted.append((frame.device_id, frame.index))
+    )
+    pipeline.start()
+    try:
+        for index in range(20):
+            for device_id in ('a', 'b'):
+                pipeline.submit(make_frame(device_id, index))
+            time.sleep(0.005)
+
+        deadline = time.monotonic() + 2.0
+        while time.monotonic() < deadline and not {('a', 19), ('b', 19)} <= set(persisted):
+            time.sleep(0.01)
+    finally:
+        pipeline.stop()
+
+    assert not overlaps
+    # Slow analysis coalesced the backlog instead of running it in parallel
+    assert len(analyzed) < 40
+    for device_id in ('a', 'b'):
+        order = [index for device, index in persisted if device == device_id]
+        assert order == sorted(order)
+        assert order[-1] == 19
+
+class LoopEngine:
+    """Runs coroutines on a background event loop, like AsyncAnalysisEngine.submit"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=1.0)
+
+def test_async_dispatcher_keeps_one_request_per_device():
+    engine = LoopEngine()
+    active = {}
+    overlaps = []
+    analyzed = []
+
+    async def analyze(frame):
+        active[frame.device_id] = active.get(frame.device_id, 0) + 1
+        if active[frame.device_id] > 1:
+            overlaps.append(frame.device_id)
+        await asyncio.sleep(0.02)
+        active[frame.device_id] -= 1
+        analyzed.append(frame.index)
+        return frame
+
+    persisted = []
+    pipeline = CapturePipeline(
+        {'max_in_flight': 32},
+        None,
+        lambda frame: persisted.append(frame.index),
+        analyze_async_fn=analyze,
+        engine=engine
+    )
+    pipeline.start()
+    try:
+        for index in range(20):
+            pipeline.submit(make_frame('a', index))
+            time.sleep(0.005)
+
+        deadline = time.monotonic() + 2.0
+        while time.monotonic() < deadline and 19 not in persisted:
+            time.sleep(0.01)
+    finally:
+        pipeline.stop()
+        engine.close()
+
+    assert not overlaps
+    assert len(analyzed) < 20
+    assert persisted == sorted(persisted) and persisted[-1] == 19
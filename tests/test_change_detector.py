@@ -0,0 +1,53 @@
+from PIL import Image, ImageDraw
+from change_detector import ChangeDetector
+
+BENIGN = {'violence': 0.0, 'adult': 0.1, 'hate': 0.0, 'drugs': 0.0, 'gambling': 0.0, 'program_name': 'firefox'}
+
+def screen(box=None):
+    image = Image.new('RGB', (640, 480), (30, 30, 30))
+    if box:
+        ImageDraw.Draw(image).rectangle(box, fill=(250, 250, 250))
+    return image
+
+def test_small_change_is_cropped():
+    detector = ChangeDetector({})
+    assert detector.plan('device_1', screen()) is None
+    detector.record_full('device_1', screen(), dict(BENIGN))
+
+    regions = detector.plan('device_1', screen((100, 100, 160, 140)))
+    assert len(regions) == 1
+    left, top, right, bottom = regions[0]
+    assert left <= 100 and top <= 100 and right >= 160 and bottom >= 140
+
+def test_unchanged_frame_has_no_regions():
+    detector = ChangeDetector({})
+    detector.record_full('device_1', screen(), dict(BENIGN))
+    assert detector.plan('device_1', screen()) == []
+
+def test_crop_scores_merge_without_inheriting_program_name():
+    detector = ChangeDetector({})
+    detector.record_full('device_1', screen(), dict(BENIGN))
+    image = screen((100, 100, 160, 140))
+    regions = detector.plan('device_1', image)
+
+    merged = detector.record_regions('device_1', image, regions, [{'violence': 0.9, 'adult': 0.0}])
+    assert merged['violence'] == 0.9
+    assert merged['adult'] == 0.1
+    assert 'program_name' not in merged
+
+def test_alerting_baseline_forces_a_full_frame():
+    detector = ChangeDetector({})
+    detector.record_full('device_1', screen(), dict(BENIGN))
+    image = screen((100, 100, 160, 140))
+    regions = detector.plan('device_1', image)
+    detector.record_regions('device_1', image, regions, [{'violence': 0.9}])
+
+    # The flagged crop may have gone, so the next frame is analyzed whole
+    assert detector.plan('device_1', screen()) is None
+    detector.record_full('device_1', screen(), dict(BENIGN))
+    assert detector.plan('device_1', screen()) == []
+
+def test_thresholds_follow_config():
+    detector = ChangeDetector({'content_thresholds': {'adult': 0.05}, 'monitored_categories': ['adult']})
+    detector.record_full('device_1', screen(), dict(BENIGN))
+    assert detector.plan('device_1', screen()) is None
@@ -0,0 +1,90 @@
+import logging
+from datetime import datetime
+from types import SimpleNamespace
+from PIL import Image, ImageDraw
+from capture_pipeline import Frame
+from frame_deduplicator import FrameDeduplicator
+from screenshot_manager import ScreenshotManager
+
+def make_image(shade=0, box=None):
+    image = Image.new('RGB', (320, 240), (shade, shade, shade))
+    if box:
+        ImageDraw.Draw(image).rectangle(box, fill=(255, 255, 255))
+    return image
+
+def test_hash_bits_compare_each_pixel_with_its_right_neighbour(make_config):
+    deduplicator = FrameDeduplicator(make_config())
+    darkening = Image.linear_gradient('L').rotate(270).resize((90, 80))
+    assert deduplicator.compute_hash(darkening) == (1 << 64) - 1
+    assert deduplicator.compute_hash(darkening.transpose(Image.FLIP_LEFT_RIGHT)) == 0
+    assert deduplicator.compute_hash(darkening, hash_size=5) == (1 << 25) - 1
+
+def test_identical_frame_reuses_recorded_analysis():
+    dedup = FrameDeduplicator({})
+    image = make_image(box=(20, 20, 120, 90))
+
+    frame_hash, distance, previous = dedup.check_frame('device_1', image)
+    assert distance is None and previous is None
+    dedup.record_analysis('device_1', frame_hash, {'adult': 0.9}, filename='a.png')
+
+    _, distance, previous = dedup.check_frame('device_1', image.copy())
+    assert distance == 0
+    assert previous['analysis'] == {'adult': 0.9}
+    assert previous['filename'] == 'a.png'
+
+def test_changed_frame_is_not_reused():
+    dedup = FrameDeduplicator({})
+    frame_hash, _, _ = dedup.check_frame('device_1', make_image(box=(0, 0, 160, 240)))
+    dedup.record_analysis('device_1', frame_hash, False)
+
+    _, distance, previous = dedup.check_frame('device_1', make_image(box=(160, 0, 320, 240)))
+    assert distance > 4
+    assert previous is None
+
+def test_devices_are_tracked_separately():
+    dedup = FrameDeduplicator({})
+    image = make_image(box=(20, 20, 120, 90))
+    frame_hash, _, _ = dedup.check_frame('device_1', image)
+    dedup.record_analysis('device_1', frame_hash, False)
+
+    assert dedup.check_frame('device_2', image)[2] is None
+
+def test_content_version_reuses_hash():
+    dedup = FrameDeduplicator({})
+    first, _, _ = dedup.check_frame('device_1', make_image(box=(20, 20, 120, 90)), content_version=7)
+    # Same version: the stored hash is used even though the pixels differ
+    second, _, _ = dedup.check_frame('device_1', make_image(shade=200), content_version=7)
+    assert first == second
+
+def _finisher(dedup):
+    return SimpleNamespace(
+        deduplicator=dedup,
+        debug_mode=False,
+        logger=logging.getLogger(__name__),
+        _process_content_analysis=lambda analysis, device: False
+    )
+
+def test_failed_analysis_is_not_recorded_for_reuse():
+    dedup = FrameDeduplicator({})
+    image = make_image(box=(20, 20, 120, 90))
+    device = SimpleNamespace(name='Laptop')
+
+    frame = Frame('device_1', image, datetime.now())
+    frame.frame_hash, _, _ = dedup.check_frame('device_1', image)
+    scores = {'error': 'Rate limited', 'timeout': True}
+    ScreenshotManager._finish_frame(_finisher(dedup), frame, device, False, ScreenshotManager._is_scored(scores))
+
+    # The next identical frame must be analyzed again rather than pass as benign
+    assert dedup.check_frame('device_1', image.copy())[2] is None
+
+def test_successful_benign_analysis_is_recorded():
+    dedup = FrameDeduplicator({})
+    image = make_image(box=(20, 20, 120, 90))
+    device = SimpleNamespace(name='Laptop')
+
+    frame = Frame('device_1', image, datetime.now())
+    frame.frame_hash, _, _ = dedup.check_frame('device_1', image)
+    scores = {'adult': 0.0, 'violence': 0.1}
+    ScreenshotManager._finish_frame(_finisher(dedup), frame, device, False, ScreenshotManager._is_scored(scores))
+
+    assert dedup.check_frame('device_1', image.copy())[2]['analysis'] is False
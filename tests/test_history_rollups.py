@@ -0,0 +1,217 @@
+import os
+import json
+from datetime import datetime, timedelta
+import pytest
+from PIL import Image
+from history_rollups import ALERT_THRESHOLD, HistoryRollups
+from history_store import JSONHistoryStore, SQLiteHistoryStore
+from report_generator import period_range
+from screenshot_history import ScreenshotHistory
+
+NOW = datetime(2026, 10, 16, 14, 25)
+
+def make_entry(timestamp, device_id='device_1', adult=0.0):
+    return {
+        'timestamp': timestamp.isoformat(),
+        'filename': f"{device_id}_{timestamp.strftime('%Y%m%d_%H%M%S_%f')}.png",
+        'device_id': device_id,
+        'analysis': {'adult': adult, 'violence': 0.0}
+    }
+
+@pytest.fixture(params=['json', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'json':
+        store = JSONHistoryStore(str(tmp_path / 'history.json'))
+    else:
+        store = SQLiteHistoryStore(str(tmp_path / 'history.db'))
+    yield store
+    store.close()
+
+@pytest.fixture
+def populated(store, tmp_path):
+    rollups = HistoryRollups(str(tmp_path / 'rollups.jsonl'), store, {'save_delay': 60})
+    timestamp = NOW - timedelta(days=9)
+    index = 0
+    while timestamp <= NOW:
+        entry = make_entry(timestamp, 'device_1' if index % 3 else 'device_2', adult=0.9 if index % 5 == 0 else 0.1)
+        store.add(entry)
+        rollups.add(entry)
+        timestamp += timedelta(minutes=83)
+        index += 1
+    yield store, rollups
+    rollups.close()
+
+def brute_force(store, start, end, device_id=None):
+    entries = store.entries_between(start, end, device_id)
+    alerts = sum(1 for entry in entries if entry['analysis']['adult'] >= ALERT_THRESHOLD)
+    return len(entries), alerts
+
+@pytest.mark.parametrize('start, end', [
+    (NOW - timedelta(days=7), NOW),
+    (NOW - timedelta(days=3, minutes=17), NOW - timedelta(days=1, minutes=5)),
+    (datetime(2026, 10, 15), datetime(2026, 10, 16)),
+    (datetime(2026, 10, 12, 5, 59, 59), datetime(2026, 10, 12, 6))
+])
+@pytest.mark.parametrize('device_id', [None, 'device_1', 'device_2'])
+def test_summary_matches_the_store(populated, start, end, device_id):
+    store, rollups = populated
+    summary = rollups.summary(start, end, device_id)
+    assert (summary['count'], summary['alerts']) == brute_force(store, start, end, device_id)
+
+def test_yesterday_excludes_today(populated):
+    store, rollups = populated
+    midnight = datetime(2026, 10, 16)
+    entry = make_entry(midnight + timedelta(minutes=30), adult=0.9)
+    store.add(entry)
+    rollups.add(entry)
+
+    start, end = period_range('yesterday', NOW)
+    assert (start, end) == (midnight - timedelta(days=1), midnight - timedelta(microseconds=1))
+    assert rollups.summary(start, end)['count'] == brute_force(store, start, end)[0]
+    assert [day for day, _ in rollups.daily(start, end)] == [datetime(2026, 10, 15).date()]
+
+def test_period_starts_are_whole_hours():
+    start, end = period_range('last_7_days', NOW)
+    assert start == datetime(2026, 10, 9, 14)
+    assert end == NOW
+
+def test_hourly_buckets_match_the_store(populated):
+    store, rollups = populated
+    start, end = NOW - timedelta(hours=5, minutes=10), NOW
+    hourly = rollups.hourly(start, end)
+    assert sum(bucket['count'] for bucket in hourly.values()) == brute_force(store, start, end)[0]
+
+def test_removed_entries_are_recounted(populated):
+    store, rollups = populated
+    start, end = period_range('last_30_days', NOW)
+    before = rollups.summary(start, end)['count']
+
+    entry = store.entries_between(NOW - timedelta(days=2), NOW)[0]
+    store.remove(entry['filename'])
+    rollups.remove(entry)
+
+    assert rollups.summary(start, end)['count'] == before - 1
+    assert rollups.summary(start, end)['count'] == brute_force(store, start, end)[0]
+
+def test_rollups_survive_a_reload(populated, tmp_path):
+    store, rollups = populated
+    rollups.close()
+    start, end = period_range('last_7_days', NOW)
+    reloaded = HistoryRollups(str(tmp_path / 'rollups.jsonl'), store)
+    assert reloaded.summary(start, end) == rollups.summary(start, end)
+    assert reloaded.by_device(start, end).keys() == {'device_1', 'device_2'}
+
+def test_version_changes_with_history_and_survives_a_lost_file(populated, tmp_path):
+    store, rollups = populated
+    before = rollups.version()
+    device_before = rollups.version('device_2')
+
+    entry = make_entry(NOW + timedelta(minutes=1))
+    store.add(entry)
+    rollups.add(entry)
+    assert rollups.version() != before
+    assert rollups.version('device_1') != rollups.version('device_2')
+    assert rollups.version('device_2') == device_before
+
+    # Adding and removing an entry restores the version of the same data
+    store.remove(entry['filename'])
+    rollups.remove(entry)
+    assert rollups.version() == before
+
+    rollups.close()
+    os.remove(tmp_path / 'rollups.jsonl')
+    assert HistoryRollups(str(tmp_path / 'rollups.jsonl'), store).version() == before
+
+def test_unsaved_changes_are_detected_on_load(populated, tmp_path):
+    store, rollups = populated
+    rollups.close()
+    start, end = period_range('last_7_days', NOW)
+    saved_version = rollups.version()
+
+    # Killed after an add and a delete that were never saved: the count is unchanged
+    added = make_entry(NOW - timedelta(minutes=2), adult=0.9)
+    store.add(added)
+    store.remove(store.entries_between(NOW - timedelta(days=2), NOW)[0]['filename'])
+
+    reloaded = HistoryRollups(str(tmp_path / 'rollups.jsonl'), store)
+    assert reloaded.version() != saved_version
+    summary = reloaded.summary(start, end)
+    assert (summary['count'], summary['alerts']) == brute_force(store, start, end)
+
+def test_replacing_an_entry_changes_the_version(populated, tmp_path):
+    store, rollups = populated
+    entry = make_entry(NOW + timedelta(minutes=1), adult=0.1)
+    store.add(entry)
+    rollups.add(entry)
+    before = rollups.version()
+
+    # Same filename with new scores, as a second save in the same second does
+    replacement = dict(entry, analysis={'adult': 0.9, 'violence': 0.0})
+    store.add(replacement)
+    rollups.remove(entry)
+    rollups.add(replacement)
+
+    assert rollups.version() != before
+    start, end = NOW, NOW + timedelta(minutes=5)
+    summary = rollups.summary(start, end)
+    assert (summary['count'], summary['alerts']) == brute_force(store, start, end) == (1, 1)
+
+    rollups.close()
+    os.remove(tmp_path / 'rollups.jsonl')
+    assert HistoryRollups(str(tmp_path / 'rollups.jsonl'), store).version() == rollups.version()
+
+def test_saving_twice_in_one_second_replaces_the_entry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    history = ScreenshotHistory('sqlite')
+    try:
+        image = Image.new('RGB', (32, 32))
+        history.save_screenshot(image, {'device_id': 'd', 'device_name': 'Laptop', 'adult': 0.1}, timestamp=NOW)
+        before = history.data_version()
+        history.save_screenshot(image, {'device_id': 'd', 'device_name': 'Laptop', 'adult': 0.9}, timestamp=NOW)
+
+        assert history.data_version() != before
+        summary = history.rollups.summary(NOW, NOW)
+        assert (summary['count'], summary['alerts']) == (1, 1)
+    finally:
+        history.close()
+
+def read_records(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def test_saves_append_only_the_changed_buckets(populated, tmp_path):
+    store, rollups = populated
+    path = tmp_path / 'rollups.jsonl'
+    rollups._save()
+    saved = read_records(path)
+    assert [record['op'] for record in saved] == ['snapshot', 'update']
+
+    entry = make_entry(NOW + timedelta(minutes=1), adult=0.9)
+    store.add(entry)
+    rollups.add(entry)
+    rollups._save()
+
+    records = read_records(path)
+    assert records[:2] == saved and records[2]['op'] == 'update'
+    assert records[2]['hours'] == {'device_1': {'2026-10-16T14': rollups._hours['device_1']['2026-10-16T14']}}
+    assert list(records[2]['days']['device_1']) == ['2026-10-16']
+
+    start, end = period_range('last_7_days', NOW + timedelta(minutes=5))
+    reloaded = HistoryRollups(str(path), store)
+    assert reloaded.summary(start, end) == rollups.summary(start, end)
+    assert reloaded.version() == rollups.version()
+
+def test_updates_are_compacted_into_a_snapshot(store, tmp_path):
+    path = tmp_path / 'rollups.jsonl'
+    rollups = HistoryRollups(str(path), store, {'save_delay': 60, 'compact_records': 3})
+    for minute in range(6):
+        entry = make_entry(NOW + timedelta(minutes=minute))
+        store.add(entry)
+        rollups.add(entry)
+        rollups._save()
+
+    assert len(read_records(path)) <= 4
+    assert read_records(path)[0]['op'] == 'snapshot'
+    reloaded = HistoryRollups(str(path), store)
+    assert reloaded.summary(NOW, NOW + timedelta(hours=1))['count'] == 6
+    assert reloaded.version() == rollups.version()
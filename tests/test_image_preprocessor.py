@@ -0,0 +1,21 @@
+from PIL import Image
+from image_preprocessor import ImagePreprocessor
+
+def test_small_changes_stay_high_detail_by_default():
+    settings = ImagePreprocessor().resolve(change_score=0.01)
+    assert settings['detail'] == 'high'
+    assert settings['max_long_edge'] == 1568
+
+def test_auto_detail_is_opt_in():
+    preprocessor = ImagePreprocessor({'detail': 'auto'})
+    assert preprocessor.resolve(change_score=0.01)['detail'] == 'low'
+    assert preprocessor.resolve(change_score=0.01)['max_long_edge'] == 512
+    assert preprocessor.resolve(change_score=0.5)['detail'] == 'high'
+    assert preprocessor.resolve()['detail'] == 'high'
+
+def test_encode_downscales_to_the_long_edge():
+    preprocessor = ImagePreprocessor()
+    prepared = preprocessor.encode(Image.new('RGBA', (3136, 1000)), preprocessor.resolve(), 'device_1')
+    assert prepared['size'] == (1568, 500)
+    assert prepared['mime_type'] == 'image/jpeg'
+    assert preprocessor.get_stats('device_1')['frames'] == 1
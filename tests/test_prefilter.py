@@ -0,0 +1,52 @@
+import pytest
+from Xlib import display
+import prefilter
+from prefilter import DEFAULT_PREFILTER_SETTINGS, SAFE, WindowTitleStage
+
+@pytest.fixture
+def stage():
+    return WindowTitleStage(DEFAULT_PREFILTER_SETTINGS)
+
+@pytest.mark.parametrize('title', [
+    'Book1 - Microsoft Excel',
+    'main.py - project - Visual Studio Code',
+    'Terminal',
+    'notes.odt — LibreOffice Writer'
+])
+def test_safe_application_titles(stage, title):
+    assert stage.evaluate(None, {'window_title': title})[0] == SAFE
+
+@pytest.mark.parametrize('title', [
+    'Microsoft Excel tips - Google Chrome',
+    'Learn the Terminal in 5 minutes - YouTube - Mozilla Firefox',
+    'Terminal velocity',
+    'MyMicrosoft Excel'
+])
+def test_titles_that_only_mention_safe_applications(stage, title):
+    assert stage.evaluate(None, {'window_title': title}) == (None, None)
+
+def test_known_process_decides_over_the_title(stage):
+    assert stage.evaluate(None, {'window_title': 'Book1 - Microsoft Excel', 'process_name': 'chrome.exe'}) == (None, None)
+    assert stage.evaluate(None, {'window_title': 'anything', 'process_name': 'EXCEL.EXE'})[0] == SAFE
+
+def test_display_connection_is_reused_per_thread(monkeypatch):
+    opened = []
+
+    class FakeDisplay:
+        def __init__(self):
+            opened.append(self)
+            self.closed = False
+
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(display, 'Display', FakeDisplay)
+    prefilter.close_window_connection()
+
+    first = prefilter._x11_display()
+    assert prefilter._x11_display() is first
+    prefilter.close_window_connection()
+    assert first.closed
+    assert prefilter._x11_display() is not first
+    assert len(opened) == 2
+    prefilter.close_window_connection()
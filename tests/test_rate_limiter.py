@@ -0,0 +1,48 @@
+import threading
+import time
+from rate_limiter import RateLimiter, estimate_tokens
+
+def limiter(rpm, **settings):
+    return RateLimiter(dict({'enabled': True, 'limits': {'openai': {'rpm': rpm, 'tpm': 1000000}}}, **settings))
+
+def test_request_over_budget_waits_instead_of_failing():
+    rate_limiter = limiter(rpm=120)
+    assert rate_limiter.acquire('openai', 1000, ['device_1']) == 'granted'
+    assert rate_limiter.acquire('openai', 1000, ['device_1']) == 'granted'
+    assert rate_limiter.acquire('openai', 1000, ['device_2']) == 'granted'
+    assert rate_limiter.get_stats()['openai']['timed_out'] == 0
+
+def test_max_wait_is_opt_in():
+    rate_limiter = limiter(rpm=1, max_wait=0.1)
+    assert rate_limiter.acquire('openai', 1000, ['device_1']) == 'granted'
+    assert rate_limiter.acquire('openai', 1000, ['device_1']) == 'timeout'
+    assert rate_limiter.run('openai', 1000, ['device_1'], lambda prepared: {}, {}) == {
+        'error': 'Rate limit budget exhausted'
+    }
+
+def test_newer_frame_from_a_device_supersedes_the_waiting_one():
+    rate_limiter = limiter(rpm=1)
+    assert rate_limiter.acquire('openai', 1000, ['device_1']) == 'granted'
+
+    results = []
+    waiting = threading.Thread(target=lambda: results.append(rate_limiter.acquire('openai', 1000, ['device_1'])))
+    waiting.start()
+    time.sleep(0.1)
+    newer = threading.Thread(target=rate_limiter.acquire, args=('openai', 1000, ['device_1']), daemon=True)
+    newer.start()
+    waiting.join(timeout=5)
+
+    assert results == ['superseded']
+    stats = rate_limiter.get_stats()['openai']
+    assert stats['coalesced'] == 1
+    assert stats['queue_depth'] == 1
+
+def test_alerting_device_goes_first():
+    rate_limiter = limiter(rpm=1)
+    rate_limiter.note_alert('device_2')
+    assert rate_limiter.priority('device_2') < rate_limiter.priority('device_1')
+
+def test_token_estimate_depends_on_detail():
+    low = estimate_tokens('openai', {'detail': 'low'})
+    high = estimate_tokens('openai', {'detail': 'high', 'size': (1568, 882)})
+    assert low < high
@@ -0,0 +1,63 @@
+import os
+from datetime import datetime, timedelta
+import pytest
+from PIL import Image
+from device_manager import DeviceManager
+from report_charts import ChartCache
+from report_generator import ReportGenerator, period_range
+from screenshot_history import ScreenshotHistory
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    # History, devices and reports all live under data/ in the working directory
+    monkeypatch.chdir(tmp_path)
+    history = ScreenshotHistory('sqlite')
+    devices = DeviceManager()
+    device = devices.add_device('Laptop')
+    now = datetime.now()
+    for index in range(12):
+        history.save_screenshot(
+            Image.new('RGB', (160, 120), (index * 20, 40, 80)),
+            {
+                'device_id': device.device_id,
+                'device_name': device.name,
+                'adult': 0.9 if index % 3 == 0 else 0.1,
+                'violence': 0.0,
+                'program_name': 'chrome'
+            },
+            timestamp=now - timedelta(hours=index * 5, seconds=index)
+        )
+    yield history, devices
+    history.close()
+
+def test_report_has_no_alert_export_by_default(history):
+    screenshot_history, devices = history
+    path = ReportGenerator(screenshot_history, devices).generate_report(*period_range('last_7_days'))
+
+    assert os.path.exists(path)
+    base = os.path.splitext(path)[0]
+    assert not os.path.exists(f"{base}_alerts.csv")
+
+def test_alert_export_is_opt_in(history, make_config):
+    screenshot_history, devices = history
+    config = make_config({'report_settings': {'export_details': 'csv'}})
+    path = ReportGenerator(screenshot_history, devices, config).generate_report(*period_range('last_7_days'))
+
+    with open(f"{os.path.splitext(path)[0]}_alerts.csv", encoding='utf-8') as f:
+        rows = f.read().splitlines()
+    assert rows[0].startswith('timestamp,device_id,device_name')
+    assert len(rows) == 1 + 4
+
+def test_empty_period_builds_no_report(history):
+    screenshot_history, devices = history
+    start = datetime.now() + timedelta(days=1)
+    assert ReportGenerator(screenshot_history, devices).generate_report(start, start + timedelta(days=1)) is None
+
+def test_chart_cache_keys_on_the_exact_range():
+    start = datetime(2026, 10, 1, 9, 5)
+    end = datetime(2026, 10, 8, 9, 5)
+    key = ChartCache.make_key('alerts', start, end, None, 'v1')
+
+    assert key == ChartCache.make_key('alerts', start, end, None, 'v1')
+    assert key != ChartCache.make_key('alerts', start.replace(minute=40), end, None, 'v1')
+    assert key != ChartCache.make_key('alerts', start, end.replace(minute=40), None, 'v1')
@@ -0,0 +1,59 @@
+import threading
+from report_jobs import ReportJobRunner
+from report_scheduler import ReportScheduler
+
+class StubRollups:
+    def version(self, device_id=None):
+        return 'v1'
+
+    def summary(self, start_date, end_date, device_id=None):
+        return {'count': 1}
+
+class StubGenerator:
+    def __init__(self, reports_dir):
+        self.reports_dir = str(reports_dir)
+        self.rollups = StubRollups()
+        self.built = []
+        self._lock = threading.Lock()
+
+    def generate_report(self, start_date, end_date, device_id=None, progress=None):
+        with self._lock:
+            path = f"{self.reports_dir}/report_{len(self.built)}.pdf"
+            self.built.append((start_date, device_id))
+        with open(path, 'wb') as f:
+            f.write(b'%PDF')
+        return path
+
+class StubDevice:
+    def __init__(self, device_id):
+        self.device_id = device_id
+
+class StubDevices:
+    def get_all_devices(self):
+        return [StubDevice('a'), StubDevice('b'), StubDevice('c')]
+
+class IdleRoot:
+    """A Tk root whose main loop never runs, so queued job events are never delivered"""
+
+    def after(self, interval, callback):
+        pass
+
+def test_run_pending_builds_every_target_without_a_tk_pump(tmp_path):
+    generator = StubGenerator(tmp_path)
+    runner = ReportJobRunner(generator, root=IdleRoot())
+    scheduler = ReportScheduler(generator, runner, StubDevices(), {'idle_seconds': 0})
+    try:
+        targets = scheduler.targets()
+        assert len(targets) == 16
+
+        scheduler.run_pending()
+
+        assert len(generator.built) == len(targets)
+        assert all(scheduler.lookup(period, device_id) for period, device_id in targets)
+        assert not runner.active_jobs()
+
+        # Everything is current, so a second pass builds nothing
+        scheduler.run_pending()
+        assert len(generator.built) == len(targets)
+    finally:
+        runner.shutdown()
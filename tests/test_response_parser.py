@@ -0,0 +1,50 @@
+import pytest
+from response_parser import ResponseParseError, clamp_score, extract_json, parse_batch, parse_scores
+
+def test_plain_json():
+    scores = parse_scores('{"violence": 0.2, "adult": 0.9, "hate": 0, "drugs": 0, "gambling": 0, "program_name": "chrome"}')
+    assert scores['adult'] == 0.9
+    assert scores['program_name'] == 'chrome'
+    assert 'partial' not in scores
+
+def test_fenced_json_with_python_quotes():
+    content = "Here you go:\n```json\n{'violence': 0.1, 'adult': 0.0}\n```"
+    assert parse_scores(content)['violence'] == 0.1
+
+def test_json_in_prose():
+    assert extract_json('The scores are {"hate": 0.3} as requested.') == {'hate': 0.3}
+
+def test_scores_are_clamped():
+    scores = parse_scores('{"violence": 3, "adult": -1, "hate": "40%"}')
+    assert scores['violence'] == 1.0
+    assert scores['adult'] == 0.0
+    assert scores['hate'] == pytest.approx(0.4)
+
+def test_truncated_json_is_salvaged_as_partial():
+    scores = parse_scores('{"violence": 0.1, "adult": 0.8, "hate": 0.0, "dru')
+    assert scores['partial'] is True
+    assert scores['adult'] == 0.8
+
+def test_salvaged_percentages_are_scaled():
+    scores = parse_scores('Scores - adult: 45%, violence: 10%')
+    assert scores['adult'] == pytest.approx(0.45)
+    assert scores['violence'] == pytest.approx(0.1)
+    assert scores['partial'] is True
+
+def test_explicit_adds_to_adult():
+    assert parse_scores('{"adult": 0.5, "explicit": 0.3}')['adult'] == pytest.approx(0.8)
+
+def test_no_scores_raises():
+    with pytest.raises(ResponseParseError):
+        parse_scores("I can't help with that.")
+
+def test_clamp_rejects_non_numbers():
+    assert clamp_score(True) is None
+    assert clamp_score('n/a') is None
+    assert clamp_score(float('nan')) is None
+
+def test_batch_must_match_frame_count():
+    content = '{"results": [{"adult": 0.1}, {"adult": 0.2}]}'
+    assert [scores['adult'] for scores in parse_batch(content, 2)] == [0.1, 0.2]
+    with pytest.raises(ResponseParseError):
+        parse_batch(content, 3)
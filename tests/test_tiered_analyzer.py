@@ -0,0 +1,41 @@
+from PIL import Image
+from tiered_analyzer import TieredAnalyzer
+
+class FakeHistory:
+    def __init__(self, entries):
+        self.entries = entries
+
+    def get_history(self, limit=None, offset=0, device_id=None):
+        return self.entries[:limit]
+
+    def get_screenshot(self, filename):
+        return Image.new('RGB', (64, 64), (20, 40, 200))
+
+def entry(filename, **analysis):
+    return {'filename': filename, 'timestamp': '2026-10-16T10:00:00', 'analysis': analysis}
+
+def test_benchmark_skips_errors_and_locally_cleared_frames():
+    tiered = TieredAnalyzer(None, {'enabled': True, 'stages': ['window_title']})
+    history = FakeHistory([
+        entry('alert.png', adult=0.9, window_title='chat - Google Chrome'),
+        entry('cleared.png', adult=0.9, window_title='main.py - Visual Studio Code'),
+        entry('failed.png', error='Request timed out', window_title='main.py - Visual Studio Code'),
+        entry('local.png', tier='local', window_title='main.py - Visual Studio Code')
+    ])
+
+    results = tiered.benchmark(history)
+
+    assert results['frames'] == 2
+    assert results['escalated'] == 1
+    assert results['missed_alerts'] == ['cleared.png']
+    assert results['recall'] == 0.5
+    assert tiered.get_stats()['tiers'] == {'local': 0, 'cloud': 0}
+
+def test_prefilter_clears_safe_window_locally():
+    tiered = TieredAnalyzer(None, {'enabled': True, 'stages': ['window_title']})
+    image = Image.new('RGB', (64, 64))
+
+    scores = tiered.prefilter(image, {'window_title': 'main.py - Visual Studio Code'})
+    assert scores['tier'] == 'local'
+    assert scores['adult'] == 0.0
+    assert tiered.prefilter(image, {'window_title': 'chat - Google Chrome'}) is None
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+import pytest
+from twisted.internet import reactor
+from vnc_device_monitor import VNCDeviceMonitor
+
+class FakeProtocol:
+    def __init__(self):
+        self.requests = []
+        self.commits = 0
+
+    def updateRectangle(self, x, y, width, height, data):
+        pass
+
+    def commitUpdate(self, rectangles=None):
+        self.commits += 1
+
+    def framebufferUpdateRequest(self, x=0, y=0, width=None, height=None, incremental=0):
+        self.requests.append(incremental)
+
+@pytest.fixture
+def session(monkeypatch):
+    # Run reactor calls inline; the tests never start the reactor
+    monkeypatch.setattr(reactor, 'callLater', lambda delay, fn, *args, **kwargs: fn(*args, **kwargs), raising=False)
+    monkeypatch.setattr(reactor, 'callFromThread', lambda fn, *args, **kwargs: fn(*args, **kwargs), raising=False)
+    protocol = FakeProtocol()
+    monitor = VNCDeviceMonitor('device_1', {'vnc_host': 'host', 'vnc_password': 'secret'})
+    monitor.client = SimpleNamespace(protocol=protocol)
+    monitor._track_updates(protocol)
+    return monitor, protocol
+
+def test_each_committed_update_requests_the_next(session):
+    monitor, protocol = session
+    monitor._request_update(protocol)
+    assert protocol.requests == [1]
+
+    for _ in range(3):
+        protocol.updateRectangle(0, 0, 10, 10, b'')
+        protocol.commitUpdate()
+
+    assert protocol.commits == 3
+    assert protocol.requests == [1, 1, 1, 1]
+    assert monitor._dirty_area == 300
+
+def test_closed_session_stops_requesting(session):
+    monitor, protocol = session
+    monitor._request_update(protocol)
+    monitor.client = None
+    protocol.commitUpdate()
+    assert protocol.requests == [1]
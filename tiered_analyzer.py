@@ -0,0 +1,144 @@
+import threading
+import time
+from utils.logger import get_logger
+from prefilter import DEFAULT_PREFILTER_SETTINGS, SAFE, RISKY, build_stages
+from history_store import SCORE_CATEGORIES
+
+class TieredAnalyzer:
+    """Local pre-filter tier in front of the cloud ContentAnalyzer
+
+    Frames first go through the configured CPU-only prefilter stages. A
+    frame is resolved locally as benign when a stage votes safe and none
+    votes risky; everything else escalates to the cloud provider. Stage
+    verdicts and per-tier counts are recorded for get_stats().
+    """
+
+    def __init__(self, content_analyzer, settings=None):
+        self.content_analyzer = content_analyzer
+        self.logger = get_logger(__name__)
+        self.settings = dict(DEFAULT_PREFILTER_SETTINGS)
+        self.settings.update(settings or {})
+        self.stages = build_stages(self.settings) if self.settings.get('enabled') else []
+        self._lock = threading.Lock()
+        self._tiers = {'local': 0, 'cloud': 0}
+        self._stage_stats = {}
+
+    @property
+    def enabled(self):
+        return bool(self.stages)
+
+    def _run_stages(self, image, context, record=True):
+        """Run every stage, returning (decision, reasons, verdicts)"""
+        verdicts = {}
+        reasons = []
+        for stage in self.stages:
+            started = time.perf_counter()
+            try:
+                verdict, detail = stage.evaluate(image, context)
+            except Exception as e:
+                self.logger.warning(f"Prefilter stage {stage.name} failed: {str(e)}")
+                verdict, detail = None, None
+            elapsed = time.perf_counter() - started
+
+            verdicts[stage.name] = verdict
+            if detail:
+                reasons.append(f"{stage.name}: {detail}")
+            if not record:
+                continue
+            with self._lock:
+                stats = self._stage_stats.setdefault(stage.name, {
+                    'evaluated': 0, 'safe': 0, 'risky': 0, 'abstain': 0, 'total_time': 0.0
+                })
+                stats['evaluated'] += 1
+                stats[verdict or 'abstain'] += 1
+                stats['total_time'] += elapsed
+
+        if RISKY in verdicts.values():
+            decision = RISKY
+        elif SAFE in verdicts.values():
+            decision = SAFE
+        else:
+            decision = None
+        return decision, reasons, verdicts
+
+    def prefilter(self, image, context=None):
+        """Get local benign scores for a frame the cheap tier clears, else None"""
+        if not self.stages:
+            return None
+
+        context = context or {}
+        decision, reasons, _ = self._run_stages(image, context)
+        with self._lock:
+            self._tiers['local' if decision == SAFE else 'cloud'] += 1
+
+        if decision != SAFE:
+            return None
+
+        scores = {category: 0.0 for category in SCORE_CATEGORIES}
+        scores['program_name'] = context.get('window_title')
+        scores['tier'] = 'local'
+        scores['prefilter'] = '; '.join(reasons)
+        return scores
+
+    def analyze_image(self, image, device_id=None, change_score=None, options=None, context=None):
+        """Analyze an image, only calling the cloud provider when the local tier is unsure"""
+        scores = self.prefilter(image, context)
+        if scores is not None:
+            return self.content_analyzer.check_thresholds(scores)
+        return self.content_analyzer.analyze_image(image, device_id, change_score, options)
+
+    def benchmark(self, history_manager, limit=500):
+        """Replay the local tier over stored screenshots
+
+        Stored history holds frames the cloud provider flagged, so every
+        frame the local tier would have cleared is a missed alert. Stage
+        counters are not affected.
+        """
+        results = {'frames': 0, 'escalated': 0, 'cleared': 0, 'missed_alerts': [], 'stages': {}, 'total_time': 0.0}
+
+        for entry in history_manager.get_history(limit=limit):
+            analysis = entry.get('analysis') or {}
+            if 'error' in analysis or analysis.get('tier') == 'local':
+                continue
+            image = history_manager.get_screenshot(entry['filename'])
+            if image is None:
+                continue
+
+            started = time.perf_counter()
+            decision, _, verdicts = self._run_stages(
+                image,
+                {'window_title': analysis.get('window_title'), 'process_name': analysis.get('window_process')},
+                record=False
+            )
+            results['total_time'] += time.perf_counter() - started
+
+            results['frames'] += 1
+            for name, verdict in verdicts.items():
+                counts = results['stages'].setdefault(name, {'safe': 0, 'risky': 0, 'abstain': 0})
+                counts[verdict or 'abstain'] += 1
+
+            if decision == SAFE:
+                results['cleared'] += 1
+                results['missed_alerts'].append(entry['filename'])
+            else:
+                results['escalated'] += 1
+
+        frames = results['frames']
+        results['recall'] = results['escalated'] / frames if frames else 1.0
+        results['avg_time'] = results['total_time'] / frames if frames else 0.0
+        return results
+
+    def get_stats(self):
+        """Get per-tier counts, the local hit rate and per-stage verdict counters"""
+        with self._lock:
+            tiers = dict(self._tiers)
+            stages = {name: dict(stats) for name, stats in self._stage_stats.items()}
+
+        total = tiers['local'] + tiers['cloud']
+        for stats in stages.values():
+            stats['avg_time'] = stats['total_time'] / stats['evaluated'] if stats['evaluated'] else 0.0
+        return {
+            'tiers': tiers,
+            'local_hit_rate': tiers['local'] / total if total else 0.0,
+            'stages': stages
+        }
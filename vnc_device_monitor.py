@@ -1,58 +1,372 @@
-from screenshot_manager import ScreenshotManager
-from PIL import Image
-import io
+import itertools
+import threading
+import time
 from utils.logger import get_logger
-from vncdotool import api
+
+DEFAULT_VNC_SETTINGS = {
+    'max_sessions': 8,
+    'session_wait': 10,
+    'request_timeout': 15,
+    'update_interval': 0.1,
+    'health_check_interval': 30,
+    'idle_timeout': 300,
+    'reconnect_base_delay': 1.0,
+    'reconnect_max_delay': 60.0
+}
+
+# Framebuffer versions are unique across sessions and reconnects
+_framebuffer_versions = itertools.count(1)
 
 class VNCDeviceMonitor:
-    def __init__(self, device_id, device_config):
+    """A persistent VNC session to one host and port
+
+    vncdotool's api client is a blocking proxy onto a shared Twisted reactor
+    thread, so every method here blocks the calling thread. Callers
+    serialize access through the session lock.
+    """
+
+    def __init__(self, device_id, device_config, settings=None):
         self.device_id = device_id
         self.config = device_config
         self.logger = get_logger(__name__)
+        self.settings = dict(DEFAULT_VNC_SETTINGS)
+        self.settings.update(settings or {})
         self.client = None
+        self.lock = threading.Lock()
+        self.holds_slot = False
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.last_used = time.monotonic()
+        self._reset_framebuffer()
 
-    async def connect(self):
-        """Connect to VNC server"""
-        try:
-            host = self.config.get('vnc_host')
-            port = self.config.get('vnc_port', 5900)
-            password = self.config.get('vnc_password')
+    def _reset_framebuffer(self):
+        self._fb_lock = threading.Lock()
+        self._dirty_area = 0
+        self._update_pending = False
+        self._frame = None
+        self.version = None
 
-            if not (host and password):
-                raise ValueError("VNC host and password are required")
+    @property
+    def host(self):
+        return self.config.get('vnc_host')
 
-            connection_string = f"vnc://{host}:{port}"
-            self.client = await api.connect(connection_string, password=password)
-            return True
-        except Exception as e:
-            self.logger.error(f"VNC connection failed: {str(e)}")
+    @property
+    def port(self):
+        return int(self.config.get('vnc_port', 5900))
+
+    @property
+    def connected(self):
+        """Whether the session is open and its transport still up"""
+        if not self.client:
             return False
+        protocol = getattr(self.client, 'protocol', None)
+        if protocol is None:
+            # Handshake still in progress
+            return True
+        transport = getattr(protocol, 'transport', None)
+        return bool(transport and getattr(transport, 'connected', False))
 
-    async def capture_screenshot(self):
-        """Capture screenshot from VNC connection"""
-        try:
-            if not self.client:
-                if not await self.connect():
-                    return None
+    def connect(self):
+        """Connect to VNC server"""
+        from vncdotool import api
 
-            # Capture screenshot
-            png_data = await self.client.capture()
-            
-            # Convert to PIL Image
-            image = Image.open(io.BytesIO(png_data))
-            return image
+        password = self.config.get('vnc_password')
+        if not (self.host and password):
+            raise ValueError("VNC host and password are required")
 
-        except Exception as e:
-            self.logger.error(f"VNC screenshot failed: {str(e)}")
-            await self.disconnect()
-            return None
+        self.client = api.connect(
+            f"{self.host}::{self.port}",
+            password=password,
+            timeout=self.settings['request_timeout']
+        )
+        self.logger.info(f"Opened VNC session to {self.host}:{self.port}")
+
+    def _track_updates(self, protocol):
+        """Wrap the protocol's rectangle handlers to accumulate the dirty area
+
+        The handlers run on the reactor thread and draw into protocol.screen,
+        so they hold the framebuffer lock while the capture side copies it.
+        """
+        def tracked(handler, rect_args):
+            def wrapper(*args, **kwargs):
+                with self._fb_lock:
+                    width, height = args[rect_args + 2], args[rect_args + 3]
+                    self._dirty_area += width * height
+                    return handler(*args, **kwargs)
+            return wrapper
 
-    async def disconnect(self):
+        def committed(handler):
+            def wrapper(*args, **kwargs):
+                self._update_pending = False
+                try:
+                    return handler(*args, **kwargs)
+                finally:
+                    # vncdotool never asks again on its own, so keep updates flowing
+                    self._schedule_update(protocol)
+            return wrapper
+
+        # copyRectangle(srcx, srcy, x, y, width, height), others start at x, y
+        for name, rect_args in (('updateRectangle', 0), ('fillRectangle', 0), ('copyRectangle', 2)):
+            handler = getattr(protocol, name, None)
+            if handler is not None:
+                setattr(protocol, name, tracked(handler, rect_args))
+        protocol.commitUpdate = committed(protocol.commitUpdate)
+
+    def _request_update(self, protocol):
+        """Keep one incremental update request outstanding
+
+        Servers may hold an incremental request until the screen changes, so
+        captures never wait on it; they read whatever has been applied.
+        """
+        if self._update_pending:
+            return
+        from twisted.internet import reactor
+        self._update_pending = True
+        reactor.callFromThread(protocol.framebufferUpdateRequest, incremental=1)
+
+    def _schedule_update(self, protocol):
+        """Ask for the next incremental update once an update is committed (reactor thread)
+
+        The request goes out update_interval seconds later so servers that
+        answer at once with empty updates do not spin the reactor.
+        """
+        from twisted.internet import reactor
+
+        def request():
+            # The session may have been closed or reconnected meanwhile
+            if self._update_pending or self.client is None or getattr(self.client, 'protocol', None) is not protocol:
+                return
+            self._update_pending = True
+            protocol.framebufferUpdateRequest(incremental=1)
+
+        reactor.callLater(float(self.settings['update_interval']), request)
+
+    def capture_screenshot(self):
+        """Capture from the local framebuffer, returning (image, dirty_ratio)
+
+        The first capture of a session requests the full framebuffer. After
+        that an incremental update is requested again each time one is
+        applied, so later captures return the framebuffer as of at most
+        about update_interval ago, with dirty_ratio the fraction of the
+        screen updated since the previous capture (capped at 1.0).
+        """
+        if not self.client:
+            self.connect()
+
+        if self._frame is None:
+            self.client.refreshScreen(incremental=False)
+            protocol = self.client.protocol
+            if protocol.screen is None:
+                raise RuntimeError("VNC server sent no framebuffer")
+            self._track_updates(protocol)
+            with self._fb_lock:
+                self._dirty_area = 0
+                self._frame = protocol.screen.convert('RGB')
+            dirty_ratio = 1.0
+            self.version = next(_framebuffer_versions)
+        else:
+            if not self.connected:
+                raise RuntimeError("VNC connection lost")
+            protocol = self.client.protocol
+            with self._fb_lock:
+                dirty_area = self._dirty_area
+                self._dirty_area = 0
+                if dirty_area:
+                    self._frame = protocol.screen.convert('RGB')
+            width, height = self._frame.size
+            dirty_ratio = min(dirty_area / float(width * height), 1.0)
+            if dirty_area:
+                self.version = next(_framebuffer_versions)
+
+        self._request_update(protocol)
+        return self._frame, dirty_ratio
+
+    def disconnect(self):
         """Disconnect from VNC server"""
         if self.client:
             try:
-                await self.client.disconnect()
+                self.client.disconnect()
             except Exception as e:
                 self.logger.error(f"VNC disconnect error: {str(e)}")
             finally:
                 self.client = None
+                self._reset_framebuffer()
+
+    def record_success(self):
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.last_used = time.monotonic()
+
+    def record_failure(self):
+        """Back off exponentially before the next reconnect attempt"""
+        self.failures += 1
+        delay = min(
+            self.settings['reconnect_base_delay'] * (2 ** (self.failures - 1)),
+            self.settings['reconnect_max_delay']
+        )
+        self.next_attempt = time.monotonic() + delay
+        return delay
+
+class VNCConnectionPool:
+    """Shared VNC sessions keyed by (host, port)
+
+    Sessions stay open between frames so each capture skips the RFB
+    handshake. At most max_sessions are open at once; a background thread
+    closes sessions that dropped or sat idle longer than idle_timeout.
+    Failed sessions are reopened with exponential backoff.
+    """
+
+    def __init__(self, settings=None):
+        self.logger = get_logger(__name__)
+        self.settings = dict(DEFAULT_VNC_SETTINGS)
+        self.settings.update(settings or {})
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._slots = threading.BoundedSemaphore(max(1, int(self.settings['max_sessions'])))
+        self._stop = threading.Event()
+        self._health_thread = None
+        self._reactor_used = False
+
+    @staticmethod
+    def session_key(device_config):
+        return (device_config.get('vnc_host'), int(device_config.get('vnc_port', 5900)))
+
+    def _get_session(self, device_id, device_config):
+        key = self.session_key(device_config)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = VNCDeviceMonitor(device_id, dict(device_config), self.settings)
+                self._sessions[key] = session
+
+            if not self._health_thread or not self._health_thread.is_alive():
+                self._stop.clear()
+                self._health_thread = threading.Thread(
+                    target=self._health_loop, name="vnc-health", daemon=True
+                )
+                self._health_thread.start()
+        return session
+
+    def _open(self, session):
+        """Open a session, honouring the reconnect backoff and session limit"""
+        remaining = session.next_attempt - time.monotonic()
+        if remaining > 0:
+            raise RuntimeError(
+                f"VNC {session.host}:{session.port} unavailable, retrying in {remaining:.1f}s"
+            )
+
+        if not self._slots.acquire(timeout=self.settings['session_wait']):
+            raise RuntimeError(f"VNC session limit ({self.settings['max_sessions']}) reached")
+        session.holds_slot = True
+
+        try:
+            session.connect()
+            self._reactor_used = True
+        except Exception:
+            self._close(session)
+            raise
+
+    def _close(self, session):
+        """Close a session and give back its slot (caller holds the session lock)"""
+        session.disconnect()
+        if session.holds_slot:
+            session.holds_slot = False
+            self._slots.release()
+
+    def capture(self, device_id, device_config):
+        """Capture a device's remote screen over its pooled session
+
+        Returns (image, dirty_ratio, version). version changes only when the
+        framebuffer content changes, so equal versions mean identical images.
+        """
+        session = self._get_session(device_id, device_config)
+        with session.lock:
+            if device_config.get('vnc_password') != session.config.get('vnc_password'):
+                self._close(session)
+                session.config = dict(device_config)
+
+            try:
+                if not session.client:
+                    self._open(session)
+                image, dirty_ratio = session.capture_screenshot()
+            except Exception as e:
+                if session.client or session.holds_slot:
+                    self._close(session)
+                if session.next_attempt <= time.monotonic():
+                    delay = session.record_failure()
+                    self.logger.warning(
+                        f"VNC capture from {session.host}:{session.port} failed, "
+                        f"reconnecting in {delay:.1f}s: {str(e)}"
+                    )
+                raise
+
+            session.record_success()
+            return image, dirty_ratio, session.version
+
+    def test_connection(self, device_id, device_config):
+        """Check a device can be captured, returning (success, error)"""
+        try:
+            self.capture(device_id, device_config)
+            return True, None
+        except Exception as e:
+            return False, f"VNC screenshot failed: {str(e)}"
+
+    def _health_loop(self):
+        while not self._stop.wait(self.settings['health_check_interval']):
+            with self._lock:
+                sessions = list(self._sessions.values())
+
+            now = time.monotonic()
+            for session in sessions:
+                # Skip sessions busy capturing
+                if not session.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if not session.client:
+                        continue
+                    if not session.connected:
+                        self.logger.warning(f"VNC session to {session.host}:{session.port} dropped")
+                        self._close(session)
+                        session.record_failure()
+                    elif now - session.last_used > self.settings['idle_timeout']:
+                        self.logger.info(f"Closing idle VNC session to {session.host}:{session.port}")
+                        self._close(session)
+                finally:
+                    session.lock.release()
+
+    def close_all(self):
+        """Close every session and stop the health checks"""
+        self._stop.set()
+        if self._health_thread:
+            self._health_thread.join(timeout=1.0)
+            self._health_thread = None
+
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            with session.lock:
+                self._close(session)
+
+        if self._reactor_used:
+            try:
+                from vncdotool import api
+                api.shutdown()
+            except Exception as e:
+                self.logger.debug(f"Error stopping VNC reactor: {str(e)}")
+            self._reactor_used = False
+
+    def get_stats(self):
+        """Get per-session connection state and failure counters"""
+        now = time.monotonic()
+        with self._lock:
+            sessions = dict(self._sessions)
+        return {
+            f"{host}:{port}": {
+                'connected': session.connected,
+                'failures': session.failures,
+                'idle': now - session.last_used,
+                'retry_in': max(0.0, session.next_attempt - now)
+            }
+            for (host, port), session in sessions.items()
+        }